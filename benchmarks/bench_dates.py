@@ -0,0 +1,81 @@
+"""日期转换的微基准：utils.to_date_key / timestamp_to_date_key 对比 pendulum 的解析、换算和格式化
+
+输入包括豆瓣的create_time（不带时区的上海时间）、Notion带时区的date.start和Unix时间戳，
+先确认两种实现结果一致，再分别计时。codec分首次（清空缓存）和重复（命中缓存）两轮。
+
+用法: python benchmarks/bench_dates.py [条数]
+"""
+import os
+import random
+import sys
+import time
+
+import pendulum
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from douban2notion.utils import timestamp_to_date_key, to_date_key, tz  # noqa: E402
+
+# Notion date.start中的时区后缀 → 偏移秒数
+OFFSETS = {"+08:00": 8 * 3600, "Z": 0, "-05:00": -5 * 3600, "+09:30": 9 * 3600 + 1800}
+
+
+def synthetic_dates(count, seed=0):
+    """生成count个 (类型, 值)，类型为create_time、notion或timestamp"""
+    rng = random.Random(seed)
+    dates = []
+    for _ in range(count):
+        day = pendulum.datetime(2012, 1, 1, tz=tz).add(days=rng.randrange(4000), seconds=rng.randrange(86400))
+        kind = rng.choice(["create_time", "notion", "timestamp"])
+        if kind == "create_time":
+            dates.append((kind, day.format("YYYY-MM-DD HH:mm:ss")))
+        elif kind == "notion":
+            suffix = rng.choice(list(OFFSETS))
+            value = day.in_timezone(pendulum.fixed_timezone(OFFSETS[suffix])).format("YYYY-MM-DDTHH:mm:ss.SSS")
+            dates.append((kind, value + suffix))
+        else:
+            dates.append((kind, day.int_timestamp))
+    return dates
+
+
+def pendulum_date(kind, value):
+    """旧实现：解析为带时区的时间，换算到上海后再格式化"""
+    if kind == "create_time":
+        return pendulum.parse(value, tz=tz).in_timezone(tz).format("YYYY-MM-DD")
+    if kind == "notion":
+        return pendulum.parse(value).in_timezone(tz).format("YYYY-MM-DD")
+    return pendulum.from_timestamp(value, tz=tz).format("YYYY-MM-DD")
+
+
+def codec_date(kind, value):
+    if kind == "timestamp":
+        return timestamp_to_date_key(value)
+    return to_date_key(value)
+
+
+def bench(label, fn, dates):
+    start = time.perf_counter()
+    for kind, value in dates:
+        fn(kind, value)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed * 1000:8.1f} ms  {elapsed / len(dates) * 1e6:6.2f} µs/个")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    dates = synthetic_dates(count)
+    for kind, value in dates:
+        assert codec_date(kind, value) == pendulum_date(kind, value), (kind, value)
+    print(f"{count} 个日期")
+
+    old = bench("pendulum", pendulum_date, dates)
+    to_date_key.cache_clear()
+    timestamp_to_date_key.cache_clear()
+    cold = bench("codec（首次）", codec_date, dates)
+    warm = bench("codec（重复）", codec_date, dates)
+    print(f"{'加速':<14} {old / cold:8.1f}x（首次） {old / warm:.1f}x（重复）")
+
+
+if __name__ == "__main__":
+    main()
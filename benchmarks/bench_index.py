@@ -0,0 +1,146 @@
+"""Notion索引内存基准：旧的整表查询 + 保留原始属性的字典索引，对比逐页解码的IndexEntry索引
+
+本地模拟的Notion数据库中预先写入N条书籍页面（带简介等长文本），
+两种方式各在一个新的子进程中加载索引，记录加载前后的峰值内存和耗时。
+模拟服务器在本进程中运行，因此峰值内存只包含加载索引本身。
+
+用法:
+    python benchmarks/bench_index.py [--sizes 5000,20000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_servers import FakeNotionServer, make_collection  # noqa: E402
+from douban2notion.config import SYNC_HASH_PROPERTY, media_specs  # noqa: E402
+
+BOOK_DB = "2" * 32
+MODES = ("legacy", "compact")
+
+
+def get_peak_rss_mb():
+    """本进程的峰值内存（MB）"""
+    # Linux上ru_maxrss会继承fork时父进程（模拟服务器）的内存，改用/proc中的VmHWM
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # macOS上ru_maxrss的单位为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def legacy_index(notion_helper, database_id, property_ids):
+    """旧实现：先取回全部页面，再为每个页面保留原始属性"""
+    from douban2notion.sync import decode_page
+
+    index = {}
+    for page in notion_helper.query_all(database_id, filter_properties=property_ids):
+        douban_link, entry = decode_page(page)
+        if douban_link:
+            index[douban_link] = {
+                "page_id": entry.page_id,
+                "fingerprint": entry.fingerprint,
+                "field_hashes": None,
+                "properties": page["properties"],
+            }
+    return index
+
+
+def run_child(mode, database_id):
+    """子进程：用mode方式加载一次索引，输出页面数、耗时和峰值内存"""
+    from douban2notion.mapper import get_mapper
+    from douban2notion.notion_helper import NotionHelper
+    from douban2notion.sync import load_notion_index
+    from douban2notion.utils import get_property_ids
+
+    mapper = get_mapper("book")
+    notion_helper = NotionHelper(None, database_id, workers=1, rate=0)
+    schema = notion_helper.get_database_schema(database_id)
+    keys = (*mapper.properties_type_dict, *mapper.detail_properties_type_dict)
+    property_ids = get_property_ids(schema["properties"], [*keys, SYNC_HASH_PROPERTY])
+    before = get_peak_rss_mb()
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        index = legacy_index(notion_helper, database_id, property_ids)
+    else:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w", encoding="utf-8")
+        index, _ = load_notion_index(notion_helper, database_id, property_ids=property_ids, keys=keys)
+        sys.stdout = stdout
+    wall = time.perf_counter() - start
+    peak = get_peak_rss_mb()
+    notion_helper.close()
+    print(json.dumps({
+        "pages": len(index),
+        "wall_s": round(wall, 3),
+        "before_mb": round(before, 1),
+        "peak_rss_mb": round(peak, 1),
+    }))
+
+
+def seed_server(notion_server, size):
+    """在模拟的Notion数据库中写入size条书籍页面"""
+    from douban2notion.mapper import get_mapper
+    from douban2notion.utils import get_fingerprint, get_rich_text
+
+    spec = media_specs["book"]
+    notion_server.add_database(
+        BOOK_DB, spec["database_name"],
+        {**spec["properties"], **spec.get("detail_properties", {}), SYNC_HASH_PROPERTY: "rich_text"},
+    )
+    mapper = get_mapper("book")
+    for interests in make_collection("book", size).values():
+        for interest in interests:
+            properties = mapper.encode(mapper.transform(interest))
+            properties[SYNC_HASH_PROPERTY] = get_rich_text(get_fingerprint(properties))
+            notion_server.create_page({}, {"parent": {"database_id": BOOK_DB}, "properties": properties})
+
+
+def run_mode(notion_server, mode):
+    env = dict(os.environ, PYTHONPATH=ROOT, NOTION_BASE_URL=notion_server.url, NOTION_TOKEN="bench")
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, BOOK_DB]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notion索引内存基准")
+    parser.add_argument("--sizes", default="5000,20000", help="逗号分隔的页面数")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DATABASE_ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(*args.child)
+        return
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        notion_server = FakeNotionServer()
+        seed_server(notion_server, size)
+        with notion_server:
+            results = {mode: run_mode(notion_server, mode) for mode in MODES}
+        for mode, result in results.items():
+            growth = result["peak_rss_mb"] - result["before_mb"]
+            print(
+                f"{size:>6} {mode:<8} {result['wall_s']:>7.2f}s  峰值 {result['peak_rss_mb']:>7.1f}MB"
+                f"（加载索引 +{growth:.1f}MB）"
+            )
+        legacy, compact = results["legacy"], results["compact"]
+        legacy_growth = legacy["peak_rss_mb"] - legacy["before_mb"]
+        compact_growth = compact["peak_rss_mb"] - compact["before_mb"]
+        if compact_growth > 0:
+            print(f"{size:>6} 索引内存减少到 1/{legacy_growth / compact_growth:.1f}")
+
+
+if __name__ == "__main__":
+    main()
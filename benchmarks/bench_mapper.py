@@ -0,0 +1,183 @@
+"""条目转换的微基准：编译后的MediaMapper对比逐条re.search + if链的旧实现
+
+用法: python benchmarks/bench_mapper.py [条数]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+import pendulum
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from douban2notion.config import (  # noqa: E402
+    book_properties_type_dict,
+    book_status_mapping,
+    movie_properties_type_dict,
+    movie_status_mapping,
+    movie_type_mapping,
+    rating_mapping,
+)
+from douban2notion.mapper import get_mapper  # noqa: E402
+from douban2notion.utils import get_date, get_files, get_multi_select, get_number, get_rich_text  # noqa: E402
+from douban2notion.utils import get_select, get_status, get_title, get_url, truncate_text, tz  # noqa: E402
+
+
+def legacy_get_properties(item, properties_type_dict):
+    """旧版按属性类型if链创建属性"""
+    properties = {}
+    for key, property_type in properties_type_dict.items():
+        value = item.get(key)
+        if value is None:
+            continue
+        if property_type == "title":
+            properties[key] = get_title(value)
+        elif property_type == "rich_text":
+            properties[key] = get_rich_text(value)
+        elif property_type == "url":
+            properties[key] = get_url(value)
+        elif property_type == "select":
+            prop = get_select(value)
+            if prop:
+                properties[key] = prop
+        elif property_type == "multi_select":
+            properties[key] = get_multi_select(value)
+        elif property_type == "status":
+            prop = get_status(value)
+            if prop:
+                properties[key] = prop
+        elif property_type == "date":
+            if isinstance(value, int):
+                iso_date = pendulum.from_timestamp(value, tz=tz).format("YYYY-MM-DD")
+                prop = get_date(iso_date)
+            else:
+                prop = get_date(value)
+            if prop:
+                properties[key] = prop
+        elif property_type == "number":
+            prop = get_number(value)
+            if prop:
+                properties[key] = prop
+        elif property_type == "files":
+            properties[key] = get_files(value)
+    return properties
+
+
+def legacy_movie(result):
+    """旧版sync_movies中的逐条转换"""
+    subject = result.get("subject", {})
+    movie = {}
+    movie["名称"] = subject.get("title", "")
+    movie["豆瓣链接"] = subject.get("url", "")
+    movie["状态"] = movie_status_mapping.get(result.get("status"), "")
+    create_time = result.get("create_time")
+    if create_time:
+        movie["看完日期"] = pendulum.parse(create_time, tz=tz).int_timestamp
+    rating_data = result.get("rating")
+    if rating_data:
+        rating_value = rating_data.get("value")
+        if rating_value and rating_value > 0:
+            movie["豆瓣评分/自评"] = rating_mapping.get(rating_value, rating_value)
+    if subject.get("directors"):
+        movie["导演/演讲人"] = ", ".join(d.get("name", "") for d in subject.get("directors", []))
+    if subject.get("genres"):
+        movie["标签"] = subject.get("genres")
+    subject_type = subject.get("type", "")
+    movie["类型"] = movie_type_mapping.get(subject_type, subject_type)
+    pubdates = subject.get("pubdate", [])
+    if pubdates:
+        date_match = re.search(r'(\d{4}-\d{2}-\d{2})', pubdates[0])
+        if date_match:
+            movie["上映日期"] = date_match.group(1)
+        else:
+            year_match = re.search(r'(\d{4})', pubdates[0])
+            movie["上映日期"] = f"{year_match.group(1)}-01-01" if year_match else ""
+    else:
+        year = subject.get("year")
+        movie["上映日期"] = f"{year}-01-01" if year else ""
+    if subject.get("pic", {}).get("normal"):
+        cover_url = subject.get("pic", {}).get("normal")
+        if not cover_url.endswith('.webp'):
+            cover_url = cover_url.rsplit('.', 1)[0] + '.webp'
+        movie["封面"] = cover_url
+    return legacy_get_properties(movie, movie_properties_type_dict)
+
+
+def legacy_book(result):
+    """旧版sync_books中的逐条转换"""
+    subject = result.get("subject", {})
+    book = {}
+    book["名称"] = subject.get("title", "")
+    book["豆瓣链接"] = subject.get("url", "")
+    book["状态"] = book_status_mapping.get(result.get("status"), "")
+    create_time = result.get("create_time")
+    if create_time:
+        book["添加日期"] = pendulum.parse(create_time, tz=tz).int_timestamp
+    rating_data = result.get("rating")
+    if rating_data:
+        rating_value = rating_data.get("value")
+        if rating_value and rating_value > 0:
+            book["豆瓣评分"] = rating_mapping.get(rating_value, rating_value)
+    if subject.get("author"):
+        book["书籍作者"] = ", ".join(subject.get("author", []))
+    book["书籍简介"] = truncate_text(subject.get("intro", ""))
+    if subject.get("pic", {}).get("large"):
+        book["书籍封面"] = subject.get("pic", {}).get("large")
+    return legacy_get_properties(book, book_properties_type_dict)
+
+
+def synthetic_interests(type_, count, seed=0):
+    """生成count条随机的豆瓣标记记录"""
+    rng = random.Random(seed)
+    statuses = list(movie_status_mapping if type_ == "movie" else book_status_mapping)
+    interests = []
+    for i in range(count):
+        day = pendulum.datetime(2015, 1, 1).add(days=rng.randrange(3000), seconds=rng.randrange(86400))
+        pubdate = rng.choice(["2001-02-03(中国大陆)", "1999(美国)", "未知"])
+        interests.append({
+            "create_time": day.format("YYYY-MM-DD HH:mm:ss"),
+            "status": rng.choice(statuses),
+            "rating": rng.choice([None, {"value": rng.randint(0, 5)}]),
+            "subject": {
+                "title": f"{type_} {i}",
+                "url": f"https://{type_}.douban.com/subject/{1000000 + i}/",
+                "type": rng.choice(["movie", "tv"]),
+                "directors": [{"name": f"导演{j}"} for j in range(rng.randint(0, 2))],
+                "genres": rng.sample(["剧情", "喜剧", "动作", "爱情", "科幻"], rng.randint(0, 3)),
+                "pubdate": rng.choice([[pubdate], []]),
+                "year": rng.choice(["", "2010"]),
+                "pic": {"normal": f"https://img.doubanio.com/{i}.jpg", "large": f"https://img.doubanio.com/l/{i}.jpg"},
+                "author": [f"作者{j}" for j in range(rng.randint(0, 2))],
+                "intro": "简介" * rng.choice([10, 1200]),
+            },
+        })
+    return interests
+
+
+def bench(label, fn, interests):
+    start = time.perf_counter()
+    for interest in interests:
+        fn(interest)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed * 1000:8.1f} ms  {elapsed / len(interests) * 1e6:6.2f} µs/条")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for type_, legacy in (("movie", legacy_movie), ("book", legacy_book)):
+        mapper = get_mapper(type_)
+        interests = synthetic_interests(type_, count)
+        for interest in interests:
+            assert mapper.encode(mapper.transform(interest)) == legacy(interest), interest
+        print(f"{type_}: {count} 条")
+        old = bench("旧实现", legacy, interests)
+        new = bench("MediaMapper", lambda i: mapper.encode(mapper.transform(i)), interests)
+        print(f"{'加速':<12} {old / new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
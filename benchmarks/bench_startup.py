@@ -0,0 +1,97 @@
+"""启动开销基准：用 python -X importtime 测量命令行各种不发请求的调用导入了哪些模块、耗时多少
+
+每个场景在新的子进程中运行多次，取导入耗时（扣除解释器自身启动时导入的模块）的中位数。
+导入了HEAVY_MODULES中的任一模块，或中位数超过预算时以非零状态退出，便于在CI中发现回退。
+
+用法:
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 100] [--top 8]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在真正发请求或启动健康检查接口时才需要的模块（pendulum已不再使用）
+HEAVY_MODULES = ("requests", "httpx", "notion_client", "pendulum", "http.server")
+# 导入耗时预算（毫秒），可用环境变量STARTUP_BUDGET_MS覆盖
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "100"))
+
+SCENARIOS = {
+    "help": ["--help"],
+    "plan-help": ["plan", "--help"],
+    "argument-error": ["sync", "--book-db", "x"],
+}
+
+IMPORT_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_importtime(args):
+    """以 -X importtime 运行python，返回 [(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def measure(cli_args, baseline):
+    """运行一次命令行，返回 (导入耗时ms, 导入的模块集合, 按累计耗时排序的顶层模块)"""
+    imports = run_importtime(["-m", "douban2notion", *cli_args])
+    top_level = [(name, cumulative) for name, _, cumulative, level in imports if level == 0 and name not in baseline]
+    total_ms = sum(cumulative for _, cumulative in top_level) / 1000
+    modules = {name for name, *_ in imports}
+    return total_ms, modules, sorted(top_level, key=lambda item: -item[1])
+
+
+def get_baseline():
+    """解释器自身启动时导入的顶层模块（site等，与本项目无关）"""
+    return {name for name, _, _, level in run_importtime(["-c", "pass"]) if level == 0}
+
+
+def get_heavy_imports(modules):
+    """modules中属于HEAVY_MODULES（包括其子模块）的模块"""
+    return sorted(
+        name for name in modules
+        if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行启动开销基准")
+    parser.add_argument("--runs", type=int, default=5, help="每个场景运行的次数")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="导入耗时中位数的上限（毫秒）")
+    parser.add_argument("--top", type=int, default=8, help="列出导入最慢的顶层模块数")
+    args = parser.parse_args()
+
+    baseline = get_baseline()
+    failed = False
+    for scenario, cli_args in SCENARIOS.items():
+        timings = []
+        for _ in range(max(1, args.runs)):
+            total_ms, modules, top_level = measure(cli_args, baseline)
+            timings.append(total_ms)
+        median = statistics.median(timings)
+        heavy = get_heavy_imports(modules)
+        over = median > args.budget_ms
+        failed = failed or over or bool(heavy)
+        print(f"{scenario:<16} 导入 {median:6.1f} ms（预算 {args.budget_ms:g} ms）{'  超出预算' if over else ''}")
+        for name, cumulative in top_level[:args.top]:
+            print(f"    {cumulative / 1000:6.1f} ms  {name}")
+        if heavy:
+            print(f"    不应导入: {', '.join(heavy)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""端到端同步基准：用本地模拟的豆瓣和Notion服务器运行sync_movies / sync_books
+
+每个规模先全量同步一次（cold，全部新建），再在数据不变时同步一次（warm），
+记录耗时、各接口请求数和同步进程的峰值内存。同步在子进程中运行，
+模拟服务器在本进程中运行，因此峰值内存只包含同步本身。
+
+指定--snapshot时不生成数据，用douban2notion snapshot保存的快照作为模拟豆瓣的数据。
+请求数是确定的，与--baseline比较时请求数不一致（基准已过期或同步的请求变多）会以非零状态退出，
+有意改变请求数时用--output重新生成基准。
+
+用法:
+    python benchmarks/bench_sync.py [--sizes 100,1000,10000] [--snapshot snapshot.jsonl.gz]
+                                    [--output result.json] [--baseline benchmarks/baseline_sync.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_index import get_peak_rss_mb  # noqa: E402
+from benchmarks.fake_servers import (  # noqa: E402
+    FakeDoubanServer,
+    FakeNotionServer,
+    load_snapshot_collections,
+    make_collection,
+)
+from douban2notion.config import SYNC_HASH_PROPERTY, media_specs  # noqa: E402
+
+MOVIE_DB = "1" * 32
+BOOK_DB = "2" * 32
+DOUBAN_USER = "bench"
+
+
+def run_child(movie_db, book_db, workers):
+    """子进程：执行一次完整同步，输出耗时和峰值内存"""
+    from douban2notion import douban
+    from douban2notion.notion_helper import NotionHelper
+    from douban2notion.state import SyncState
+    from douban2notion.transport import close_transports, configure_douban_session
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    start = time.perf_counter()
+    notion_helper = NotionHelper(movie_db, book_db, workers=workers)
+    state = SyncState()
+    configure_douban_session(pool_size=douban.DOUBAN_CONCURRENCY)
+    errors = []
+    for sync in (douban.sync_movies, douban.sync_books):
+        try:
+            sync(DOUBAN_USER, notion_helper, state)
+            state.save()
+        except Exception as e:
+            errors.append(str(e))
+    notion_helper.close()
+    state.close()
+    close_transports()
+    wall = time.perf_counter() - start
+    sys.stdout = stdout
+
+    peak_mb = get_peak_rss_mb()
+    print(json.dumps({"wall_s": round(wall, 3), "peak_rss_mb": round(peak_mb, 1), "errors": errors}))
+
+
+def run_sync(douban_server, notion_server, state_file, args):
+    """在子进程中同步一次，返回耗时、峰值内存和两个服务器记录的请求数"""
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DOUBAN_API_URL=douban_server.url,
+        NOTION_BASE_URL=notion_server.url,
+        NOTION_TOKEN="bench",
+        AUTH_TOKEN="bench",
+        DOUBAN_DELAY="0",
+        DOUBAN_HOST_RATE="0",
+        DOUBAN_CONCURRENCY=str(args.concurrency),
+        NOTION_RATE=str(args.notion_client_rate),
+        RETRY_BASE_DELAY="0.05",
+        DOUBAN2NOTION_STATE=state_file,
+    )
+    douban_server.reset_counts()
+    notion_server.reset_counts()
+    command = [sys.executable, os.path.abspath(__file__), "--child", MOVIE_DB, BOOK_DB, "--workers", str(args.workers)]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["requests"] = {
+        "douban": douban_server.get_counts(),
+        "notion": notion_server.get_counts(status=200),
+        "notion_429": sum(notion_server.get_counts(status=429).values()),
+    }
+    return result
+
+
+def bench_size(size, args, collections=None):
+    """对某个规模（或给定的豆瓣数据）运行cold和warm两次同步"""
+    if collections is None:
+        movies = size // 2
+        collections = {"movie": make_collection("movie", movies), "book": make_collection("book", size - movies)}
+    douban_server = FakeDoubanServer(collections, latency=args.douban_latency)
+    notion_server = FakeNotionServer(
+        latency=args.notion_latency, rate_limit=args.notion_rate_limit, retry_after=args.retry_after
+    )
+    for database_id, type_ in ((MOVIE_DB, "movie"), (BOOK_DB, "book")):
+        spec = media_specs[type_]
+        notion_server.add_database(
+            database_id, spec["database_name"], {**spec["properties"], SYNC_HASH_PROPERTY: "rich_text"}
+        )
+
+    results = []
+    with douban_server, notion_server, tempfile.TemporaryDirectory() as tmp:
+        state_file = os.path.join(tmp, "state.db")
+        for run in ("cold", "warm"):
+            result = run_sync(douban_server, notion_server, state_file, args)
+            results.append({"items": size, "run": run, **result})
+            print(format_result(results[-1]))
+    return results
+
+
+def format_result(result):
+    requests = result["requests"]
+    notion = ", ".join(f"{k}={v}" for k, v in sorted(requests["notion"].items())) or "-"
+    douban = sum(requests["douban"].values())
+    line = (
+        f"{result['items']:>6} {result['run']:<5} {result['wall_s']:>8.2f}s "
+        f"{result['peak_rss_mb']:>7.1f}MB  douban={douban} {notion} 429={requests['notion_429']}"
+    )
+    if result["errors"]:
+        line += f"  错误: {'; '.join(result['errors'])}"
+    return line
+
+
+def compare(results, baseline):
+    """与基准结果比较耗时和请求数，返回请求数是否全部一致"""
+    previous = {(r["items"], r["run"]): r for r in baseline.get("results", [])}
+    print("\n与基准比较:")
+    same = True
+    for result in results:
+        old = previous.get((result["items"], result["run"]))
+        if old is None:
+            continue
+        change = (result["wall_s"] - old["wall_s"]) / old["wall_s"] * 100 if old["wall_s"] else 0
+        notes = []
+        for source in ("douban", "notion"):
+            for endpoint in sorted(set(result["requests"][source]) | set(old["requests"][source])):
+                new_count = result["requests"][source].get(endpoint, 0)
+                old_count = old["requests"][source].get(endpoint, 0)
+                if new_count != old_count:
+                    notes.append(f"{endpoint} {old_count}->{new_count}")
+        same = same and not notes
+        print(
+            f"{result['items']:>6} {result['run']:<5} 耗时 {old['wall_s']:.2f}s -> {result['wall_s']:.2f}s ({change:+.0f}%)"
+            f"  内存 {old['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f}MB"
+            f"  请求数{'变化: ' + ', '.join(notes) if notes else '不变'}"
+        )
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端同步基准")
+    parser.add_argument("--sizes", default="100,1000,10000", help="条目数，逗号分隔")
+    parser.add_argument("--douban-latency", type=float, default=0.005, help="模拟豆瓣每个请求的延迟（秒）")
+    parser.add_argument("--notion-latency", type=float, default=0.005, help="模拟Notion每个请求的延迟（秒）")
+    parser.add_argument("--notion-rate-limit", type=float, default=0, help="模拟Notion每秒允许的请求数，超过返回429，0表示不限")
+    parser.add_argument("--retry-after", type=float, default=1, help="429响应的Retry-After（秒）")
+    parser.add_argument("--notion-client-rate", type=float, default=0, help="客户端NOTION_RATE，0表示不限速")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求豆瓣的线程数")
+    parser.add_argument("--workers", type=int, default=8, help="并发写入Notion的线程数")
+    parser.add_argument("--snapshot", help="用此快照文件中的豆瓣数据代替生成的数据（忽略--sizes）")
+    parser.add_argument("--output", help="把结果保存为JSON（可作为之后比较的基准）")
+    parser.add_argument("--baseline", help="与此前保存的JSON结果比较")
+    parser.add_argument("--child", nargs=2, metavar=("MOVIE_DB", "BOOK_DB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, workers=args.workers)
+        return
+
+    print(f"{'条数':>6} {'轮次':<5} {'耗时':>9} {'峰值内存':>9}  请求数")
+    results = []
+    if args.snapshot:
+        collections = load_snapshot_collections(args.snapshot)
+        size = sum(len(interests) for collection in collections.values() for interests in collection.values())
+        results.extend(bench_size(size, args, collections))
+    else:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.extend(bench_size(size, args))
+
+    config = {
+        key: getattr(args, key)
+        for key in ("douban_latency", "notion_latency", "notion_rate_limit", "retry_after",
+                    "notion_client_rate", "concurrency", "workers")
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            if not compare(results, json.load(f)):
+                sys.exit("请求数与基准不一致：基准已过期时请用 --output 重新生成")
+
+
+if __name__ == "__main__":
+    main()
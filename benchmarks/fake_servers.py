@@ -0,0 +1,458 @@
+"""本地模拟的豆瓣和Notion HTTP服务器（用于基准测试和请求数测试）
+
+豆瓣: GET /api/v2/user/{user}/interests、GET /api/v2/{movie|book}/{id}
+Notion: GET /v1/databases/{id}、POST /v1/databases/{id}/query、
+        POST /v1/pages、PATCH /v1/pages/{id}
+
+两个服务器都在后台线程中运行，可配置每个请求的延迟，并按接口统计请求数。
+"""
+import copy
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from douban2notion.config import media_specs
+from douban2notion.snapshot import iter_snapshot, read_snapshot_header
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") if length else None
+        status, payload, headers = self.server.app.handle(
+            self.command, parts.path, parse_qs(parts.query), body
+        )
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer:
+    def __init__(self, latency=0.0):
+        """
+        在后台线程中运行的模拟服务器
+
+        Args:
+            latency: 每个请求的处理延迟（秒）
+        """
+        self.latency = latency
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.app = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, endpoint, status):
+        with self._lock:
+            self.counts[f"{endpoint} {status}"] += 1
+
+    def get_counts(self, status=None):
+        """按接口汇总的请求数（指定status时只统计该状态码）"""
+        with self._lock:
+            totals = Counter()
+            for key, value in self.counts.items():
+                endpoint, code = key.rsplit(" ", 1)
+                if status is None or int(code) == status:
+                    totals[endpoint] += value
+            return dict(totals)
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts.clear()
+
+    def handle(self, method, path, query, body):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.route(method, path, query, body)
+
+    def route(self, method, path, query, body):
+        raise NotImplementedError
+
+
+def make_interest(type_, status, index, create_time=None, rating=None):
+    """生成一条确定的豆瓣标记记录（同样的参数总是得到同样的记录）"""
+    if create_time is None:
+        create_time = (datetime(2024, 1, 1) - timedelta(minutes=index)).strftime("%Y-%m-%d %H:%M:%S")
+    subject = {
+        "title": f"{type_}-{status}-{index}",
+        "url": f"https://{type_}.douban.com/subject/{status}{index}/",
+        "type": type_,
+        "pic": {
+            "normal": f"https://img.doubanio.com/view/photo/s/public/p{index}.jpg",
+            "large": f"https://img.doubanio.com/view/subject/l/public/s{index}.jpg",
+        },
+    }
+    if type_ == "movie":
+        subject["directors"] = [{"name": f"导演{index % 50}"}]
+        subject["genres"] = ["剧情", ["爱情", "喜剧", "动作"][index % 3]]
+        subject["pubdate"] = [f"{1990 + index % 30}-0{1 + index % 9}-1{index % 10}(中国大陆)"]
+    else:
+        subject["author"] = [f"作者{index % 80}"]
+        subject["intro"] = f"第{index}本书的简介。" * 20
+    return {
+        "create_time": create_time,
+        "status": status,
+        "rating": {"value": rating if rating is not None else index % 5 + 1},
+        "subject": subject,
+    }
+
+
+def make_collection(type_, count):
+    """生成某类型count条标记记录，平均分到各状态，{status: [interest, ...]}"""
+    statuses = list(media_specs[type_]["status_mapping"])
+    collection = {status: [] for status in statuses}
+    for index in range(count):
+        status = statuses[index % len(statuses)]
+        collection[status].append(make_interest(type_, status, index))
+    return collection
+
+
+def load_snapshot_collections(path):
+    """把douban2notion snapshot保存的快照读成FakeDoubanServer的collections"""
+    collections = {}
+    for type_ in read_snapshot_header(path)["counts"]:
+        collection = collections[type_] = {}
+        for interest in iter_snapshot(path, type_):
+            collection.setdefault(interest["status"], []).append(interest)
+        for interests in collection.values():
+            interests.sort(key=lambda interest: interest.get("create_time") or "", reverse=True)
+    return collections
+
+
+class FakeDoubanServer(FakeServer):
+    def __init__(self, collections=None, latency=0.0, details=None):
+        """
+        模拟豆瓣的标记记录和条目详情接口
+
+        Args:
+            collections: {type_: {status: [interest, ...]}}，各状态内按create_time倒序
+            latency: 每个请求的处理延迟（秒）
+            details: 条目详情 {subject_id: detail}，没有的条目返回404
+        """
+        super().__init__(latency)
+        self.collections = collections or {}
+        self.details = details or {}
+
+    def add_interest(self, type_, interest):
+        """新增一条标记（插入到该状态的最前面）"""
+        self.collections.setdefault(type_, {}).setdefault(interest["status"], []).insert(0, interest)
+
+    def move_interest(self, type_, url, status, create_time):
+        """修改某条标记的状态（豆瓣会更新create_time并移到新状态的最前面）"""
+        for interests in self.collections.get(type_, {}).values():
+            for interest in interests:
+                if interest["subject"]["url"] == url:
+                    interests.remove(interest)
+                    self.add_interest(type_, dict(interest, status=status, create_time=create_time))
+                    return
+
+    def find_interest(self, type_, url):
+        for interests in self.collections.get(type_, {}).values():
+            for interest in interests:
+                if interest["subject"]["url"] == url:
+                    return interest
+        return None
+
+    def route(self, method, path, query, body):
+        match = re.fullmatch(r"/api/v2/(?:movie|book)/([^/]+)", path)
+        if method == "GET" and match:
+            detail = self.details.get(match.group(1))
+            if detail is None:
+                self.count("subject", 404)
+                return 404, {"msg": "subject_not_found"}, None
+            self.count("subject", 200)
+            return 200, copy.deepcopy(detail), None
+
+        match = re.fullmatch(r"/api/v2/user/[^/]+/interests", path)
+        if method != "GET" or not match:
+            self.count("unknown", 404)
+            return 404, {"msg": "not found"}, None
+        type_ = query.get("type", [""])[0]
+        status = query.get("status", [""])[0]
+        start = int(query.get("start", ["0"])[0])
+        count = int(query.get("count", ["20"])[0])
+        interests = self.collections.get(type_, {}).get(status, [])
+        self.count("interests", 200)
+        return 200, {
+            "count": count,
+            "start": start,
+            "total": len(interests),
+            "interests": copy.deepcopy(interests[start:start + count]),
+        }, None
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeNotionServer(FakeServer):
+    def __init__(self, latency=0.0, rate_limit=0, retry_after=1, rich_text_segment=0):
+        """
+        模拟Notion的数据库查询和页面读写接口
+
+        Args:
+            latency: 每个请求的处理延迟（秒）
+            rate_limit: 每秒允许的请求数，超过时返回429和Retry-After，0表示不限
+            retry_after: 429响应中Retry-After的秒数
+            rich_text_segment: 返回页面时把文本按此长度拆成多段（模拟Notion的多段富文本），0表示不拆
+        """
+        super().__init__(latency)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rich_text_segment = rich_text_segment
+        self.databases = {}
+        self.pages = {}
+        # 写入记录 [(接口, page_id, 写入的属性名列表)]
+        self.writes = []
+        self._tokens = rate_limit
+        self._updated = time.monotonic()
+
+    def add_database(self, database_id, title, properties_type_dict):
+        """创建数据库，properties_type_dict为 {属性名: 类型}"""
+        properties = {}
+        for index, (name, type_) in enumerate(properties_type_dict.items()):
+            properties[name] = {"id": f"p{index}", "name": name, "type": type_, type_: {}}
+        self.databases[database_id] = {
+            "object": "database",
+            "id": database_id,
+            "title": [{"type": "text", "text": {"content": title}, "plain_text": title}],
+            "last_edited_time": _utc_now(),
+            "properties": properties,
+        }
+
+    def reset_counts(self):
+        super().reset_counts()
+        with self._lock:
+            self.writes.clear()
+
+    def edit_page(self, page_id, name, value):
+        """模拟在Notion中手动修改页面属性（不计入请求数）"""
+        self.pages[page_id]["properties"][name] = value
+        self.pages[page_id]["last_edited_time"] = _utc_now()
+
+    def get_database_pages(self, database_id):
+        """数据库中未归档的全部页面（不计入请求数）"""
+        with self._lock:
+            pages = list(self.pages.values())
+        return [
+            page for page in pages
+            if page["parent"]["database_id"] == database_id and not page.get("archived")
+        ]
+
+    def _take_token(self):
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def route(self, method, path, query, body):
+        routes = [
+            ("GET", r"/v1/databases/([^/]+)", "databases.retrieve", self.retrieve_database),
+            ("PATCH", r"/v1/databases/([^/]+)", "databases.update", self.update_database),
+            ("POST", r"/v1/databases/([^/]+)/query", "databases.query", self.query_database),
+            ("POST", r"/v1/pages", "pages.create", self.create_page),
+            ("PATCH", r"/v1/pages/([^/]+)", "pages.update", self.update_page),
+        ]
+        for route_method, pattern, endpoint, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if method == route_method and match:
+                break
+        else:
+            self.count("unknown", 404)
+            return 404, _error(404, "object_not_found", "未知接口"), None
+
+        if not self._take_token():
+            self.count(endpoint, 429)
+            return 429, _error(429, "rate_limited", "请求过多"), {"Retry-After": str(self.retry_after)}
+        status, payload = handler(*match.groups(), query=query, body=body or {})
+        self.count(endpoint, status)
+        return status, payload, None
+
+    def retrieve_database(self, database_id, query, body):
+        database = self.databases.get(database_id)
+        if database is None:
+            return 404, _error(404, "object_not_found", "数据库不存在")
+        return 200, copy.deepcopy(database)
+
+    def update_database(self, database_id, query, body):
+        """只支持新增属性（{属性名: {类型: {}}}）"""
+        database = self.databases.get(database_id)
+        if database is None:
+            return 404, _error(404, "object_not_found", "数据库不存在")
+        with self._lock:
+            properties = database["properties"]
+            for name, config in body.get("properties", {}).items():
+                if name in properties:
+                    continue
+                type_ = next(iter(config))
+                if type_ in ("title", "status"):
+                    return 400, _error(400, "validation_error", f"Cannot create {type_} property.")
+                properties[name] = {"id": f"new{len(properties)}", "name": name, "type": type_, type_: {}}
+            database["last_edited_time"] = _utc_now()
+            return 200, copy.deepcopy(database)
+
+    def query_database(self, database_id, query, body):
+        database = self.databases.get(database_id)
+        if database is None:
+            return 404, _error(404, "object_not_found", "数据库不存在")
+        pages = self.get_database_pages(database_id)
+        condition = body.get("filter")
+        if condition:
+            pages = [page for page in pages if _match_filter(page, condition)]
+        start = int(body.get("start_cursor") or 0)
+        page_size = min(100, int(body.get("page_size") or 100))
+        selected = pages[start:start + page_size]
+        property_ids = set(query.get("filter_properties[]", []) + query.get("filter_properties", []))
+        results = [self._render_page(page, database, property_ids) for page in selected]
+        has_more = start + page_size < len(pages)
+        return 200, {
+            "object": "list",
+            "results": results,
+            "has_more": has_more,
+            "next_cursor": str(start + page_size) if has_more else None,
+        }
+
+    def create_page(self, query, body):
+        database_id = body.get("parent", {}).get("database_id")
+        if database_id not in self.databases:
+            return 404, _error(404, "object_not_found", "数据库不存在")
+        page_id = str(uuid.uuid4())
+        page = {
+            "id": page_id,
+            "parent": {"type": "database_id", "database_id": database_id},
+            "icon": body.get("icon"),
+            "last_edited_time": _utc_now(),
+            "properties": {},
+        }
+        error = self._write_properties(page, body.get("properties", {}))
+        if error:
+            return 400, error
+        with self._lock:
+            self.pages[page_id] = page
+            self.writes.append(("pages.create", page_id, sorted(page["properties"])))
+        return 200, {"object": "page", "id": page_id}
+
+    def update_page(self, page_id, query, body):
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, _error(404, "object_not_found", "页面不存在")
+        if page.get("archived") and not ("archived" in body and not body["archived"]):
+            return 400, _error(
+                400, "validation_error", "Can't edit block that is archived. You must unarchive the block before editing."
+            )
+        written = {}
+        error = self._write_properties(written, body.get("properties", {}), page["parent"]["database_id"])
+        if error:
+            return 400, error
+        page["properties"].update(written["properties"])
+        if "archived" in body:
+            page["archived"] = bool(body["archived"])
+        page["last_edited_time"] = _utc_now()
+        with self._lock:
+            self.writes.append(("pages.update", page_id, sorted(written["properties"])))
+        return 200, {"object": "page", "id": page_id}
+
+    def _write_properties(self, page, properties, database_id=None):
+        """写入属性（键可以是属性名或属性ID），写入的属性名记入page["properties"]"""
+        database = self.databases[database_id or page["parent"]["database_id"]]
+        by_id = {schema["id"]: name for name, schema in database["properties"].items()}
+        page.setdefault("properties", {})
+        for key, value in properties.items():
+            name = key if key in database["properties"] else by_id.get(key)
+            if name is None:
+                return _error(400, "validation_error", f"{key} is not a property that exists.")
+            page["properties"][name] = copy.deepcopy(value.get(database["properties"][name]["type"]))
+        return None
+
+    def _render_page(self, page, database, property_ids):
+        """按Notion的响应格式返回页面，只包含property_ids中的属性（为空时全部返回）"""
+        properties = {}
+        for name, schema in database["properties"].items():
+            if property_ids and schema["id"] not in property_ids:
+                continue
+            value = copy.deepcopy(page["properties"].get(name))
+            type_ = schema["type"]
+            if type_ in ("title", "rich_text"):
+                value = self._render_text(value or [])
+            elif type_ == "multi_select":
+                value = value or []
+            properties[name] = {"id": schema["id"], "type": type_, type_: value}
+        return {
+            "object": "page",
+            "id": page["id"],
+            "parent": page["parent"],
+            "last_edited_time": page["last_edited_time"],
+            "properties": properties,
+        }
+
+    def _render_text(self, segments):
+        content = "".join(segment.get("text", {}).get("content", "") for segment in segments)
+        size = self.rich_text_segment or len(content) or 1
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        return [
+            {"type": "text", "text": {"content": chunk, "link": None}, "plain_text": chunk}
+            for chunk in chunks
+        ]
+
+
+def _error(status, code, message):
+    return {"object": "error", "status": status, "code": code, "message": message}
+
+
+def _match_filter(page, condition):
+    """支持按URL属性精确匹配和按last_edited_time过滤"""
+    if condition.get("timestamp") == "last_edited_time":
+        since = datetime.fromisoformat(condition["last_edited_time"]["on_or_after"].replace("Z", "+00:00"))
+        return datetime.fromisoformat(page["last_edited_time"].replace("Z", "+00:00")) >= since
+    if "url" in condition:
+        return page["properties"].get(condition["property"]) == condition["url"]["equals"]
+    return True
@@ -1,4 +1,4 @@
-from douban2notion.douban import main
+from douban2notion.cli import main
 
 if __name__ == "__main__":
     main()
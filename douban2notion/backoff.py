@@ -0,0 +1,203 @@
+import functools
+import os
+import random
+import threading
+import time
+
+from douban2notion.metrics import metrics
+from douban2notion.transport import get_endpoint
+
+# 单个请求的最大尝试次数，以及指数退避的初始/最大等待时间（秒）
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# 同一主机连续失败多少次后熔断，以及熔断持续时间（秒）
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "8"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+
+# 可重试的HTTP状态码（其余4xx立即失败）
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status, message=None, headers=None):
+        """
+        HTTP请求返回了非成功状态码
+
+        Args:
+            status: HTTP状态码
+            message: 错误信息
+            headers: 响应头（用于读取Retry-After）
+        """
+        super().__init__(message or f"请求失败: {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class CircuitOpenError(Exception):
+    """主机已熔断，请求直接失败"""
+
+
+class CircuitBreaker:
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        """
+        按主机共享的熔断器
+
+        连续失败threshold次后熔断，cooldown秒内该主机的所有请求直接失败；
+        之后只放行一个请求试探（其余请求仍直接失败），试探成功即恢复，失败则重新熔断。
+
+        Args:
+            host: 主机名
+            threshold: 触发熔断的连续失败次数
+            cooldown: 熔断持续时间（秒）
+        """
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        # 熔断期满后是否已有试探请求在进行
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """请求前检查，熔断中（或已有试探请求在进行）时抛出CircuitOpenError"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"{self.host} 连续请求失败已熔断，{remaining:.0f}秒后重试")
+            if self._probing:
+                raise CircuitOpenError(f"{self.host} 连续请求失败已熔断，正在试探恢复")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    """获取某主机共享的熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def get_status(error):
+    """从异常中取出HTTP状态码（requests、notion_client和HTTPStatusError）"""
+    status = getattr(error, "status", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def get_retry_after(error):
+    """读取响应头中的Retry-After（秒），没有时返回None"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """网络错误、超时、429/409/408和5xx可以重试，其余4xx不重试"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = get_status(error)
+    if status is None:
+        return True
+    return status in RETRYABLE_STATUS or status >= 500
+
+
+def record_request_error(error, host, seconds):
+    """没有收到响应的请求（连接错误、超时）以状态"error"计入请求数（有响应的由transport记录）"""
+    if get_status(error) is not None or isinstance(error, CircuitOpenError):
+        return
+    request = getattr(error, "request", None)
+    try:
+        endpoint = get_endpoint(request.method, request.url)
+    except (AttributeError, RuntimeError):
+        # 异常中没有请求（如notion_client的超时），按主机归类
+        endpoint = host or "unknown"
+    metrics.record_request(endpoint, "error", seconds)
+
+
+def get_backoff_delay(attempt, base_delay=None, max_delay=None):
+    """第attempt次失败后的等待时间：指数退避加完全抖动"""
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def call_with_retry(fn, *args, host=None, attempts=RETRY_ATTEMPTS, **kwargs):
+    """调用fn，失败时按退避策略重试单个请求
+
+    429时遵守Retry-After（最多等待RETRY_MAX_DELAY秒）；不可重试的4xx立即抛出；
+    同一主机的网络错误和5xx计入共享熔断器；4xx（包括429等可重试的）说明主机正常响应，不算失败，
+    因此某个集成令牌被限流时不会让同一主机的其他调用方（如多用户模式下的其他用户）一起熔断。
+    """
+    breaker = get_breaker(host) if host else None
+    for attempt in range(1, attempts + 1):
+        if breaker is not None:
+            breaker.before_request()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            record_request_error(e, host, time.perf_counter() - started)
+            status = get_status(e)
+            if breaker is not None:
+                if status is None or status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not is_retryable(e):
+                raise
+            if attempt == attempts:
+                raise
+            metrics.record_retry(host, status or "network")
+            delay = get_retry_after(e)
+            if delay is None:
+                delay = get_backoff_delay(attempt)
+            else:
+                # 不让异常大的Retry-After长时间占住线程
+                delay = min(delay, RETRY_MAX_DELAY)
+            print(f"请求失败（{e}），{delay:.1f}秒后进行第{attempt + 1}次尝试")
+            time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def retry_request(host=None, attempts=RETRY_ATTEMPTS):
+    """装饰器：按call_with_retry的策略重试单个请求"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return call_with_retry(fn, *args, host=host, attempts=attempts, **kwargs)
+        return wrapper
+    return decorator
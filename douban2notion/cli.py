@@ -0,0 +1,39 @@
+import os
+
+# 命令行入口。各模块在导入时读取环境变量中的配置，因此这里先读取.env再导入douban；
+# requests、httpx和notion_client都在真正用到时才导入，--help和参数错误不会加载它们。
+
+
+def find_env_file():
+    """从本包所在目录向上查找.env（与python-dotenv默认的查找方式一致），没有时返回None"""
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def load_env():
+    """读取.env中的环境变量（不覆盖已设置的环境变量），没有.env时不导入python-dotenv"""
+    path = find_env_file()
+    if path is None:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv(path)
+
+
+def main(argv=None):
+    """命令行主函数"""
+    load_env()
+    from douban2notion.douban import main as run
+
+    run(argv)
+
+
+if __name__ == "__main__":
+    main()
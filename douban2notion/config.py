@@ -35,6 +35,26 @@ book_properties_type_dict = {
     "豆瓣链接": URL,
 }
 
+# 需要豆瓣条目详情的可选属性：数据库中有这些属性（且类型一致）时，
+# 才会为新条目请求详情接口并写入，没有时与原来一样只使用标记记录
+movie_detail_properties_type_dict = {
+    "简介": RICH_TEXT,
+    "片长": NUMBER,
+    "国家/地区": MULTI_SELECT,
+    "IMDb": RICH_TEXT,
+}
+
+book_detail_properties_type_dict = {
+    "ISBN": RICH_TEXT,
+    "出版社": RICH_TEXT,
+    "页数": NUMBER,
+}
+
+# 保存同步指纹的文本属性（可选，建议在Notion中隐藏该列）
+SYNC_HASH_PROPERTY = "sync_hash"
+# 标记豆瓣中已取消标记的页面的复选框属性（--orphans flag时使用）
+ORPHAN_PROPERTY = "豆瓣已移除"
+
 # 状态映射
 movie_status_mapping = {
     "mark": "计划看",
@@ -63,6 +83,65 @@ movie_type_mapping = {
     "tv": "电视剧",
 }
 
+# 各媒体类型的同步规则
+# fields中每个属性的取值规则：
+#   source: 在豆瓣标记记录中的路径（以"."分隔）
+#   map: 取值后查表映射（查不到时为空，指定keep_unmapped时保留原值）
+#   transform: 取值后的转换，见 douban2notion/mapper.py 中的 TRANSFORMS
+#   default: 取不到值时使用的默认值；没有default的属性在值为空时不写入
+# 以"detail."开头的路径取自条目详情（见detail_properties，详情按条目ID缓存在本地）
+media_specs = {
+    "movie": {
+        "label": "电影",
+        "unit": "部",
+        "database_name": "影视",
+        "database_attr": "movie_database_id",
+        "status_mapping": movie_status_mapping,
+        "properties": movie_properties_type_dict,
+        "detail_properties": movie_detail_properties_type_dict,
+        "icon": "封面",
+        "fields": {
+            "名称": {"source": "subject.title", "default": ""},
+            "豆瓣链接": {"source": "subject.url", "default": ""},
+            "状态": {"source": "status", "map": movie_status_mapping, "default": ""},
+            "看完日期": {"source": "create_time", "transform": "date"},
+            "豆瓣评分/自评": {"source": "rating.value", "transform": "rating"},
+            "导演/演讲人": {"source": "subject.directors", "transform": "join_names"},
+            "标签": {"source": "subject.genres"},
+            "类型": {"source": "subject.type", "map": movie_type_mapping, "keep_unmapped": True, "default": ""},
+            "上映日期": {"source": "subject", "transform": "release_date", "default": ""},
+            "封面": {"source": "subject.pic.normal", "transform": "webp"},
+            "简介": {"source": "detail.intro", "transform": "truncate"},
+            "片长": {"source": "detail.durations", "transform": "first_number"},
+            "国家/地区": {"source": "detail.countries"},
+            "IMDb": {"source": "detail.imdb"},
+        },
+    },
+    "book": {
+        "label": "书籍",
+        "unit": "本",
+        "database_name": "书籍",
+        "database_attr": "book_database_id",
+        "status_mapping": book_status_mapping,
+        "properties": book_properties_type_dict,
+        "detail_properties": book_detail_properties_type_dict,
+        "icon": "书籍封面",
+        "fields": {
+            "名称": {"source": "subject.title", "default": ""},
+            "豆瓣链接": {"source": "subject.url", "default": ""},
+            "状态": {"source": "status", "map": book_status_mapping, "default": ""},
+            "添加日期": {"source": "create_time", "transform": "date"},
+            "豆瓣评分": {"source": "rating.value", "transform": "rating"},
+            "书籍作者": {"source": "subject.author", "transform": "join"},
+            "书籍简介": {"source": "subject.intro", "transform": "truncate", "default": ""},
+            "书籍封面": {"source": "subject.pic.large"},
+            "ISBN": {"source": "detail.isbn"},
+            "出版社": {"source": "detail.press", "transform": "join"},
+            "页数": {"source": "detail.pages", "transform": "first_number"},
+        },
+    },
+}
+
 TAG_ICON_URL = "https://www.notion.so/icons/tag_gray.svg"
 USER_ICON_URL = "https://www.notion.so/icons/user-circle-filled_gray.svg"
 BOOK_ICON_URL = "https://www.notion.so/icons/book_gray.svg"
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 条目详情的本地缓存（单个SQLite文件，与同步状态分开，可在多个用户之间共用）
+DETAIL_CACHE_FILE = os.getenv("DOUBAN_DETAIL_CACHE", ".douban2notion_details.db")
+# 缓存有效期（天），过期的条目再次出现时重新获取
+DETAIL_TTL_DAYS = float(os.getenv("DOUBAN_DETAIL_TTL_DAYS", "30"))
+# 最多缓存的条目数，超过时淘汰最久未使用的
+DETAIL_CACHE_SIZE = int(os.getenv("DOUBAN_DETAIL_CACHE_SIZE", "20000"))
+# 同时请求详情的最大数量
+DETAIL_CONCURRENCY = int(os.getenv("DOUBAN_DETAIL_CONCURRENCY", "2"))
+
+SUBJECT_ID_RE = re.compile(r"/subject/(\d+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS details (
+    key TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS details_accessed_at ON details (accessed_at);
+"""
+
+
+def get_subject_id(interest):
+    """标记记录中的条目ID（没有id字段时从链接中解析）"""
+    subject = interest.get("subject") or {}
+    if subject.get("id"):
+        return str(subject["id"])
+    match = SUBJECT_ID_RE.search(subject.get("url") or "")
+    return match.group(1) if match else None
+
+
+class DetailCache:
+    def __init__(self, path=DETAIL_CACHE_FILE, ttl_days=DETAIL_TTL_DAYS, max_entries=DETAIL_CACHE_SIZE):
+        """
+        按条目ID缓存豆瓣条目详情（线程安全，首次使用时才打开文件）
+
+        Args:
+            path: 缓存文件路径，为空时仅保存在内存中
+            ttl_days: 缓存有效期（天）
+            max_entries: 最多缓存的条目数，超过时按最近使用时间淘汰
+        """
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max(1, max_entries)
+        self._conn = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            try:
+                conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+                conn.executescript(SCHEMA)
+            except sqlite3.DatabaseError as e:
+                print(f"警告: 读取条目详情缓存失败，将重建: {e}")
+                conn = sqlite3.connect(":memory:", check_same_thread=False)
+                conn.executescript(SCHEMA)
+            self._size = conn.execute("SELECT COUNT(*) FROM details").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        """返回 (详情, 是否未过期)，没有缓存时返回 (None, False)"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT fetched_at, data FROM details WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, False
+            conn.execute("UPDATE details SET accessed_at = ? WHERE key = ?", (now, key))
+        fetched_at, data = row
+        return json.loads(data), now - fetched_at < self.ttl
+
+    def put(self, key, detail):
+        """保存详情，超过容量时淘汰最久未使用的条目"""
+        now = time.time()
+        data = json.dumps(detail, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            conn = self._connect()
+            exists = conn.execute("SELECT 1 FROM details WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO details (key, fetched_at, accessed_at, data) VALUES (?, ?, ?, ?)",
+                (key, now, now, data),
+            )
+            if not exists:
+                self._size += 1
+            if self._size > self.max_entries:
+                conn.execute(
+                    "DELETE FROM details WHERE key IN "
+                    "(SELECT key FROM details ORDER BY accessed_at LIMIT ?)",
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
+
+    def save(self):
+        """写入缓存文件"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def close(self):
+        """关闭缓存文件"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+
+class DetailEnricher:
+    def __init__(self, fetch_detail, cache, concurrency=DETAIL_CONCURRENCY):
+        """
+        为标记记录补充豆瓣条目详情（interest["detail"]）
+
+        Args:
+            fetch_detail: fetch_detail(type_, subject_id) 请求条目详情
+            cache: DetailCache
+            concurrency: 同时请求详情的最大数量
+        """
+        self.fetch_detail = fetch_detail
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+
+    def enrich(self, type_, subjects, keys, is_new):
+        """逐条产出补充了详情的标记记录
+
+        缓存未过期时直接使用缓存；只有新条目（is_new(interest)为真）和缓存已过期的条目
+        才请求豆瓣，请求并发进行，因此产出顺序可能与输入不同。获取失败时使用过期的缓存
+        （没有时不补充详情）。缓存只保留keys中的字段。
+        """
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="douban-detail")
+        pending = {}
+        try:
+            for interest in subjects:
+                subject_id = get_subject_id(interest)
+                if not subject_id:
+                    yield interest
+                    continue
+                key = f"{type_}:{subject_id}"
+                detail, fresh = self.cache.get(key)
+                if fresh or (detail is None and not is_new(interest)):
+                    yield dict(interest, detail=detail) if detail else interest
+                    continue
+
+                # 最多领先消费者两倍并发数的请求
+                while len(pending) >= self.concurrency * 2:
+                    yield from self._collect(pending, FIRST_COMPLETED)
+                future = pool.submit(self.fetch_detail, type_, subject_id)
+                pending[future] = (interest, key, detail, keys)
+                yield from self._collect(pending, None)
+
+            while pending:
+                yield from self._collect(pending, FIRST_COMPLETED)
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+            self.cache.save()
+
+    def _collect(self, pending, return_when):
+        """产出已完成的请求（return_when为None时不等待）"""
+        if return_when is None:
+            done = [future for future in pending if future.done()]
+        else:
+            done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            interest, key, stale, keys = pending.pop(future)
+            try:
+                response = future.result()
+                detail = {name: response[name] for name in keys if response.get(name) is not None}
+                self.cache.put(key, detail)
+            except Exception as e:
+                print(f"获取条目详情失败: {(interest.get('subject') or {}).get('title')}: {e}")
+                detail = stale
+            yield dict(interest, detail=detail) if detail else interest
+
+    def close(self):
+        self.cache.close()
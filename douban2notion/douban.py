@@ -1,27 +1,37 @@
 import argparse
+import contextlib
+import functools
 import json
 import os
-import re
-import pendulum
-from retrying import retry
-import requests
-
-from douban2notion.notion_helper import NotionHelper
-from douban2notion.config import (
-    movie_properties_type_dict, 
-    book_properties_type_dict,
-    movie_status_mapping,
-    book_status_mapping,
-    rating_mapping,
-    movie_type_mapping
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from douban2notion.backoff import HTTPStatusError, retry_request
+from douban2notion.mapper import get_mapper
+from douban2notion.metrics import metrics
+from douban2notion.notion_helper import NOTION_CREATE_PROPERTIES, NOTION_WORKERS, NotionHelper
+from douban2notion.pipeline import BackgroundIterator
+from douban2notion.ratelimit import get_host_limiter, get_host_throttle
+from douban2notion.state import DEFAULT_STATE_FILE, SyncState
+from douban2notion.sync import ORPHAN_MODES, ORPHAN_THRESHOLD, sync_media
+from douban2notion.tracing import add_span, start_tracing, stop_tracing, traced
+from douban2notion.transport import (
+    DOUBAN_TIMEOUT,
+    close_transports,
+    configure_douban_session,
+    get_douban_session,
+    get_notion_transport,
 )
-from douban2notion.utils import get_properties, get_property_value, get_icon, extract_database_id, tz
-from dotenv import load_dotenv
+from douban2notion.utils import extract_database_id
 
-load_dotenv()
+# 子命令（plan/apply、multi、watch、snapshot）和条目详情用到的模块在对应函数中才导入，
+# 只运行sync或--help时不加载它们
 
 # 豆瓣API配置
 DOUBAN_API_HOST = os.getenv("DOUBAN_API_HOST", "frodo.douban.com")
+# API根地址（可指向本地的模拟服务器，见benchmarks）
+DOUBAN_API_URL = os.getenv("DOUBAN_API_URL", f"https://{DOUBAN_API_HOST}").rstrip("/")
 DOUBAN_API_KEY = os.getenv("DOUBAN_API_KEY", "0ac44ae016490db2204ce0a042db2916")
 AUTH_TOKEN = os.getenv("AUTH_TOKEN")
 
@@ -33,383 +43,820 @@ headers = {
 }
 
 
-@retry(stop_max_attempt_number=3, wait_fixed=5000)
-def fetch_subjects(user, type_, status):
-    """从豆瓣获取用户的电影或书籍数据"""
-    if not AUTH_TOKEN:
-        print("警告: AUTH_TOKEN 未设置，可能会导致请求失败")
+# 每页条数
+PAGE_SIZE = 50
+# 并发抓取的最大线程数，以及同一数据流（用户、类型、状态）相邻请求的最小间隔（秒）
+DOUBAN_CONCURRENCY = int(os.getenv("DOUBAN_CONCURRENCY", "4"))
+DOUBAN_DELAY = float(os.getenv("DOUBAN_DELAY", "0.5"))
+# 所有数据流（包括条目详情和多用户模式下的各用户）合计每秒最多请求豆瓣的次数，0表示不限
+DOUBAN_HOST_RATE = float(os.getenv("DOUBAN_HOST_RATE", "4"))
+
+
+def throttle_douban(delay, stream):
+    """等待数据流的礼貌间隔，再取整个豆瓣主机的令牌"""
+    get_host_throttle(DOUBAN_API_HOST, delay, stream).acquire()
+    get_host_limiter(DOUBAN_API_HOST, DOUBAN_HOST_RATE).acquire()
+
+
+def _page_span_args(user, type_, status, start, *args, **kwargs):
+    return {"type": type_, "status": status, "start": start}
+
+
+@traced("douban.fetch_page", "douban", _page_span_args)
+@retry_request(DOUBAN_API_HOST)
+def fetch_page(user, type_, status, start, delay=DOUBAN_DELAY):
+    """从豆瓣获取一页标记记录（失败时只重试这一页）"""
+    url = f"{DOUBAN_API_URL}/api/v2/user/{user}/interests"
+    params = {
+        "type": type_,
+        "count": PAGE_SIZE,
+        "status": status,
+        "start": start,
+        "apiKey": DOUBAN_API_KEY,
+    }
     
-    offset = 0
-    page = 0
-    url = f"https://{DOUBAN_API_HOST}/api/v2/user/{user}/interests"
-    total = 0
-    results = []
-    
-    while True:
-        params = {
-            "type": type_,
-            "count": 50,
-            "status": status,
-            "start": offset,
-            "apiKey": DOUBAN_API_KEY,
-        }
-        
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.ok:
-            response_data = response.json()
-            interests = response_data.get("interests", [])
-            if len(interests) == 0:
-                break
-            results.extend(interests)
-            page += 1
-            offset = page * 50
-        else:
-            print(f"请求失败: {response.status_code}")
-            print(f"响应内容: {response.text}")
-            print(f"请求URL: {url}")
-            print(f"请求参数: {params}")
-            print(f"请求头: {headers}")
-            break
+    throttle_douban(delay, (user, type_, status))
+    response = get_douban_session().get(url, headers=headers, params=params, timeout=DOUBAN_TIMEOUT)
     
-    if results:
-        print(f"获取 {type_} ({status}) {len(results)} 条记录")
+    if not response.ok:
+        print(f"请求失败: {response.status_code}")
+        print(f"响应内容: {response.text}")
+        print(f"请求URL: {url}")
+        print(f"请求参数: {params}")
+        print(f"请求头: {headers}")
+        # 部分结果会推进同步位置而漏掉未取到的记录，因此不能跳过失败的页
+        raise HTTPStatusError(response.status_code, f"豆瓣请求失败: {response.status_code}", response.headers)
     
-    return results
+    return response.json()
 
 
-def sync_movies(douban_name, notion_helper):
-    """同步电影数据到Notion"""
-    print("开始同步电影数据...")
-    
-    # 验证数据库结构
-    movie_db_name = notion_helper.get_database_name(notion_helper.movie_database_id)
-    if movie_db_name != "影视":
-        print(f"警告: 电影数据库名称为 '{movie_db_name}'，建议改为 '影视'")
-    
-    notion_helper.verify_database_structure(notion_helper.movie_database_id, movie_properties_type_dict)
+def _detail_span_args(type_, subject_id, *args, **kwargs):
+    return {"type": type_, "subject_id": subject_id}
+
+
+@traced("douban.fetch_detail", "douban", _detail_span_args)
+@retry_request(DOUBAN_API_HOST)
+def fetch_subject_detail(type_, subject_id, delay=DOUBAN_DELAY):
+    """获取豆瓣条目详情（完整简介、片长、国家/地区、ISBN、出版社等）"""
+    url = f"{DOUBAN_API_URL}/api/v2/{type_}/{subject_id}"
     
-    # 获取现有Notion数据
-    notion_movies = notion_helper.query_all(database_id=notion_helper.movie_database_id)
-    notion_movie_dict = {}
+    throttle_douban(delay, "detail")
+    response = get_douban_session().get(url, headers=headers, params={"apiKey": DOUBAN_API_KEY}, timeout=DOUBAN_TIMEOUT)
     
-    for page in notion_movies:
-        movie_data = {}
-        for key, value in page.get("properties", {}).items():
-            movie_data[key] = get_property_value(value)
-        
-        douban_link = movie_data.get("豆瓣链接")
-        if douban_link:
-            notion_movie_dict[douban_link] = {
-                "data": movie_data,
-                "page_id": page.get("id")
-            }
-    
-    print(f"Notion中现有 {len(notion_movie_dict)} 部电影")
-    
-    # 获取豆瓣数据
-    douban_movies = []
-    for status in movie_status_mapping.keys():
-        douban_movies.extend(fetch_subjects(douban_name, "movie", status))
-    
-    print(f"豆瓣中共有 {len(douban_movies)} 部电影")
-    
-    # 处理每部电影
-    for result in douban_movies:
-        if not result:
-            continue
-            
-        subject = result.get("subject", {})
-        movie = {}
-        
-        # 基本信息
-        movie["名称"] = subject.get("title", "")
-        movie["豆瓣链接"] = subject.get("url", "")
-        movie["状态"] = movie_status_mapping.get(result.get("status"), "")
-        
-        # 看完日期
-        create_time = result.get("create_time")
-        if create_time:
-            create_time = pendulum.parse(create_time, tz=tz)
-            movie["看完日期"] = create_time.int_timestamp
-        
-        # 评分
-        rating_data = result.get("rating")
-        if rating_data:
-            rating_value = rating_data.get("value")
-            if rating_value and rating_value > 0:
-                movie["豆瓣评分/自评"] = rating_mapping.get(rating_value, rating_value)
-        
-        # 导演
-        if subject.get("directors"):
-            directors = [d.get("name", "") for d in subject.get("directors", [])]
-            movie["导演/演讲人"] = ", ".join(directors)
-        
-        # 分类
-        if subject.get("genres"):
-            movie["标签"] = subject.get("genres")
-        
-        # 类型
-        subject_type = subject.get("type", "")
-        movie["类型"] = movie_type_mapping.get(subject_type, subject_type)
-        
-        # 上映日期
-        pubdates = subject.get("pubdate", [])
-        if pubdates and len(pubdates) > 0:
-            # 取第一个上映日期
-            first_pubdate = pubdates[0]
-            # 提取日期部分（去除地点信息）
-            date_match = re.search(r'(\d{4}-\d{2}-\d{2})', first_pubdate)
-            if date_match:
-                movie["上映日期"] = date_match.group(1)
-            else:
-                # 如果只有年份，尝试提取年份
-                year_match = re.search(r'(\d{4})', first_pubdate)
-                if year_match:
-                    movie["上映日期"] = f"{year_match.group(1)}-01-01"
-                else:
-                    movie["上映日期"] = ""
-        else:
-            # 尝试从year字段获取年份
-            year = subject.get("year")
-            if year:
-                movie["上映日期"] = f"{year}-01-01"
-            else:
-                movie["上映日期"] = ""
-        
-        # 封面
-        if subject.get("pic", {}).get("normal"):
-            cover_url = subject.get("pic", {}).get("normal")
-            if not cover_url.endswith('.webp'):
-                cover_url = cover_url.rsplit('.', 1)[0] + '.webp'
-            movie["封面"] = cover_url
-        
-        # 检查是否需要更新或创建
-        douban_link = movie.get("豆瓣链接")
-        if douban_link in notion_movie_dict:
-            # 检查是否需要更新
-            existing_data = notion_movie_dict[douban_link]["data"]
-            needs_update = False
-            
-            for key, new_value in movie.items():
-                existing_value = existing_data.get(key)
-                if key == "看完日期":
-                    # 对于日期类型，需要特殊处理
-                    if isinstance(new_value, int) and existing_value:
-                        existing_timestamp = pendulum.parse(existing_value, tz=tz).int_timestamp
-                        if existing_timestamp != new_value:
-                            needs_update = True
-                            break
-                elif existing_value != new_value:
-                    needs_update = True
-                    break
-            
-            if needs_update:
-                print(f"更新电影: {movie['名称']}")
-                properties = get_properties(movie, movie_properties_type_dict)
-                notion_helper.update_page(
-                    page_id=notion_movie_dict[douban_link]["page_id"],
-                    properties=properties
-                )
-            else:
-                print(f"跳过电影: {movie['名称']}")
-        else:
-            # 创建新记录
-            print(f"添加电影: {movie['名称']}")
-            properties = get_properties(movie, movie_properties_type_dict)
-            parent = {
-                "database_id": notion_helper.movie_database_id,
-                "type": "database_id",
-            }
-            
-            icon = None
-            if movie.get("封面"):
-                icon = get_icon(movie["封面"])
-                
-            notion_helper.create_page(
-                parent=parent, 
-                properties=properties, 
-                icon=icon
-            )
+    if not response.ok:
+        raise HTTPStatusError(response.status_code, f"豆瓣条目详情请求失败: {response.status_code}", response.headers)
+    return response.json()
 
 
-def sync_books(douban_name, notion_helper):
-    """同步书籍数据到Notion"""
-    print("开始同步书籍数据...")
+def iter_subject_pages(user, streams, since_map=None, concurrency=DOUBAN_CONCURRENCY, delay=DOUBAN_DELAY, pool=None):
+    """并发获取多个(类型, 状态)的标记记录，每取到一页就产出 ((type_, status), start, interests)
+
+    所有流共用一个线程池，每个流分别遵守礼貌间隔。全量模式下首页返回total后，
+    每个流最多同时获取concurrency页（包括已完成、尚未产出的页），每产出一页才提交下一页，
+    消费者停下时获取也随之停下；增量模式下逐页获取，翻到只包含旧记录的一页即停止。
+    各页按完成顺序产出，指定since的流只产出比since更新的记录。
+    """
+    if not AUTH_TOKEN:
+        print("警告: AUTH_TOKEN 未设置，可能会导致请求失败")
     
-    # 验证数据库结构
-    book_db_name = notion_helper.get_database_name(notion_helper.book_database_id)
-    if book_db_name != "书籍":
-        print(f"警告: 书籍数据库名称为 '{book_db_name}'，建议改为 '书籍'")
+    since_map = since_map or {}
+    counts = {stream: 0 for stream in streams}
+    frontier = {}
+    pending = {}
+    # 全量模式下各流尚未提交的页，以及已提交、尚未产出的页数
+    remaining = {}
+    in_flight = {stream: 0 for stream in streams}
+    window = max(1, concurrency)
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="douban-fetch")
     
-    notion_helper.verify_database_structure(notion_helper.book_database_id, book_properties_type_dict)
+    fetch_started = time.perf_counter()
+    phase = ",".join(sorted({stream[0] for stream in streams})) + ".douban_fetch"
     
-    # 获取现有Notion数据
-    notion_books = notion_helper.query_all(database_id=notion_helper.book_database_id)
-    notion_book_dict = {}
+    def submit(stream, start):
+        future = pool.submit(fetch_page, user, stream[0], stream[1], start, delay)
+        pending[future] = (stream, start)
+        in_flight[stream] += 1
+        frontier[stream] = max(frontier.get(stream, 0), start)
     
-    for page in notion_books:
-        book_data = {}
-        for key, value in page.get("properties", {}).items():
-            book_data[key] = get_property_value(value)
-        
-        douban_link = book_data.get("豆瓣链接")
-        if douban_link:
-            notion_book_dict[douban_link] = {
-                "data": book_data,
-                "page_id": page.get("id")
-            }
-    
-    print(f"Notion中现有 {len(notion_book_dict)} 本书籍")
-    
-    # 获取豆瓣数据
-    douban_books = []
-    for status in book_status_mapping.keys():
-        douban_books.extend(fetch_subjects(douban_name, "book", status))
-    
-    print(f"豆瓣中共有 {len(douban_books)} 本书籍")
-    
-    # 处理每本书籍
-    for result in douban_books:
-        if not result:
-            continue
-            
-        subject = result.get("subject", {})
-        book = {}
-        
-        # 基本信息
-        book["名称"] = subject.get("title", "")
-        book["豆瓣链接"] = subject.get("url", "")
-        book["状态"] = book_status_mapping.get(result.get("status"), "")
-        
-        # 添加日期
-        create_time = result.get("create_time")
-        if create_time:
-            create_time = pendulum.parse(create_time, tz=tz)
-            book["添加日期"] = create_time.int_timestamp
-        
-        # 评分
-        rating_data = result.get("rating")
-        if rating_data:
-            rating_value = rating_data.get("value")
-            if rating_value and rating_value > 0:
-                book["豆瓣评分"] = rating_mapping.get(rating_value, rating_value)
-        
-        # 作者
-        if subject.get("author"):
-            authors = [a for a in subject.get("author", [])]
-            book["书籍作者"] = ", ".join(authors)
-        
-        # 简介
-        intro_text = subject.get("intro", "")
-        if len(intro_text) > 2000:
-            book["书籍简介"] = intro_text[:1997] + "..."
-        else:
-            book["书籍简介"] = intro_text
-        
-        # 封面
-        if subject.get("pic", {}).get("large"):
-            book["书籍封面"] = subject.get("pic", {}).get("large")
+    def top_up(stream):
+        offsets = remaining.get(stream)
+        while offsets and in_flight[stream] < window:
+            submit(stream, offsets.pop())
+    
+    try:
+        for stream in streams:
+            submit(stream, 0)
         
-        # 检查是否需要更新或创建
-        douban_link = book.get("豆瓣链接")
-        if douban_link in notion_book_dict:
-            # 检查是否需要更新
-            existing_data = notion_book_dict[douban_link]["data"]
-            needs_update = False
-            
-            for key, new_value in book.items():
-                existing_value = existing_data.get(key)
-                if key == "添加日期":
-                    # 对于日期类型，需要特殊处理
-                    if isinstance(new_value, int) and existing_value:
-                        existing_timestamp = pendulum.parse(existing_value, tz=tz).int_timestamp
-                        if existing_timestamp != new_value:
-                            needs_update = True
-                            break
-                elif existing_value != new_value:
-                    needs_update = True
-                    break
-            
-            if needs_update:
-                print(f"更新书籍: {book['名称']}")
-                properties = get_properties(book, book_properties_type_dict)
-                notion_helper.update_page(
-                    page_id=notion_book_dict[douban_link]["page_id"],
-                    properties=properties
-                )
-            else:
-                print(f"跳过书籍: {book['名称']}")
-        else:
-            # 创建新记录
-            print(f"添加书籍: {book['名称']}")
-            properties = get_properties(book, book_properties_type_dict)
-            parent = {
-                "database_id": notion_helper.book_database_id,
-                "type": "database_id",
-            }
-            
-            icon = None
-            if book.get("书籍封面"):
-                icon = get_icon(book["书籍封面"])
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stream, start = pending.pop(future)
+                in_flight[stream] -= 1
+                response_data = future.result()
+                interests = response_data.get("interests", [])
+                total = response_data.get("total")
+                since = since_map.get(stream)
                 
-            notion_helper.create_page(
-                parent=parent, 
-                properties=properties, 
-                icon=icon
-            )
+                page_items = interests
+                if since:
+                    page_items = [i for i in interests if (i.get("create_time") or "") > since]
+                
+                # 先提交下一页再交出本页，处理本页时下一页已在获取中
+                if page_items:
+                    if start == 0 and total and not since:
+                        # 已知总数，之后每产出一页补提交一页
+                        remaining[stream] = list(range(PAGE_SIZE, total, PAGE_SIZE))[::-1]
+                    elif stream not in remaining and start == frontier[stream]:
+                        next_start = start + PAGE_SIZE
+                        if not total or next_start < total:
+                            submit(stream, next_start)
+                
+                top_up(stream)
+                
+                counts[stream] += len(page_items)
+                yield stream, start, page_items
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_pool:
+            pool.shutdown(wait=False)
+        fetch_finished = time.perf_counter()
+        metrics.add_time(phase, fetch_finished - fetch_started, sum(counts.values()))
+        add_span(phase, fetch_started, fetch_finished)
+    
+    for stream, count in counts.items():
+        if count:
+            print(f"获取 {stream[0]} ({stream[1]}) {count} 条记录")
+
+
+def fetch_all_subjects(user, streams, since_map=None, concurrency=DOUBAN_CONCURRENCY, delay=DOUBAN_DELAY):
+    """并发获取多个(类型, 状态)的全部标记记录
+
+    Returns:
+        {(type_, status): [interest, ...]}，每个流内保持豆瓣返回的顺序
+    """
+    pages = {stream: {} for stream in streams}
+    for stream, start, interests in iter_subject_pages(user, streams, since_map, concurrency, delay):
+        pages[stream][start] = interests
+    
+    results = {}
+    for stream in streams:
+        results[stream] = []
+        for start in sorted(pages[stream]):
+            results[stream].extend(pages[stream][start])
+    return results
+
+
+def fetch_subjects(user, type_, status, since=None):
+    """从豆瓣获取用户的电影或书籍数据
+
+    豆瓣按create_time倒序返回标记记录。指定since时只返回比since更新的记录，
+    并在某一页全部早于since时停止翻页。
+    """
+    stream = (type_, status)
+    return fetch_all_subjects(user, [stream], {stream: since})[stream]
+
+
+def get_type_streams(type_, state=None, full=False):
+    """某类型全部状态的数据流，以及增量模式下各流上次同步的create_time"""
+    streams = [(type_, status) for status in get_mapper(type_).status_mapping]
+    since_map = {}
+    if state is not None and not full:
+        for stream in streams:
+            since_map[stream] = state.get_watermark(*stream)
+    return streams, since_map
+
+
+def iter_type_subjects(douban_name, type_, state=None, full=False, concurrency=DOUBAN_CONCURRENCY, delay=DOUBAN_DELAY, pool=None):
+    """逐条产出某类型全部状态的标记记录（按页到达顺序），增量模式下从上次同步的create_time处停止"""
+    streams, since_map = get_type_streams(type_, state, full)
+    return _flatten_pages(iter_subject_pages(douban_name, streams, since_map, concurrency, delay, pool))
+
+
+def _flatten_pages(pages):
+    for _, _, interests in pages:
+        yield from interests
+
+
+def open_subject_stream(douban_name, type_, state=None, full=False, concurrency=DOUBAN_CONCURRENCY, delay=DOUBAN_DELAY, pool=None, maxsize=200):
+    """在后台开始获取某类型的标记记录，返回可迭代的有界流
+
+    后台最多缓冲maxsize条记录，消费者处理时后续页面仍在获取。
+    """
+    streams, since_map = get_type_streams(type_, state, full)
+    pages = iter_subject_pages(douban_name, streams, since_map, concurrency, delay, pool)
+    return BackgroundIterator(_flatten_pages(pages), maxsize=maxsize)
+
+
+def open_snapshot_stream(path, type_, state=None, full=False, maxsize=200):
+    """在后台从快照文件逐条读取某类型的标记记录，返回可迭代的有界流
+
+    增量模式下与从豆瓣获取时一样，只产出比上次同步的create_time更新的记录。
+    """
+    from douban2notion.snapshot import iter_snapshot
+
+    _, since_map = get_type_streams(type_, state, full)
+    return BackgroundIterator(iter_snapshot(path, type_, since_map), maxsize=maxsize)
+
+
+def sync_movies(douban_name, notion_helper, state=None, full=False, douban_movies=None, reconcile=False, refresh_edited=False):
+    """同步电影数据到Notion"""
+    if douban_movies is None:
+        douban_movies = iter_type_subjects(douban_name, "movie", state, full)
+    sync_media(get_mapper("movie"), notion_helper, douban_movies, state, reconcile, refresh_edited)
+
 
+def sync_books(douban_name, notion_helper, state=None, full=False, douban_books=None, reconcile=False, refresh_edited=False):
+    """同步书籍数据到Notion"""
+    if douban_books is None:
+        douban_books = iter_type_subjects(douban_name, "book", state, full)
+    sync_media(get_mapper("book"), notion_helper, douban_books, state, reconcile, refresh_edited)
+
+
+# 运行指标的输出位置（"-"表示标准输出）
+METRICS_JSON = os.getenv("METRICS_JSON", "-")
+METRICS_PROM = os.getenv("METRICS_PROM")
+
+# 命令行子命令（不指定时为sync，兼容旧的用法）
+COMMANDS = ("sync", "plan", "apply", "multi", "watch", "snapshot")
 
-def main():
-    """主函数"""
-    parser = argparse.ArgumentParser(description="同步豆瓣数据到Notion")
+
+def add_sync_arguments(parser):
+    """sync和plan共用的参数"""
     parser.add_argument("--movie-db", required=True, help="电影数据库URL或ID")
     parser.add_argument("--book-db", required=True, help="书籍数据库URL或ID")
     parser.add_argument("--douban-user", help="豆瓣用户名（默认从环境变量DOUBAN_NAME获取）")
+    parser.add_argument("--state-file", default=DEFAULT_STATE_FILE, help="本地同步状态文件路径")
+    add_sync_options(parser)
+
+
+def add_sync_options(parser):
+    """单用户和多用户模式共用的同步选项"""
     parser.add_argument("--type", choices=["movie", "book", "both"], default="both", help="同步类型")
-    
-    args = parser.parse_args()
-    
+    parser.add_argument("--full", action="store_true", help="忽略上次同步位置，全量扫描豆瓣数据")
+    parser.add_argument("--reconcile", action="store_true", help="忽略本地页面索引，全量查询Notion重新核对")
+    parser.add_argument("--refresh-edited", action="store_true", help="查询上次同步后在Notion中编辑过的页面并重新核对（会启用 --full）")
+    parser.add_argument("--concurrency", type=int, default=DOUBAN_CONCURRENCY, help="并发请求豆瓣的最大线程数")
+    parser.add_argument("--douban-delay", type=float, default=DOUBAN_DELAY, help="同一数据流相邻两次豆瓣请求的最小间隔（秒）")
+    parser.add_argument("--notion-workers", type=int, default=NOTION_WORKERS, help="并发写入Notion的线程数")
+    parser.add_argument(
+        "--detail-cache", help="豆瓣条目详情的本地缓存文件路径（默认取环境变量DOUBAN_DETAIL_CACHE或.douban2notion_details.db）"
+    )
+    parser.add_argument("--no-details", action="store_true", help="不请求豆瓣条目详情（不写入简介、片长等详情属性）")
+    parser.add_argument(
+        "--create-properties", action="store_true", default=NOTION_CREATE_PROPERTIES,
+        help="数据库缺少必需的属性时自动创建（状态等类型的属性仍需手动创建）",
+    )
+    add_metrics_arguments(parser)
+
+
+def add_snapshot_argument(parser):
+    """从快照读取豆瓣数据的参数（sync和plan）"""
+    parser.add_argument(
+        "--from-snapshot",
+        help="从snapshot保存的快照文件读取豆瓣标记记录，不请求豆瓣的标记列表（条目详情仍使用缓存或请求豆瓣）",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="快照中的豆瓣用户与 --douban-user 不同时仍然同步（写入的是快照中用户的标记）",
+    )
+
+
+def add_orphan_arguments(parser):
+    """清理豆瓣中已取消标记的页面的参数（sync和multi）"""
+    parser.add_argument(
+        "--orphans", choices=ORPHAN_MODES,
+        help="同步后归档（archive）或标记（flag）豆瓣中已取消标记的页面，需要全量获取（自动启用--full）",
+    )
+    parser.add_argument(
+        "--orphan-threshold", type=float, default=ORPHAN_THRESHOLD,
+        help="要处理的页面超过索引中页面数的此百分比时不做任何修改",
+    )
+
+
+def add_metrics_arguments(parser):
+    """运行指标和跟踪的输出参数"""
+    parser.add_argument("--metrics-json", default=METRICS_JSON, help="运行指标的JSON汇总保存路径（默认输出到标准输出）")
+    parser.add_argument("--metrics-prom", default=METRICS_PROM, help="以Prometheus textfile collector格式保存运行指标的路径")
+    parser.add_argument("--trace", help="把每个请求和同步阶段记录为span，以Chrome trace-event格式保存到此路径")
+
+
+def emit_metrics(args):
+    """运行结束时输出各阶段耗时、请求数、重试次数和请求耗时分位数"""
+    try:
+        if args.metrics_json == "-":
+            print("运行指标:")
+        metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    except OSError as e:
+        print(f"保存运行指标失败: {e}")
+
+
+def build_parser(command):
+    """构建子命令的参数解析器"""
+    if command == "plan":
+        parser = argparse.ArgumentParser(prog="douban2notion plan", description="比较豆瓣与Notion数据，生成同步计划（不写入）")
+        add_sync_arguments(parser)
+        add_snapshot_argument(parser)
+        parser.add_argument("--out", default="plan.json", help="计划文件路径（- 表示输出到标准输出）")
+    elif command == "apply":
+        parser = argparse.ArgumentParser(prog="douban2notion apply", description="执行plan生成的同步计划")
+        parser.add_argument("plan", help="计划文件路径（- 表示从标准输入读取）")
+        parser.add_argument("--state-file", default=DEFAULT_STATE_FILE, help="本地同步状态文件路径")
+        parser.add_argument("--notion-workers", type=int, default=NOTION_WORKERS, help="并发写入Notion的线程数")
+        add_metrics_arguments(parser)
+    elif command == "multi":
+        from douban2notion.tenants import DEFAULT_STATE_DIR
+
+        parser = argparse.ArgumentParser(prog="douban2notion multi", description="在一个进程中同步配置文件中的多个豆瓣用户")
+        parser.add_argument("--config", required=True, help="多用户配置文件（JSON）")
+        parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR, help="各用户状态文件所在的目录")
+        parser.add_argument("--parallel", type=int, default=1, help="同时同步的用户数")
+        add_sync_options(parser)
+        add_orphan_arguments(parser)
+    elif command == "watch":
+        from douban2notion.watch import WATCH_HEALTH_HOST, WATCH_HEALTH_PORT, WATCH_MAX_INTERVAL, WATCH_MIN_INTERVAL
+
+        parser = argparse.ArgumentParser(prog="douban2notion watch", description="常驻运行，按自适应间隔轮询豆瓣并只写入变化")
+        add_sync_arguments(parser)
+        parser.add_argument("--min-interval", type=float, default=WATCH_MIN_INTERVAL, help="有新变化后的轮询间隔（秒）")
+        parser.add_argument("--max-interval", type=float, default=WATCH_MAX_INTERVAL, help="空闲时轮询间隔的上限（秒）")
+        parser.add_argument("--health-host", default=WATCH_HEALTH_HOST, help="健康检查接口的监听地址")
+        parser.add_argument("--health-port", type=int, default=WATCH_HEALTH_PORT, help="健康检查接口的端口（不指定时不启动）")
+        parser.add_argument("--max-cycles", type=int, default=0, help="同步指定轮数后退出（0表示一直运行）")
+    elif command == "snapshot":
+        parser = argparse.ArgumentParser(
+            prog="douban2notion snapshot", description="全量获取豆瓣用户的标记记录，保存为快照（gzip压缩的JSON Lines）"
+        )
+        parser.add_argument("--douban-user", help="豆瓣用户名（默认从环境变量DOUBAN_NAME获取）")
+        parser.add_argument("--type", choices=["movie", "book", "both"], default="both", help="获取的类型")
+        parser.add_argument("--out", default="snapshot.jsonl.gz", help="快照文件路径")
+        parser.add_argument("--concurrency", type=int, default=DOUBAN_CONCURRENCY, help="并发请求豆瓣的最大线程数")
+        parser.add_argument("--douban-delay", type=float, default=DOUBAN_DELAY, help="同一数据流相邻两次豆瓣请求的最小间隔（秒）")
+        add_metrics_arguments(parser)
+    else:
+        parser = argparse.ArgumentParser(
+            description="同步豆瓣数据到Notion（子命令: sync、plan、apply、multi、watch、snapshot，默认sync）"
+        )
+        add_sync_arguments(parser)
+        add_snapshot_argument(parser)
+        add_orphan_arguments(parser)
+    return parser
+
+
+def open_sync(args):
+    """解析数据库和用户，初始化NotionHelper和本地状态，失败时返回None"""
     # 提取数据库ID
     try:
         movie_db_id = extract_database_id(args.movie_db)
         book_db_id = extract_database_id(args.book_db)
     except Exception as e:
         print(f"错误: {e}")
-        return
+        return None
+    
+    # 从快照读取时先检查快照文件，未指定用户名时使用快照中的用户
+    snapshot_user = None
+    snapshot = getattr(args, "from_snapshot", None)
+    if snapshot:
+        from douban2notion.snapshot import read_snapshot_header
+
+        try:
+            header = read_snapshot_header(snapshot)
+        except Exception as e:
+            print(f"读取快照文件失败: {e}")
+            return None
+        total = sum(sum(counts.values()) for counts in header["counts"].values())
+        print(f"使用快照 {snapshot}（{header['fetched_at']} 获取，共 {total} 条记录）")
+        snapshot_user = header["douban_user"]
+        # 快照中的用户与指定的用户不同时，写入的会是另一个人的标记
+        if args.douban_user and args.douban_user != snapshot_user:
+            if not args.force:
+                print(
+                    f"错误: 快照属于豆瓣用户 {snapshot_user}，与 --douban-user {args.douban_user} 不同"
+                    "（确认无误请加 --force）"
+                )
+                return None
+            print(f"警告: 快照属于豆瓣用户 {snapshot_user}，与 --douban-user {args.douban_user} 不同，仍然同步")
     
     # 获取豆瓣用户名
-    douban_user = args.douban_user or os.getenv("DOUBAN_NAME")
+    douban_user = args.douban_user or snapshot_user or os.getenv("DOUBAN_NAME")
     if not douban_user:
         print("错误: 请提供豆瓣用户名（通过 --douban-user 参数或 DOUBAN_NAME 环境变量）")
-        return
+        return None
     
     # 初始化NotionHelper
     try:
-        notion_helper = NotionHelper(movie_db_id, book_db_id)
+        notion_helper = NotionHelper(
+            movie_db_id, book_db_id, workers=args.notion_workers, create_properties=args.create_properties
+        )
     except Exception as e:
         print(f"初始化Notion连接失败: {e}")
+        return None
+    
+    return douban_user, notion_helper, SyncState(args.state_file)
+
+
+def open_enricher(args):
+    """创建条目详情补充器（指定--no-details时返回None）"""
+    if args.no_details:
+        return None
+    from douban2notion.details import DETAIL_CACHE_FILE, DETAIL_CONCURRENCY, DetailCache, DetailEnricher
+
+    fetch_detail = functools.partial(fetch_subject_detail, delay=args.douban_delay)
+    return DetailEnricher(fetch_detail, DetailCache(args.detail_cache or DETAIL_CACHE_FILE), DETAIL_CONCURRENCY)
+
+
+def get_douban_pool_size(args):
+    """豆瓣会话的连接池大小：并发获取列表的线程数加上并发获取详情的数量"""
+    if args.no_details:
+        return args.concurrency
+    from douban2notion.details import DETAIL_CONCURRENCY
+
+    return args.concurrency + DETAIL_CONCURRENCY
+
+
+def check_full_options(args):
+    """清理孤儿页面和重新核对编辑过的页面需要完整的豆瓣数据，因此强制全量获取
+
+    增量获取只返回比上次同步更新的记录，在Notion中编辑过的旧页面不会被重新比较，
+    而同步位置仍会推进，这些修改就再也不会被核对。
+    """
+    if args.full:
+        return
+    if getattr(args, "orphans", None):
+        print("清理豆瓣中已取消标记的页面需要全量获取豆瓣数据，已启用 --full")
+        args.full = True
+    elif args.refresh_edited:
+        print("重新核对Notion中编辑过的页面需要全量获取豆瓣数据，已启用 --full")
+        args.full = True
+
+
+def get_types(type_):
+    return ["movie", "book"] if type_ == "both" else [type_]
+
+
+def run_phases(args, douban_user, state, run_phase, action="同步", pool=None):
+    """在后台并发获取各类型的豆瓣数据，并按类型依次调用run_phase(type_, subjects)
+
+    Args:
+        pool: 共用的豆瓣获取线程池，为None时创建并配置本次专用的会话和线程池
+
+    Returns:
+        成功完成的类型列表
+    """
+    types = get_types(args.type)
+    fetch_pool = pool
+    if fetch_pool is None:
+        configure_douban_session(pool_size=get_douban_pool_size(args))
+        fetch_pool = ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="douban-fetch")
+    snapshot = getattr(args, "from_snapshot", None)
+    subjects = {}
+    for type_ in types:
+        if snapshot:
+            subjects[type_] = open_snapshot_stream(snapshot, type_, state, args.full)
+        else:
+            subjects[type_] = open_subject_stream(
+                douban_user, type_, state, args.full, args.concurrency, args.douban_delay, fetch_pool
+            )
+    
+    done = []
+    for type_ in types:
+        label = get_mapper(type_).label
+        try:
+            with metrics.timer(f"{type_}.total"):
+                run_phase(type_, subjects[type_])
+            done.append(type_)
+        except Exception as e:
+            print(f"{label}数据{action}失败: {e}")
+        finally:
+            subjects[type_].close()
+    
+    if pool is None:
+        fetch_pool.shutdown(wait=False)
+    return done
+
+
+def run_sync(args):
+    """获取豆瓣数据并同步到Notion"""
+    opened = open_sync(args)
+    if opened is None:
         return
+    douban_user, notion_helper, state = opened
+    enricher = open_enricher(args)
+    check_full_options(args)
     
     print(f"开始同步豆瓣用户 '{douban_user}' 的数据...")
     
-    # 执行同步
-    if args.type in ["movie", "both"]:
+    # 所有类型和状态的豆瓣数据在后台并发获取，边获取边同步
+    def run_phase(type_, subjects):
+        sync_media(
+            get_mapper(type_), notion_helper, subjects, state, args.reconcile, args.refresh_edited, enricher,
+            args.orphans, args.orphan_threshold,
+        )
+        state.save()
+        print(f"{get_mapper(type_).label}数据同步完成!")
+    
+    run_phases(args, douban_user, state, run_phase)
+    
+    notion_helper.close()
+    state.close()
+    if enricher is not None:
+        enricher.close()
+    close_transports()
+    print("数据同步完成!")
+    emit_metrics(args)
+
+
+def sync_tenant(tenant, args, pool, enricher=None):
+    """同步多用户配置中的一个用户，返回是否全部成功"""
+    from douban2notion.tenants import get_tenant_state_file, get_tenant_type
+
+    name = tenant["name"]
+    type_ = get_tenant_type(tenant, args.type)
+    if type_ is None:
+        print(f"[{name}] 没有 {args.type} 类型的数据库，跳过")
+        return True
+    tenant_args = argparse.Namespace(**{**vars(args), "type": type_})
+    notion_helper = NotionHelper(
+        tenant["movie_db"], tenant["book_db"], workers=args.notion_workers, token=tenant["token"],
+        create_properties=args.create_properties,
+    )
+    state = SyncState(get_tenant_state_file(args.state_dir, name))
+    print(f"[{name}] 开始同步豆瓣用户 '{tenant['douban_user']}' 的数据...")
+    
+    def run_phase(type_, subjects):
+        sync_media(
+            get_mapper(type_), notion_helper, subjects, state, args.reconcile, args.refresh_edited, enricher,
+            args.orphans, args.orphan_threshold,
+        )
+        state.save()
+        print(f"[{name}] {get_mapper(type_).label}数据同步完成!")
+    
+    try:
+        with metrics.timer(f"tenant.{name}"):
+            done = run_phases(tenant_args, tenant["douban_user"], state, run_phase, pool=pool)
+    finally:
+        notion_helper.close()
+        state.close()
+    return len(done) == len(get_types(tenant_args.type))
+
+
+def run_multi(args):
+    """在一个进程中同步多个豆瓣用户
+
+    所有用户共用豆瓣会话、豆瓣获取线程池、条目详情缓存和Notion连接池；同一集成令牌的
+    用户共用一个限速器。单个用户失败不影响其他用户。
+    """
+    from douban2notion.tenants import load_tenants
+
+    try:
+        tenants = load_tenants(args.config)
+    except Exception as e:
+        print(f"读取多用户配置失败: {e}")
+        return 1
+    
+    check_full_options(args)
+    parallel = max(1, min(args.parallel, len(tenants)))
+    print(f"开始同步 {len(tenants)} 个用户（同时 {parallel} 个）...")
+    configure_douban_session(pool_size=get_douban_pool_size(args))
+    # 按同时进行的用户数预先创建共享的Notion连接池
+    get_notion_transport(pool_size=parallel * (args.notion_workers + 1))
+    fetch_pool = ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="douban-fetch")
+    enricher = open_enricher(args)
+    
+    def run_tenant(tenant):
         try:
-            sync_movies(douban_user, notion_helper)
-            print("电影数据同步完成!")
+            return sync_tenant(tenant, args, fetch_pool, enricher)
         except Exception as e:
-            print(f"电影数据同步失败: {e}")
+            print(f"[{tenant['name']}] 同步失败: {e}")
+            return False
+    
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="tenant") as tenant_pool:
+        results = list(tenant_pool.map(run_tenant, tenants))
     
-    if args.type in ["book", "both"]:
+    fetch_pool.shutdown(wait=False)
+    if enricher is not None:
+        enricher.close()
+    close_transports()
+    failed = [tenant["name"] for tenant, ok in zip(tenants, results) if not ok]
+    print(f"多用户同步完成: 成功 {len(tenants) - len(failed)} 个，失败 {len(failed)} 个")
+    if failed:
+        print(f"失败的用户: {', '.join(failed)}")
+    emit_metrics(args)
+    return 1 if failed else 0
+
+
+def run_watch(args):
+    """常驻运行：按自适应间隔轮询豆瓣，Notion索引和同步位置常驻内存，每轮只写入变化"""
+    from douban2notion.watch import AdaptiveInterval, Watcher, install_signal_handlers
+
+    opened = open_sync(args)
+    if opened is None:
+        return
+    douban_user, notion_helper, state = opened
+    check_full_options(args)
+    
+    types = get_types(args.type)
+    watermarks = {}
+    if not args.full:
+        for type_ in types:
+            _, since_map = get_type_streams(type_, state)
+            watermarks[type_] = {status: create_time for (_, status), create_time in since_map.items() if create_time}
+    
+    configure_douban_session(pool_size=get_douban_pool_size(args))
+    fetch_pool = ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="douban-fetch")
+    enricher = open_enricher(args)
+    
+    def fetch(type_, type_watermarks):
+        streams, _ = get_type_streams(type_)
+        since_map = {(type_, status): create_time for status, create_time in type_watermarks.items()}
+        pages = iter_subject_pages(douban_user, streams, since_map, args.concurrency, args.douban_delay, fetch_pool)
+        return BackgroundIterator(_flatten_pages(pages))
+    
+    def on_cycle():
+        if args.metrics_prom:
+            try:
+                metrics.write_prometheus(args.metrics_prom)
+            except OSError as e:
+                print(f"保存运行指标失败: {e}")
+    
+    watcher = Watcher(notion_helper, fetch, types, state, watermarks, args.reconcile, args.refresh_edited, enricher)
+    health_server = None
+    if args.health_port is not None:
+        from douban2notion.health import start_health_server
+
+        health_server = start_health_server(watcher, args.health_host, args.health_port)
+        host, port = health_server.server_address[:2]
+        print(f"健康检查接口: http://{host}:{port}/healthz")
+    previous_handlers = install_signal_handlers(watcher)
+    
+    print(f"开始持续同步豆瓣用户 '{douban_user}' 的数据...")
+    try:
+        watcher.run(AdaptiveInterval(args.min_interval, args.max_interval), args.max_cycles, on_cycle)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        if health_server is not None:
+            health_server.shutdown()
+            health_server.server_close()
+        notion_helper.close()
+        state.close()
+        if enricher is not None:
+            enricher.close()
+        fetch_pool.shutdown(wait=False)
+        close_transports()
+    print("持续同步已停止")
+    emit_metrics(args)
+
+
+def run_plan(args):
+    """获取豆瓣数据并与Notion比较，只生成同步计划"""
+    from douban2notion.plan import save_plan
+
+    if args.out == "-":
+        # 计划输出到标准输出时，进度信息和运行指标改为输出到标准错误
+        with contextlib.redirect_stdout(sys.stderr):
+            plan = make_plan(args)
+        if plan is not None:
+            save_plan(plan, args.out)
+        return
+    
+    plan = make_plan(args)
+    if plan is not None:
+        save_plan(plan, args.out)
+        print(f"同步计划已保存到 {args.out}")
+
+
+def make_plan(args):
+    """比较豆瓣与Notion数据，返回同步计划（没有可用结果时返回None）"""
+    from douban2notion.plan import build_plan, plan_media
+
+    opened = open_sync(args)
+    if opened is None:
+        return None
+    douban_user, notion_helper, state = opened
+    enricher = open_enricher(args)
+    check_full_options(args)
+    
+    print(f"开始比较豆瓣用户 '{douban_user}' 的数据...")
+    
+    phases = []
+    
+    def run_phase(type_, subjects):
+        phases.append(plan_media(
+            get_mapper(type_), notion_helper, subjects, state, args.reconcile, args.refresh_edited, enricher
+        ))
+    
+    run_phases(args, douban_user, state, run_phase, action="比较")
+    
+    notion_helper.close()
+    state.close()
+    if enricher is not None:
+        enricher.close()
+    close_transports()
+    emit_metrics(args)
+    return build_plan(douban_user, phases) if phases else None
+
+
+def run_apply(args):
+    """执行同步计划"""
+    from douban2notion.plan import apply_plan_phase, load_plan
+
+    try:
+        plan = load_plan(args.plan)
+    except Exception as e:
+        print(f"读取计划文件失败: {e}")
+        return
+    
+    try:
+        notion_helper = NotionHelper(None, None, workers=args.notion_workers)
+    except Exception as e:
+        print(f"初始化Notion连接失败: {e}")
+        return
+    
+    state = SyncState(args.state_file)
+    
+    for phase_plan in plan["phases"]:
+        label = get_mapper(phase_plan["type"]).label
         try:
-            sync_books(douban_user, notion_helper)
-            print("书籍数据同步完成!")
+            with metrics.timer(f"{phase_plan['type']}.total"):
+                apply_plan_phase(notion_helper, phase_plan, state)
+            state.save()
+            print(f"{label}数据写入完成!")
         except Exception as e:
-            print(f"书籍数据同步失败: {e}")
+            print(f"{label}数据写入失败: {e}")
     
-    print("数据同步完成!")
+    notion_helper.close()
+    state.close()
+    close_transports()
+    print("同步计划执行完成!")
+    emit_metrics(args)
+
+
+def run_snapshot(args):
+    """全量获取豆瓣标记记录并保存为快照，返回退出码"""
+    from douban2notion.snapshot import write_snapshot
+
+    douban_user = args.douban_user or os.getenv("DOUBAN_NAME")
+    if not douban_user:
+        print("错误: 请提供豆瓣用户名（通过 --douban-user 参数或 DOUBAN_NAME 环境变量）")
+        return 1
+    
+    streams = [stream for type_ in get_types(args.type) for stream in get_type_streams(type_)[0]]
+    configure_douban_session(pool_size=args.concurrency)
+    print(f"开始获取豆瓣用户 '{douban_user}' 的全部标记记录...")
+    try:
+        pages = iter_subject_pages(douban_user, streams, concurrency=args.concurrency, delay=args.douban_delay)
+        header = write_snapshot(args.out, douban_user, pages)
+    except Exception as e:
+        print(f"保存快照失败: {e}")
+        return 1
+    finally:
+        close_transports()
+    
+    total = sum(sum(counts.values()) for counts in header["counts"].values())
+    print(f"快照已保存到 {args.out}，共 {total} 条记录")
+    emit_metrics(args)
+    return 0
+
+
+def main(argv=None):
+    """主函数（不读取.env，命令行入口为cli.main）"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = "sync"
+    if argv and argv[0] in COMMANDS:
+        command = argv.pop(0)
+    
+    args = build_parser(command).parse_args(argv)
+    exit_code = 0
+    if args.trace:
+        start_tracing()
+    try:
+        if command == "plan":
+            run_plan(args)
+        elif command == "apply":
+            run_apply(args)
+        elif command == "multi":
+            exit_code = run_multi(args)
+        elif command == "watch":
+            run_watch(args)
+        elif command == "snapshot":
+            exit_code = run_snapshot(args)
+        else:
+            run_sync(args)
+    finally:
+        if args.trace:
+            try:
+                stop_tracing(args.trace)
+                print(f"跟踪数据已保存到 {args.trace}", file=sys.stderr)
+            except OSError as e:
+                print(f"保存跟踪数据失败: {e}", file=sys.stderr)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,42 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from douban2notion.metrics import metrics
+from douban2notion.watch import WATCH_HEALTH_HOST
+
+# 健康检查接口单独成模块，只在watch指定了端口时才导入http.server
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        status = self.server.watcher.get_status()
+        if path in ("", "/healthz", "/status"):
+            code = 200 if status["healthy"] or path == "/status" else 503
+            self._send(code, json.dumps(status, ensure_ascii=False), "application/json; charset=utf-8")
+        elif path == "/metrics":
+            self._send(200, metrics.format_prometheus(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+    def _send(self, code, text, content_type):
+        data = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_health_server(watcher, host=WATCH_HEALTH_HOST, port=0):
+    """在后台线程中启动健康检查接口（/healthz、/status、/metrics），返回服务器"""
+    server = ThreadingHTTPServer((host, port), _HealthHandler)
+    server.daemon_threads = True
+    server.watcher = watcher
+    thread = threading.Thread(target=server.serve_forever, name="watch-health", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,193 @@
+import re
+
+from douban2notion.config import media_specs, rating_mapping
+from douban2notion.utils import PROPERTY_ENCODERS, to_date_key, truncate_text
+
+# 上映日期中的完整日期和年份
+RELEASE_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+YEAR_RE = re.compile(r"(\d{4})")
+# 片长、页数等文本中的第一个数字
+NUMBER_RE = re.compile(r"\d+")
+
+
+def to_rating(value):
+    """豆瓣5星评分转10分制"""
+    if value and value > 0:
+        return rating_mapping.get(value, value)
+    return None
+
+
+def join_names(people):
+    """拼接导演等人员名称"""
+    if not people:
+        return None
+    return ", ".join(person.get("name", "") for person in people)
+
+
+def join(values):
+    """拼接作者等字符串列表"""
+    if not values:
+        return None
+    return ", ".join(values)
+
+
+def to_release_date(subject):
+    """取第一个上映日期（去除地点信息），只有年份时取当年1月1日"""
+    pubdates = subject.get("pubdate") if subject else None
+    if pubdates:
+        first_pubdate = pubdates[0]
+        date_match = RELEASE_DATE_RE.search(first_pubdate)
+        if date_match:
+            return date_match.group(1)
+        year_match = YEAR_RE.search(first_pubdate)
+        if year_match:
+            return f"{year_match.group(1)}-01-01"
+        return ""
+    # 尝试从year字段获取年份
+    year = subject.get("year") if subject else None
+    if year:
+        return f"{year}-01-01"
+    return ""
+
+
+def to_first_number(value):
+    """取文本（或列表第一项）中的第一个数字，如 ["142分钟"] → 142"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    match = NUMBER_RE.search(str(value)) if value is not None else None
+    return int(match.group(0)) if match else None
+
+
+def to_webp(cover_url):
+    """封面地址改为webp格式"""
+    if not cover_url:
+        return None
+    if not cover_url.endswith(".webp"):
+        cover_url = cover_url.rsplit(".", 1)[0] + ".webp"
+    return cover_url
+
+
+# 取值后的转换（取不到值时不会调用）
+TRANSFORMS = {
+    "date": to_date_key,
+    "rating": to_rating,
+    "join_names": join_names,
+    "join": join,
+    "release_date": to_release_date,
+    "webp": to_webp,
+    "first_number": to_first_number,
+    "truncate": truncate_text,
+}
+
+
+def compile_path(source):
+    """把"subject.pic.normal"形式的路径编译为取值函数"""
+    keys = tuple(source.split("."))
+    
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda data: data.get(key)
+    
+    def getter(data):
+        for key in keys:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data
+    
+    return getter
+
+
+def compile_field(rule):
+    """把单个属性的取值规则编译为 interest → 值 的函数"""
+    getter = compile_path(rule["source"])
+    mapping = rule.get("map")
+    keep_unmapped = rule.get("keep_unmapped", False)
+    transform = TRANSFORMS[rule["transform"]] if "transform" in rule else None
+    
+    def extract(interest):
+        value = getter(interest)
+        if value is not None and mapping is not None:
+            value = mapping.get(value, value if keep_unmapped else None)
+        if value is not None and transform is not None:
+            value = transform(value)
+        return value
+    
+    return extract
+
+
+class MediaMapper:
+    def __init__(self, type_, spec):
+        """
+        编译某媒体类型的同步规则
+
+        Args:
+            type_: 豆瓣类型（movie/book）
+            spec: config.media_specs中的规则
+        """
+        self.type_ = type_
+        self.label = spec["label"]
+        self.unit = spec["unit"]
+        self.database_name = spec["database_name"]
+        self.database_attr = spec["database_attr"]
+        self.status_mapping = spec["status_mapping"]
+        self.properties_type_dict = spec["properties"]
+        self.detail_properties_type_dict = spec.get("detail_properties", {})
+        self.icon_field = spec.get("icon")
+        self.get_link = compile_field(spec["fields"]["豆瓣链接"])
+        # 条目详情中用到的字段（缓存详情时只保留这些字段）
+        self.detail_keys = sorted({
+            rule["source"].split(".")[1]
+            for rule in spec["fields"].values()
+            if rule["source"].startswith("detail.")
+        })
+        
+        self._defaults = []
+        self._optional = []
+        for key, rule in spec["fields"].items():
+            extract = compile_field(rule)
+            if "default" in rule:
+                self._defaults.append((key, extract, rule["default"]))
+            else:
+                self._optional.append((key, extract))
+        
+        self._encoders = [
+            (key, PROPERTY_ENCODERS[property_type])
+            for key, property_type in {**self.properties_type_dict, **self.detail_properties_type_dict}.items()
+            if property_type in PROPERTY_ENCODERS
+        ]
+
+    def transform(self, interest):
+        """豆瓣标记记录 → 条目数据 {属性名: 值}"""
+        item = {}
+        for key, extract, default in self._defaults:
+            value = extract(interest)
+            item[key] = default if value is None else value
+        for key, extract in self._optional:
+            value = extract(interest)
+            if value:
+                item[key] = value
+        return item
+
+    def encode(self, item):
+        """条目数据 → Notion属性（与utils.get_properties结果相同）"""
+        properties = {}
+        for key, encoder in self._encoders:
+            value = item.get(key)
+            if value is None:
+                continue
+            prop = encoder(value)
+            if prop:
+                properties[key] = prop
+        return properties
+
+
+_mappers = {}
+
+
+def get_mapper(type_):
+    """获取编译好的媒体类型规则（每种类型只编译一次）"""
+    mapper = _mappers.get(type_)
+    if mapper is None:
+        mapper = _mappers[type_] = MediaMapper(type_, media_specs[type_])
+    return mapper
@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from douban2notion.tracing import add_span
+
+# 请求耗时直方图的分桶上限（秒），用于Prometheus输出
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PERCENTILES = (50, 90, 99)
+# 每个接口最多保留的耗时样本数（蓄水池抽样，用于计算分位数），常驻运行时内存不随请求数增长
+LATENCY_SAMPLES = int(os.getenv("METRICS_LATENCY_SAMPLES", "1024"))
+PROMETHEUS_PREFIX = "douban2notion"
+
+
+class LatencyStats:
+    def __init__(self, max_samples=LATENCY_SAMPLES):
+        """
+        某个接口的请求耗时：精确的次数、总和、最大值和分桶计数，以及有上限的抽样样本
+
+        Args:
+            max_samples: 最多保留的样本数，超过后按蓄水池抽样替换
+        """
+        self.max_samples = max(1, max_samples)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        # 落在各个LATENCY_BUCKETS分桶中的请求数（不累积，超过最大分桶的只计入count）
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self.samples[slot] = seconds
+
+    def summary(self):
+        """次数、分位数（按抽样样本估计）和最大值"""
+        summary = get_latency_summary(self.samples)
+        if self.count:
+            summary["count"] = self.count
+            summary["max"] = round(self.max, 4)
+        return summary
+
+
+class Metrics:
+    def __init__(self):
+        """
+        线程安全的运行指标
+
+        记录各阶段的累计耗时、按接口和状态码统计的请求数、
+        各主机的重试次数，以及每个接口的请求耗时（分桶计数和有上限的样本，内存占用固定）。
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.phases = defaultdict(lambda: [0.0, 0])
+            self.requests = defaultdict(int)
+            self.latencies = defaultdict(LatencyStats)
+            self.retries = defaultdict(int)
+
+    def add_time(self, phase, seconds, count=1):
+        """累加某阶段的耗时"""
+        with self._lock:
+            entry = self.phases[phase]
+            entry[0] += seconds
+            entry[1] += count
+
+    @contextmanager
+    def timer(self, phase):
+        """记录with块的耗时（开启跟踪时同时记录为span）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add_time(phase, end - start)
+            add_span(phase, start, end)
+
+    def record_request(self, endpoint, status, seconds):
+        """记录一次HTTP请求（status为状态码，没有响应时为"error"）"""
+        with self._lock:
+            self.requests[(endpoint, str(status))] += 1
+            self.latencies[endpoint].add(seconds)
+
+    def record_retry(self, host, reason):
+        """记录一次重试（reason为状态码或"network"）"""
+        with self._lock:
+            self.retries[(host or "unknown", str(reason))] += 1
+
+    def summary(self):
+        """汇总为可JSON序列化的字典"""
+        with self._lock:
+            phases = {
+                name: {"seconds": round(seconds, 3), "count": count}
+                for name, (seconds, count) in sorted(self.phases.items())
+            }
+            requests = defaultdict(dict)
+            for (endpoint, status), count in sorted(self.requests.items()):
+                requests[endpoint][status] = count
+            retries = defaultdict(dict)
+            for (host, reason), count in sorted(self.retries.items()):
+                retries[host][reason] = count
+            latency = {endpoint: stats.summary() for endpoint, stats in sorted(self.latencies.items())}
+        return {
+            "started_at": self.started_at,
+            "wall_seconds": round(time.time() - self.started_at, 3),
+            "phases": phases,
+            "requests": dict(requests),
+            "retries": dict(retries),
+            "latency": latency,
+        }
+
+    def write_json(self, path):
+        """把汇总写成JSON文件（path为"-"时输出到标准输出）"""
+        data = json.dumps(self.summary(), ensure_ascii=False, indent=2)
+        if path == "-":
+            print(data)
+        else:
+            _write_atomic(path, data + "\n")
+
+    def write_prometheus(self, path):
+        """写成Prometheus node_exporter textfile collector格式（原子替换）"""
+        _write_atomic(path, self.format_prometheus())
+
+    def format_prometheus(self):
+        prefix = PROMETHEUS_PREFIX
+        with self._lock:
+            phases = dict(self.phases)
+            requests = dict(self.requests)
+            retries = dict(self.retries)
+            latencies = {
+                endpoint: (list(stats.buckets), stats.count, stats.sum) for endpoint, stats in self.latencies.items()
+            }
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds 本次运行结束的时间",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {time.time():.3f}",
+            f"# HELP {prefix}_run_duration_seconds 本次运行的总耗时",
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f"{prefix}_run_duration_seconds {time.time() - self.started_at:.3f}",
+            f"# HELP {prefix}_phase_seconds 各阶段的累计耗时",
+            f"# TYPE {prefix}_phase_seconds gauge",
+        ]
+        for name, (seconds, _) in sorted(phases.items()):
+            lines.append(f'{prefix}_phase_seconds{{phase="{_escape(name)}"}} {seconds:.6f}')
+        lines += [
+            f"# HELP {prefix}_requests_total 按接口和状态码统计的HTTP请求数",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for (endpoint, status), count in sorted(requests.items()):
+            lines.append(f'{prefix}_requests_total{{endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+        lines += [
+            f"# HELP {prefix}_retries_total 按主机和原因统计的重试次数",
+            f"# TYPE {prefix}_retries_total counter",
+        ]
+        for (host, reason), count in sorted(retries.items()):
+            lines.append(f'{prefix}_retries_total{{host="{_escape(host)}",reason="{reason}"}} {count}')
+        lines += [
+            f"# HELP {prefix}_request_duration_seconds HTTP请求耗时",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        for endpoint, (buckets, total, seconds) in sorted(latencies.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+            count = 0
+            for bucket, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                count += bucket_count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{label},le="{bucket}"}} {count}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{label}}} {seconds:.6f}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{label}}} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def timed_iter(iterable, phase, registry=None):
+    """逐个产出iterable的元素，并把等待元素的时间累计到phase（如等待后台获取的豆瓣数据）"""
+    registry = registry or metrics
+    iterator = iter(iterable)
+    total = 0.0
+    count = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                total += time.perf_counter() - start
+            count += 1
+            yield item
+    finally:
+        registry.add_time(phase, total, count)
+
+
+def get_latency_summary(samples):
+    """请求耗时的次数、分位数和最大值（秒）"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    summary = {"count": len(ordered)}
+    for percentile in PERCENTILES:
+        index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+        summary[f"p{percentile}"] = round(ordered[index], 4)
+    summary["max"] = round(ordered[-1], 4)
+    return summary
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# 进程内共享的指标
+metrics = Metrics()
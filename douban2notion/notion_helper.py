@@ -1,81 +1,270 @@
-import logging
 import os
 import re
+import threading
 
-from notion_client import Client
-from retrying import retry
-
+from douban2notion.backoff import retry_request
+from douban2notion.ratelimit import TokenBucket
+from douban2notion.tracing import traced
+from douban2notion.transport import create_notion_client
 from douban2notion.utils import get_icon, get_title
+from douban2notion.writer import WriteEngine
+
+NOTION_API_HOST = "api.notion.com"
+# Notion API平均限速约为每秒3次请求
+NOTION_RATE = float(os.getenv("NOTION_RATE", "3"))
+NOTION_WORKERS = int(os.getenv("NOTION_WORKERS", "3"))
+# 数据库缺少属性时自动创建（不支持通过API创建的类型除外）
+NOTION_CREATE_PROPERTIES = os.getenv("NOTION_CREATE_PROPERTIES", "").lower() in ("1", "true", "yes")
+# 无法通过API新建的属性类型，需要在Notion中手动创建
+MANUAL_PROPERTY_TYPES = ("title", "status")
+
+
+# 按集成令牌共享的限速器（Notion按令牌限速）
+_token_limiters = {}
+_token_limiters_lock = threading.Lock()
+
+
+def get_token_limiter(token, rate=NOTION_RATE):
+    """获取某集成令牌共享的限速器，同一令牌的所有NotionHelper共用一个令牌桶（按首次调用时的rate创建）"""
+    with _token_limiters_lock:
+        limiter = _token_limiters.get(token)
+        if limiter is None:
+            limiter = TokenBucket(rate, capacity=max(1, int(rate or 1)))
+            _token_limiters[token] = limiter
+        return limiter
 
 
 class NotionHelper:
-    def __init__(self, movie_database_id, book_database_id):
+    def __init__(self, movie_database_id, book_database_id, workers=NOTION_WORKERS, rate=NOTION_RATE, token=None,
+                 create_properties=NOTION_CREATE_PROPERTIES):
         """
         初始化NotionHelper
         
         Args:
             movie_database_id: 电影数据库ID
             book_database_id: 书籍数据库ID
+            workers: 并发写入的线程数
+            rate: 同一集成令牌的所有Notion请求共享的每秒请求数上限
+            token: Notion集成令牌，默认使用NOTION_TOKEN环境变量
+            create_properties: 验证数据库结构时自动创建缺少的属性
         """
-        notion_token = os.getenv("NOTION_TOKEN")
+        notion_token = token or os.getenv("NOTION_TOKEN")
         if not notion_token:
             raise Exception("请设置NOTION_TOKEN环境变量")
             
-        self.client = Client(auth=notion_token, log_level=logging.ERROR)
+        # 连接池大小与并发写入线程数一致，另加一个给主线程的查询
+        self.client = create_notion_client(notion_token, pool_size=workers + 1)
         self.movie_database_id = movie_database_id
         self.book_database_id = book_database_id
-        self.__cache = {}
+        self.create_properties = create_properties
+        # 本次运行中获取过的数据库结构 {database_id: schema}
+        self.schemas = {}
+        self.limiter = get_token_limiter(notion_token, rate)
+        self.writer = WriteEngine(workers)
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @traced("notion.create_page", "notion")
+    @retry_request(NOTION_API_HOST)
     def create_page(self, parent, properties, icon=None):
         """创建页面"""
+        self.limiter.acquire()
         return self.client.pages.create(
             parent=parent, properties=properties, icon=icon
         )
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @traced("notion.update_page", "notion")
+    @retry_request(NOTION_API_HOST)
     def update_page(self, page_id, properties):
         """更新页面"""
+        self.limiter.acquire()
         return self.client.pages.update(page_id=page_id, properties=properties)
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
-    def query_all(self, database_id):
-        """查询数据库所有数据"""
-        results = []
+    @traced("notion.archive_page", "notion")
+    @retry_request(NOTION_API_HOST)
+    def archive_page(self, page_id):
+        """归档页面（可在Notion的回收站中恢复）"""
+        self.limiter.acquire()
+        return self.client.pages.update(page_id=page_id, archived=True)
+
+    def submit_create_page(self, parent, properties, icon=None, context=None):
+        """将创建页面加入写入队列，由线程池在限速下执行（每次重试都会重新取令牌）"""
+        return self.writer.submit(context, self.create_page, parent, properties, icon)
+
+    def submit_update_page(self, page_id, properties, context=None):
+        """将更新页面加入写入队列"""
+        return self.writer.submit(context, self.update_page, page_id, properties)
+
+    def submit_archive_page(self, page_id, context=None):
+        """将归档页面加入写入队列"""
+        return self.writer.submit(context, self.archive_page, page_id)
+
+    def submit_write(self, fn, *args, context=None, **kwargs):
+        """将由多个请求组成的写入（如失败后回退的更新）加入写入队列"""
+        return self.writer.submit(context, fn, *args, **kwargs)
+
+    def poll_writes(self):
+        """不阻塞地返回已完成写入的WriteResult"""
+        return self.writer.poll()
+
+    def wait_writes(self):
+        """等待队列中的写入完成，逐个返回WriteResult"""
+        return self.writer.drain()
+
+    def close(self):
+        """等待并关闭写入线程池"""
+        self.writer.close()
+
+    @traced("notion.query_all", "notion")
+    def query_all(self, database_id, filter_properties=None, filter=None):
+        """查询数据库所有数据，返回页面列表（大数据库请用iter_query逐个处理）"""
+        return list(self.iter_query(database_id, filter_properties, filter))
+
+    def iter_query(self, database_id, filter_properties=None, filter=None):
+        """逐个产出数据库中的页面（每页单独重试，失败后从当前游标继续）
+
+        一次只保留当前一页（最多100个页面）的原始数据，调用方处理完即可释放。
+
+        Args:
+            database_id: 数据库ID
+            filter_properties: 只返回这些属性ID（为空时返回全部属性）
+            filter: 服务端过滤条件
+        """
         has_more = True
         start_cursor = None
+        kwargs = {}
+        if filter_properties:
+            kwargs["filter_properties"] = list(filter_properties)
+        if filter:
+            kwargs["filter"] = filter
         
         while has_more:
-            response = self.client.databases.query(
-                database_id=database_id,
-                start_cursor=start_cursor,
-                page_size=100
-            )
-            results.extend(response.get("results", []))
+            response = self.query_page(database_id, start_cursor, **kwargs)
             has_more = response.get("has_more", False)
             start_cursor = response.get("next_cursor")
-            
-        return results
+            results = response.pop("results", [])
+            del response
+            # 倒序后从尾部取出：保持原顺序，产出后列表不再引用该页面
+            results.reverse()
+            while results:
+                yield results.pop()
+
+    @traced("notion.query_page", "notion")
+    @retry_request(NOTION_API_HOST)
+    def query_page(self, database_id, start_cursor=None, **kwargs):
+        """查询数据库的一页数据"""
+        self.limiter.acquire()
+        return self.client.databases.query(
+            database_id=database_id,
+            start_cursor=start_cursor,
+            page_size=100,
+            **kwargs
+        )
+
+    @traced("notion.find_page", "notion")
+    @retry_request(NOTION_API_HOST)
+    def find_page(self, database_id, property_name, url, filter_properties=None):
+        """按URL属性查询单个页面，未找到时返回None"""
+        self.limiter.acquire()
+        kwargs = {}
+        if filter_properties:
+            kwargs["filter_properties"] = list(filter_properties)
+        response = self.client.databases.query(
+            database_id=database_id,
+            filter={"property": property_name, "url": {"equals": url}},
+            page_size=1,
+            **kwargs
+        )
+        results = response.get("results", [])
+        return results[0] if results else None
+
+    @traced("notion.retrieve_database", "notion")
+    @retry_request(NOTION_API_HOST)
+    def retrieve_database(self, database_id):
+        """获取数据库信息"""
+        self.limiter.acquire()
+        return self.client.databases.retrieve(database_id=database_id)
+
+    @traced("notion.update_database", "notion")
+    @retry_request(NOTION_API_HOST)
+    def update_database(self, database_id, properties):
+        """更新数据库属性"""
+        self.limiter.acquire()
+        return self.client.databases.update(database_id=database_id, properties=properties)
+
+    def get_database_schema(self, database_id, refresh=False):
+        """获取数据库结构，每次运行每个数据库只请求一次
+
+        Returns:
+            {"title": 名称, "last_edited_time": ..., "properties": {属性名: {"id", "type"}}}
+        """
+        schema = self.schemas.get(database_id)
+        if schema is None or refresh:
+            schema = self.set_database_schema(database_id, self.retrieve_database(database_id))
+        return schema
+
+    def set_database_schema(self, database_id, database):
+        """记录数据库结构（database为Notion返回的数据库对象或get_database_schema的结果）"""
+        title = database.get("title", "")
+        if isinstance(title, list):
+            title = title[0].get("text", {}).get("content", "") if title else ""
+        schema = {
+            "title": title,
+            "last_edited_time": database.get("last_edited_time"),
+            "properties": {
+                name: {"id": prop.get("id"), "type": prop.get("type")}
+                for name, prop in database.get("properties", {}).items()
+            },
+        }
+        self.schemas[database_id] = schema
+        return schema
+
+    def get_property_id_map(self, database_id):
+        """已知的 {属性名: 属性ID}（未获取过数据库结构时为空）"""
+        schema = self.schemas.get(database_id)
+        if schema is None:
+            return {}
+        return {name: prop["id"] for name, prop in schema["properties"].items() if prop.get("id")}
+
+    def compact_properties(self, database_id, properties):
+        """写入时用属性ID代替属性名作为键（属性名多为中文，ID更短）"""
+        id_map = self.get_property_id_map(database_id)
+        if not id_map:
+            return properties
+        return {id_map.get(name, name): value for name, value in properties.items()}
+
+    def create_database_properties(self, database_id, properties_type_dict):
+        """用一次databases.update创建缺少的属性，返回更新后的数据库结构"""
+        manual = [name for name, prop_type in properties_type_dict.items() if prop_type in MANUAL_PROPERTY_TYPES]
+        if manual:
+            raise Exception(f"以下属性无法自动创建，请在Notion中手动添加: {', '.join(manual)}")
+        database = self.update_database(
+            database_id, {name: {prop_type: {}} for name, prop_type in properties_type_dict.items()}
+        )
+        print(f"已在数据库中创建属性: {', '.join(properties_type_dict)}")
+        return self.set_database_schema(database_id, database)
 
     def verify_database_structure(self, database_id, expected_properties):
-        """验证数据库结构是否符合要求"""
+        """验证数据库结构是否符合要求，返回 {属性名: {"id", "type"}}
+
+        create_properties为真时先创建缺少的属性。
+        """
         try:
-            database = self.client.databases.retrieve(database_id=database_id)
-            database_properties = database.get("properties", {})
+            database_properties = self.get_database_schema(database_id)["properties"]
             
-            missing_properties = []
+            missing_properties = {}
             for prop_name, prop_type in expected_properties.items():
                 if prop_name not in database_properties:
-                    missing_properties.append(prop_name)
+                    missing_properties[prop_name] = prop_type
                 else:
                     actual_type = database_properties[prop_name].get("type")
                     if actual_type != prop_type:
                         print(f"警告: 属性 '{prop_name}' 类型不匹配，期望: {prop_type}, 实际: {actual_type}")
             
             if missing_properties:
-                raise Exception(f"数据库缺少必需的属性: {', '.join(missing_properties)}")
+                if not self.create_properties:
+                    raise Exception(f"数据库缺少必需的属性: {', '.join(missing_properties)}")
+                database_properties = self.create_database_properties(database_id, missing_properties)["properties"]
                 
-            return True
+            return database_properties
             
         except Exception as e:
             raise Exception(f"验证数据库结构时出错: {str(e)}")
@@ -83,11 +272,7 @@ class NotionHelper:
     def get_database_name(self, database_id):
         """获取数据库名称"""
         try:
-            database = self.client.databases.retrieve(database_id=database_id)
-            title_list = database.get("title", [])
-            if title_list:
-                return title_list[0].get("text", {}).get("content", "")
-            return ""
+            return self.get_database_schema(database_id)["title"]
         except Exception as e:
             print(f"获取数据库名称失败: {str(e)}")
             return ""
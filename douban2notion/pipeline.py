@@ -0,0 +1,65 @@
+import queue
+import threading
+
+# 队列结束标记
+_DONE = object()
+
+
+class BackgroundIterator:
+    def __init__(self, iterable, maxsize=8):
+        """
+        在后台线程中迭代iterable，通过有界队列交给消费者
+
+        生产者最多领先消费者maxsize个元素，超过时阻塞等待，
+        因此内存占用与数据总量无关。生产者抛出的异常会在消费者处重新抛出。
+
+        Args:
+            iterable: 要在后台迭代的对象（通常是生成器）
+            maxsize: 队列容量
+        """
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iterable,), name="background-iterator", daemon=True)
+        self._thread.start()
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    break
+        except BaseException as e:
+            self._put(_Error(e))
+        else:
+            self._put(_DONE)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    def _put(self, item):
+        """放入队列，消费者关闭后放弃"""
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Error):
+                raise item.error
+            yield item
+
+    def close(self):
+        """通知生产者停止"""
+        self._stopped.set()
+
+
+class _Error:
+    def __init__(self, error):
+        self.error = error
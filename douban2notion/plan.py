@@ -0,0 +1,109 @@
+import json
+import sys
+from collections import Counter
+
+from douban2notion.mapper import get_mapper
+from douban2notion.metrics import metrics
+from douban2notion.sync import (
+    apply_operation,
+    iter_operations,
+    load_cached_schema,
+    prepare_phase,
+    record_writes,
+    update_watermarks,
+    wait_writes,
+)
+from douban2notion.utils import utc_now
+
+# 同步计划文件的格式版本
+PLAN_VERSION = 1
+PLAN_ACTIONS = ("create", "update", "noop")
+
+
+def plan_media(mapper, notion_helper, subjects, state=None, reconcile=False, refresh_edited=False, enricher=None):
+    """只读地比较豆瓣记录与Notion，返回某类型的同步计划（不写入Notion，也不修改本地状态）"""
+    label = mapper.label
+    print(f"开始比较{label}数据...")
+    phase = prepare_phase(mapper, notion_helper, state, reconcile, refresh_edited, read_only=True)
+
+    operations = []
+    for operation in iter_operations(mapper, notion_helper, phase, subjects, enricher):
+        # 数据库ID记录在计划的每个类型上
+        del operation["database_id"]
+        operations.append(operation)
+
+    summary = Counter(operation["action"] for operation in operations)
+    print(
+        f"豆瓣中共获取 {phase['count']} {mapper.unit}{label}："
+        f"新增 {summary['create']}，更新 {summary['update']}，无变化 {summary['noop']}"
+    )
+    return {
+        "type": mapper.type_,
+        "database_id": phase["database_id"],
+        "synced_at": phase["synced_at"],
+        "watermarks": phase["latest"],
+        "summary": {action: summary[action] for action in PLAN_ACTIONS},
+        "operations": operations,
+    }
+
+
+def build_plan(douban_user, phases):
+    """汇总各类型的计划"""
+    return {
+        "version": PLAN_VERSION,
+        "created_at": utc_now(),
+        "douban_user": douban_user,
+        "phases": phases,
+    }
+
+
+def save_plan(plan, path):
+    """把计划写成JSON文件（path为"-"时输出到标准输出）"""
+    if path == "-":
+        json.dump(plan, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+
+
+def load_plan(path):
+    """读取计划文件（path为"-"时从标准输入读取）"""
+    if path == "-":
+        plan = json.load(sys.stdin)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支持的计划文件版本: {plan.get('version')}")
+    return plan
+
+
+def apply_plan_phase(notion_helper, phase_plan, state=None):
+    """执行某类型的计划：所有写入并发提交，全部成功后才推进同步位置
+
+    本地索引中已有的页面不会重复创建，因此同一份计划重复执行是安全的。
+    """
+    mapper = get_mapper(phase_plan["type"])
+    label = mapper.label
+    database_id = phase_plan["database_id"]
+    print(f"开始写入{label}数据...")
+
+    known = {douban_link for douban_link, *_ in state.iter_pages(database_id)} if state is not None else set()
+    load_cached_schema(notion_helper, database_id, state)
+    counts = Counter()
+    failures = 0
+    for operation in phase_plan["operations"]:
+        operation = dict(operation, database_id=database_id)
+        if operation["action"] == "create" and operation["douban_link"] in known:
+            print(f"跳过{label}: {operation['name']}（已创建）")
+            continue
+        counts[operation["action"]] += 1
+        failures += record_writes(notion_helper.poll_writes(), label, state)
+        with metrics.timer(f"{mapper.type_}.write_submit"):
+            apply_operation(notion_helper, state, operation)
+
+    print(f"已提交 新增 {counts['create']}，更新 {counts['update']} {mapper.unit}{label}")
+    with metrics.timer(f"{mapper.type_}.write_drain"):
+        wait_writes(notion_helper, label, state, failures)
+    update_watermarks(state, mapper.type_, phase_plan["watermarks"], database_id, phase_plan["synced_at"])
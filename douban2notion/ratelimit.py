@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        """
+        初始化令牌桶（线程安全）
+
+        Args:
+            rate: 每秒补充的令牌数，为0或None时不限速
+            capacity: 桶容量，即允许的突发请求数
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取出一个令牌，令牌不足时阻塞等待"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 按 (主机, 每秒请求数) 共享的整个主机的限速器
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(host, rate):
+    """获取某主机所有数据流共用的限速器，每秒最多rate个请求（为0或None时不限速）
+
+    与各数据流的礼貌间隔叠加：每个请求先等待所在数据流的间隔，再取整个主机的令牌。
+    """
+    key = (host, rate)
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(key)
+        if limiter is None:
+            limiter = _host_limiters[key] = TokenBucket(rate, capacity=1)
+        return limiter
+
+
+# 按 (主机, 数据流, 间隔) 共享的礼貌间隔
+_host_throttles = {}
+_host_throttles_lock = threading.Lock()
+
+
+def get_host_throttle(host, delay, stream=None):
+    """获取某主机上某个数据流共享的限速器，同一数据流相邻两次请求至少间隔delay秒
+
+    各数据流分别限速，并发获取时总耗时取决于页数最多的流；
+    同一数据流以不同的delay调用时（如多用户各自的配置）使用各自的限速器。
+    """
+    key = (host, stream, delay)
+    with _host_throttles_lock:
+        throttle = _host_throttles.get(key)
+        if throttle is None:
+            throttle = TokenBucket(1 / delay if delay else None, capacity=1)
+            _host_throttles[key] = throttle
+        return throttle
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from douban2notion.utils import utc_now
+
+# 快照文件的格式版本
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, douban_user, pages, fetched_at=None):
+    """把iter_subject_pages产出的各页标记记录保存为gzip压缩的JSON Lines，返回文件头
+
+    第一行是文件头 {"version", "douban_user", "fetched_at", "counts": {类型: {状态: 条数}}}，
+    之后每行一条 {"type", "status", "interest"}。各状态的条数要获取完才知道，因此记录先逐页
+    写入临时文件，再与文件头一起压缩写入path（先写入path.tmp，完成后才替换），内存中不保留记录。
+    """
+    fetched_at = fetched_at or utc_now()
+    counts = {}
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        for (type_, status), _, interests in pages:
+            type_counts = counts.setdefault(type_, {})
+            type_counts[status] = type_counts.get(status, 0) + len(interests)
+            for interest in interests:
+                record = {"type": type_, "status": status, "interest": interest}
+                spool.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                spool.write("\n")
+
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "douban_user": douban_user,
+            "fetched_at": fetched_at,
+            "counts": counts,
+        }
+        spool.seek(0)
+        tmp_path = f"{path}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(json.dumps(header, ensure_ascii=False))
+                f.write("\n")
+                shutil.copyfileobj(spool, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return header
+
+
+def _parse_header(line):
+    header = json.loads(line) if line.strip() else {}
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照文件版本: {header.get('version')}")
+    return header
+
+
+def read_snapshot_header(path):
+    """读取快照的文件头（只解压第一行）"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return _parse_header(f.readline())
+
+
+def iter_snapshot(path, type_=None, since_map=None):
+    """逐行读取快照，产出type_类型的标记记录（不会把整个文件读入内存）
+
+    Args:
+        type_: 只产出此类型的记录，为None时产出全部
+        since_map: {(type_, status): create_time}，只产出比create_time更新的记录（与增量获取一致）
+    """
+    since_map = since_map or {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        _parse_header(f.readline())
+        for line in f:
+            record = json.loads(line)
+            if type_ is not None and record["type"] != type_:
+                continue
+            interest = record["interest"]
+            since = since_map.get((record["type"], record["status"]))
+            if since and (interest.get("create_time") or "") <= since:
+                continue
+            yield interest
@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+
+# 本地同步状态文件（单个SQLite文件，可在CI中缓存）
+DEFAULT_STATE_FILE = os.getenv("DOUBAN2NOTION_STATE", ".douban2notion_state.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    key TEXT PRIMARY KEY,
+    create_time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    database_id TEXT NOT NULL,
+    douban_link TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    fingerprint TEXT,
+    field_hashes TEXT,
+    PRIMARY KEY (database_id, douban_link)
+);
+"""
+
+
+class SyncState:
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        """
+        初始化本地同步状态
+
+        记录各(类型, 状态)已同步的最新create_time，以及每个数据库中
+        豆瓣链接 → page_id、最后写入属性的指纹和各属性的指纹。
+
+        Args:
+            path: 状态文件路径，为空时仅保存在内存中
+        """
+        self.path = path
+        try:
+            self.conn = sqlite3.connect(path or ":memory:")
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+        except sqlite3.DatabaseError as e:
+            print(f"警告: 读取状态文件失败，将重建: {e}")
+            self.conn = sqlite3.connect(":memory:")
+            self.conn.executescript(SCHEMA)
+            self.path = None
+
+    def _migrate(self):
+        """为旧版本的状态文件补充新增的列"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(pages)")}
+        if "field_hashes" not in columns:
+            self.conn.execute("ALTER TABLE pages ADD COLUMN field_hashes TEXT")
+            self.conn.commit()
+
+    def get_watermark(self, type_, status):
+        """获取某类型某状态下已同步的最新create_time"""
+        row = self.conn.execute(
+            "SELECT create_time FROM watermarks WHERE key = ?", (f"{type_}:{status}",)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, type_, status, create_time):
+        """记录某类型某状态下已同步的最新create_time"""
+        if not create_time:
+            return
+        current = self.get_watermark(type_, status)
+        if current is None or create_time > current:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks (key, create_time) VALUES (?, ?)",
+                (f"{type_}:{status}", create_time),
+            )
+
+    def get_meta(self, key):
+        """获取其他状态值"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        """记录其他状态值（随save一起落盘）"""
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def delete_meta(self, key):
+        """删除其他状态值"""
+        self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+
+    def has_pages(self, database_id):
+        """本地是否已有该数据库的页面索引"""
+        row = self.conn.execute(
+            "SELECT 1 FROM pages WHERE database_id = ? LIMIT 1", (database_id,)
+        ).fetchone()
+        return row is not None
+
+    def iter_pages(self, database_id):
+        """逐行产出数据库的页面索引 (豆瓣链接, page_id, fingerprint, field_hashes)，不在内存中另存一份"""
+        rows = self.conn.execute(
+            "SELECT douban_link, page_id, fingerprint, field_hashes FROM pages WHERE database_id = ?",
+            (database_id,),
+        )
+        for link, page_id, fingerprint, field_hashes in rows:
+            yield link, page_id, fingerprint, json.loads(field_hashes) if field_hashes else None
+
+    def get_pages(self, database_id):
+        """获取数据库的页面索引 {豆瓣链接: (page_id, fingerprint, field_hashes)}"""
+        return {
+            link: (page_id, fingerprint, field_hashes)
+            for link, page_id, fingerprint, field_hashes in self.iter_pages(database_id)
+        }
+
+    def set_page(self, database_id, douban_link, page_id, fingerprint=None, field_hashes=None, commit=True):
+        """记录一次成功写入（或与Notion核对后的结果），默认立即落盘"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (database_id, douban_link, page_id, fingerprint, field_hashes) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                database_id,
+                douban_link,
+                page_id,
+                fingerprint,
+                json.dumps(field_hashes, sort_keys=True) if field_hashes else None,
+            ),
+        )
+        if commit:
+            self.conn.commit()
+
+    def delete_page(self, database_id, douban_link):
+        """从页面索引中删除（页面已归档时）"""
+        self.conn.execute(
+            "DELETE FROM pages WHERE database_id = ? AND douban_link = ?", (database_id, douban_link)
+        )
+        self.conn.commit()
+
+    def replace_pages(self, database_id, pages):
+        """用全量查询Notion的结果重建数据库的页面索引
+
+        Args:
+            pages: [(豆瓣链接, page_id, fingerprint, field_hashes), ...]
+        """
+        self.conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pages (database_id, douban_link, page_id, fingerprint, field_hashes) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (database_id, link, page_id, fingerprint, json.dumps(field_hashes, sort_keys=True) if field_hashes else None)
+                for link, page_id, fingerprint, field_hashes in pages
+            ],
+        )
+        self.conn.commit()
+
+    def save(self):
+        """保存状态"""
+        self.conn.commit()
+
+    def close(self):
+        """关闭状态文件"""
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,639 @@
+import json
+import os
+import time
+from collections import Counter
+
+from douban2notion.backoff import get_status
+from douban2notion.config import ORPHAN_PROPERTY, SYNC_HASH_PROPERTY
+from douban2notion.metrics import metrics, timed_iter
+from douban2notion.utils import (
+    get_field_hashes,
+    get_fingerprint,
+    get_icon,
+    get_property_ids,
+    get_property_value,
+    get_rich_text,
+    normalize_property,
+    utc_now,
+)
+
+# 清理孤儿页面的安全阈值：超过索引中页面数的此百分比时不做任何修改
+ORPHAN_THRESHOLD = float(os.getenv("ORPHAN_THRESHOLD", "10"))
+# 每批提交的归档数，一批全部完成后再提交下一批
+ORPHAN_BATCH_SIZE = int(os.getenv("ORPHAN_BATCH_SIZE", "50"))
+ORPHAN_MODES = ("archive", "flag")
+# 本地缓存的数据库结构在此秒数内验证过时直接使用，不再请求Notion（为0时每次运行都获取）
+NOTION_SCHEMA_TTL = float(os.getenv("NOTION_SCHEMA_TTL", "86400"))
+# 已勾选ORPHAN_PROPERTY的页面在索引中该属性的指纹
+ORPHAN_FLAG_HASH = get_field_hashes({ORPHAN_PROPERTY: {"checkbox": True}})[ORPHAN_PROPERTY]
+
+
+def check_sync_hash_property(database_properties):
+    """数据库是否有用于保存同步指纹的文本属性"""
+    prop = database_properties.get(SYNC_HASH_PROPERTY)
+    if prop is None:
+        print(f"提示: 数据库中没有 '{SYNC_HASH_PROPERTY}' 文本属性，无法在页面上保存同步指纹")
+        return False
+    if prop.get("type") != "rich_text":
+        print(f"警告: 属性 '{SYNC_HASH_PROPERTY}' 应为文本类型，将不保存同步指纹")
+        return False
+    return True
+
+
+class IndexEntry:
+    __slots__ = ("page_id", "fingerprint", "field_hashes")
+
+    def __init__(self, page_id, fingerprint=None, field_hashes=None):
+        """
+        Notion索引中的一个页面（不保留页面的原始数据）
+
+        Args:
+            page_id: Notion页面ID
+            fingerprint: 页面上（或最后一次写入）的同步指纹
+            field_hashes: 各比较属性的指纹 {属性名: 指纹}，未知时为None
+        """
+        self.page_id = page_id
+        self.fingerprint = fingerprint
+        self.field_hashes = field_hashes
+
+
+def load_notion_index(notion_helper, database_id, state=None, reconcile=False, property_ids=None, refresh_edited=False,
+                      read_only=False, keys=None):
+    """获取Notion中已有页面的索引 {豆瓣链接: IndexEntry}
+
+    本地状态中已有该数据库的索引时直接使用（不请求Notion），
+    指定refresh_edited时还会查询上次同步后在Notion中编辑过的页面并按实际值重新比较；
+    否则（或指定reconcile时）全量查询Notion并重建本地索引（read_only时不写入本地状态）。
+    查询只返回property_ids中的属性，页面逐个解码为keys中各属性的指纹后即丢弃原始数据。
+
+    Returns:
+        (index, from_state)
+    """
+    if state is not None and not reconcile and state.has_pages(database_id):
+        index = {}
+        for douban_link, page_id, fingerprint, field_hashes in state.iter_pages(database_id):
+            index[douban_link] = IndexEntry(page_id, fingerprint, field_hashes)
+        
+        synced_at = state.get_meta(f"notion_synced_at:{database_id}")
+        if refresh_edited and synced_at:
+            edited_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": synced_at}}
+            edited = 0
+            for page in notion_helper.iter_query(database_id, filter_properties=property_ids, filter=edited_filter):
+                edited += 1
+                douban_link, entry = decode_page(page, keys)
+                if douban_link:
+                    # 手动编辑不会改变页面上的指纹，因此按实际值逐个属性比较
+                    entry.fingerprint = None
+                    index[douban_link] = entry
+            print(f"上次同步后Notion中有 {edited} 个页面被编辑过")
+        return index, True
+    
+    index = {}
+    for page in notion_helper.iter_query(database_id, filter_properties=property_ids):
+        douban_link, entry = decode_page(page, keys)
+        if douban_link:
+            index[douban_link] = entry
+    
+    if state is not None and not read_only:
+        state.replace_pages(
+            database_id,
+            [
+                (douban_link, entry.page_id, entry.fingerprint, entry.field_hashes)
+                for douban_link, entry in index.items()
+            ],
+        )
+    return index, False
+
+
+def decode_page(page, keys=None):
+    """解析Notion页面，返回 (豆瓣链接, IndexEntry)
+
+    只解码豆瓣链接和同步指纹，并计算keys中各属性实际值的指纹（用于找出变化的属性）。
+    """
+    properties = page.get("properties", {})
+    douban_link = None
+    if "豆瓣链接" in properties:
+        douban_link = get_property_value(properties["豆瓣链接"])
+    fingerprint = None
+    if SYNC_HASH_PROPERTY in properties:
+        # 文本可能被Notion拆成多段，按合并后的值读取
+        fingerprint = normalize_property(properties[SYNC_HASH_PROPERTY]) or None
+    field_hashes = None
+    if keys:
+        field_hashes = get_field_hashes({key: properties.get(key) for key in keys})
+    return douban_link, IndexEntry(page.get("id"), fingerprint, field_hashes)
+
+
+def find_notion_page(notion_helper, database_id, douban_link, property_ids=None, keys=None):
+    """按豆瓣链接查询Notion页面（本地索引未命中时使用）"""
+    page = notion_helper.find_page(database_id, "豆瓣链接", douban_link, property_ids)
+    if page is None:
+        return None
+    return decode_page(page, keys)[1]
+
+
+def is_flagged(entry):
+    """索引中的页面是否已勾选ORPHAN_PROPERTY（被标记为豆瓣中已取消标记）"""
+    return bool(entry.field_hashes) and entry.field_hashes.get(ORPHAN_PROPERTY) == ORPHAN_FLAG_HASH
+
+
+def get_changed_properties(existing, properties, fingerprint, field_hashes):
+    """计算需要写入的属性（空字典表示无需更新）
+
+    指纹一致时直接跳过；否则用索引中各属性的指纹（最后写入的值，
+    或Notion页面上的实际值）逐个找出真正变化的属性。
+    """
+    if existing.fingerprint == fingerprint:
+        return {}
+    
+    existing_hashes = existing.field_hashes
+    if existing_hashes is None:
+        return dict(properties)
+    
+    return {
+        key: prop for key, prop in properties.items()
+        if existing_hashes.get(key) != field_hashes[key]
+    }
+
+
+def remember_page(index, operation, page_id):
+    """把写入结果记入内存中的Notion索引"""
+    index[operation["douban_link"]] = IndexEntry(page_id, operation["fingerprint"], operation["field_hashes"])
+
+
+def is_stale_page_error(error):
+    """本地索引中的页面已在Notion中删除（404）或归档（400，已归档的页面不能编辑）"""
+    status = get_status(error)
+    return status == 404 or (status == 400 and "archived" in str(error))
+
+
+def update_or_recreate_page(notion_helper, operation, properties):
+    """更新页面；页面已删除或归档时按豆瓣链接重新查找，找不到则用operation["recreate"]新建
+
+    在写入线程中执行，返回最终写入的页面（记入本地索引的是其ID）。
+    """
+    try:
+        return notion_helper.update_page(operation["page_id"], properties)
+    except Exception as e:
+        if not operation.get("recreate") or not is_stale_page_error(e):
+            raise
+    
+    database_id = operation["database_id"]
+    recreate = operation["recreate"]
+    print(f"页面已在Notion中删除或归档，重新写入: {operation['name']}")
+    properties = notion_helper.compact_properties(database_id, recreate["properties"])
+    page = notion_helper.find_page(database_id, "豆瓣链接", operation["douban_link"])
+    if page is not None:
+        return notion_helper.update_page(page["id"], properties)
+    parent = {"database_id": database_id, "type": "database_id"}
+    return notion_helper.create_page(parent, properties, recreate.get("icon"))
+
+
+def record_writes(results, label, state=None, index=None):
+    """处理已完成的写入：成功的立即记入本地索引（指定index时也记入内存索引），失败的打印出来，返回失败数
+
+    更新因页面已删除或归档而失败时，从本地索引中移除该页面，下次同步时重新查找或创建；
+    其他400错误（如属性已被删除或改名）时丢弃缓存的数据库结构，下次同步时重新获取。
+    """
+    failures = 0
+    for result in results:
+        context = result.context
+        if result.ok:
+            if state is not None:
+                state.set_page(
+                    context["database_id"],
+                    context["douban_link"],
+                    result.result["id"],
+                    context["fingerprint"],
+                    context["field_hashes"],
+                )
+            if index is not None:
+                remember_page(index, context, result.result["id"])
+        else:
+            failures += 1
+            print(f"写入{label}失败: {context['name']}: {result.error}")
+            if context.get("action") == "update" and is_stale_page_error(result.error):
+                if state is not None:
+                    state.delete_page(context["database_id"], context["douban_link"])
+                if index is not None:
+                    index.pop(context["douban_link"], None)
+                print(f"页面已在Notion中删除或归档，已从本地索引中移除: {context['name']}")
+            elif get_status(result.error) == 400 and state is not None:
+                state.delete_meta(f"schema:{context['database_id']}")
+    return failures
+
+
+def wait_writes(notion_helper, label, state=None, failures=0, index=None):
+    """等待写入队列完成；任一操作失败时汇总报错（不推进同步位置）"""
+    failures += record_writes(notion_helper.wait_writes(), label, state, index)
+    if failures:
+        raise Exception(f"{failures} 条{label}写入失败")
+
+
+def track_watermark(latest, result):
+    """记录各状态中见到的最新create_time"""
+    status = result.get("status")
+    create_time = result.get("create_time")
+    if create_time and create_time > latest.get(status, ""):
+        latest[status] = create_time
+
+
+def update_watermarks(state, type_, latest, database_id=None, synced_at=None):
+    """同步成功后记录各状态的最新create_time，以及本次同步开始的时间"""
+    if state is None:
+        return
+    if database_id and synced_at:
+        state.set_meta(f"notion_synced_at:{database_id}", synced_at)
+    for status, create_time in latest.items():
+        state.set_watermark(type_, status, create_time)
+
+
+def get_detail_properties(mapper, database_properties):
+    """数据库中已有（且类型一致）的条目详情属性"""
+    names = set()
+    for name, property_type in mapper.detail_properties_type_dict.items():
+        prop = database_properties.get(name)
+        if prop is None:
+            continue
+        if prop.get("type") != property_type:
+            print(f"警告: 属性 '{name}' 应为 {property_type} 类型，将不写入")
+            continue
+        names.add(name)
+    return names
+
+
+def save_schema(state, database_id, schema):
+    """把数据库结构及本次验证的时间缓存到本地状态"""
+    cached = {**schema, "checked_at": time.time()}
+    state.set_meta(f"schema:{database_id}", json.dumps(cached, ensure_ascii=False))
+
+
+def load_cached_schema(notion_helper, database_id, state=None, ttl=None):
+    """使用本地状态中缓存的数据库结构（不请求Notion），返回是否有缓存
+
+    指定ttl时只使用ttl秒内验证过的缓存。
+    """
+    cached = state.get_meta(f"schema:{database_id}") if state is not None else None
+    if not cached:
+        return False
+    schema = json.loads(cached)
+    if ttl is not None and (ttl <= 0 or time.time() - schema.get("checked_at", 0) > ttl):
+        return False
+    notion_helper.set_database_schema(database_id, schema)
+    return True
+
+
+def verify_schema(mapper, notion_helper, database_id, expected_properties):
+    database_name = notion_helper.get_database_name(database_id)
+    if database_name != mapper.database_name:
+        print(f"警告: {mapper.label}数据库名称为 '{database_name}'，建议改为 '{mapper.database_name}'")
+    return notion_helper.verify_database_structure(database_id, expected_properties)
+
+
+def load_schema(mapper, notion_helper, database_id, state=None, read_only=False, refresh=False, required=()):
+    """获取并验证数据库结构，返回 {属性名: {"id", "type"}}
+
+    本地状态中的结构在NOTION_SCHEMA_TTL秒内验证过时直接使用（不请求Notion），refresh时重新获取；
+    按缓存验证失败或缓存中没有required中的属性时（如刚在Notion中添加了属性）也重新获取一次。
+    NotionHelper.create_properties为真时用一次databases.update创建缺少的属性（包括SYNC_HASH_PROPERTY）。
+    结构缓存到本地状态中，apply不获取数据库结构也能用属性ID写入。
+    """
+    expected_properties = mapper.properties_type_dict
+    if notion_helper.create_properties:
+        expected_properties = {**expected_properties, SYNC_HASH_PROPERTY: "rich_text"}
+    if refresh:
+        notion_helper.get_database_schema(database_id, refresh=True)
+    cached = database_id not in notion_helper.schemas and load_cached_schema(
+        notion_helper, database_id, state, NOTION_SCHEMA_TTL
+    )
+    schema = notion_helper.schemas.get(database_id)
+    try:
+        database_properties = verify_schema(mapper, notion_helper, database_id, expected_properties)
+        missing = [name for name in required if name not in database_properties]
+        if cached and missing:
+            raise Exception(f"缓存中没有属性: {', '.join(missing)}")
+    except Exception as e:
+        if not cached:
+            raise
+        print(f"按缓存的数据库结构验证失败，重新获取: {e}")
+        notion_helper.get_database_schema(database_id, refresh=True)
+        database_properties = verify_schema(mapper, notion_helper, database_id, expected_properties)
+    # 获取或更新过数据库结构时才写入缓存
+    if state is not None and not read_only and notion_helper.schemas.get(database_id) is not schema:
+        save_schema(state, database_id, notion_helper.get_database_schema(database_id))
+    return database_properties
+
+
+def prepare_phase(mapper, notion_helper, state=None, reconcile=False, refresh_edited=False, read_only=False,
+                  flag_orphans=False):
+    """验证数据库结构并加载Notion索引，返回某类型本次同步的上下文
+
+    flag_orphans为真时数据库结构中需要有ORPHAN_PROPERTY（缓存的结构中没有时重新获取）。
+    """
+    label, unit = mapper.label, mapper.unit
+    
+    # 验证数据库结构
+    database_id = getattr(notion_helper, mapper.database_attr)
+    with metrics.timer(f"{mapper.type_}.schema"):
+        database_properties = load_schema(
+            mapper, notion_helper, database_id, state, read_only, refresh=reconcile,
+            required=(ORPHAN_PROPERTY,) if flag_orphans else (),
+        )
+    use_sync_hash = check_sync_hash_property(database_properties)
+    detail_properties = get_detail_properties(mapper, database_properties)
+    can_flag_orphans = database_properties.get(ORPHAN_PROPERTY, {}).get("type") == "checkbox"
+    # 查询Notion时只取比较需要的属性，解码时只保留这些属性的指纹（以及页面是否已被标记为孤儿）
+    compared_keys = (*mapper.properties_type_dict, *detail_properties)
+    if can_flag_orphans:
+        compared_keys = (*compared_keys, ORPHAN_PROPERTY)
+    property_ids = get_property_ids(database_properties, [*compared_keys, SYNC_HASH_PROPERTY])
+    synced_at = utc_now()
+    
+    # 获取现有Notion数据（优先使用本地索引）
+    with metrics.timer(f"{mapper.type_}.load_index"):
+        notion_index, from_state = load_notion_index(
+            notion_helper, database_id, state, reconcile, property_ids, refresh_edited, read_only, compared_keys
+        )
+    
+    if from_state:
+        print(f"本地索引中现有 {len(notion_index)} {unit}{label}")
+    else:
+        print(f"Notion中现有 {len(notion_index)} {unit}{label}")
+    
+    return {
+        "type": mapper.type_,
+        "label": label,
+        "unit": unit,
+        "database_id": database_id,
+        "use_sync_hash": use_sync_hash,
+        "detail_properties": detail_properties,
+        "can_flag_orphans": can_flag_orphans,
+        "property_ids": property_ids,
+        "compared_keys": compared_keys,
+        "index": notion_index,
+        "from_state": from_state,
+        "synced_at": synced_at,
+        "latest": {},
+        "count": 0,
+        "seen": set(),
+    }
+
+
+def iter_operations(mapper, notion_helper, phase, subjects, enricher=None):
+    """比较豆瓣记录与Notion索引，逐条产出写入操作（不执行写入）
+
+    每个操作是一个字典，action为create、update或noop：
+    create带完整属性和图标，update带page_id、变化的属性名changed、要写入的属性，
+    以及页面已删除或归档时用于重新写入的完整属性和图标recreate（已被标记为孤儿的页面重新出现时取消勾选），
+    noop在本地索引需要记录新指纹时带page_id、fingerprint和field_hashes。
+    数据库中有条目详情属性且指定enricher时，先为记录补充条目详情。
+    """
+    label = phase["label"]
+    database_id = phase["database_id"]
+    notion_index = phase["index"]
+    detail_properties = phase["detail_properties"]
+    skipped_properties = [key for key in mapper.detail_properties_type_dict if key not in detail_properties]
+    if enricher is not None and detail_properties:
+        subjects = enricher.enrich(
+            mapper.type_, subjects, mapper.detail_keys,
+            lambda interest: mapper.get_link(interest) not in notion_index,
+        )
+    diff_time = 0.0
+    
+    # 处理每条标记记录（边获取边处理），分别统计等待豆瓣数据和比较的耗时
+    try:
+        for result in timed_iter(subjects, f"{phase['type']}.douban_wait"):
+            if not result:
+                continue
+            started = time.perf_counter()
+            phase["count"] += 1
+            track_watermark(phase["latest"], result)
+            
+            item = mapper.transform(result)
+            for key in skipped_properties:
+                item.pop(key, None)
+            
+            # 检查是否需要更新或创建
+            douban_link = item.get("豆瓣链接")
+            phase["seen"].add(douban_link)
+            properties = mapper.encode(item)
+            field_hashes = get_field_hashes(properties)
+            fingerprint = get_fingerprint(properties, field_hashes)
+            operation = {
+                "database_id": database_id,
+                "douban_link": douban_link,
+                "name": item["名称"],
+                "fingerprint": fingerprint,
+                "field_hashes": field_hashes,
+            }
+            existing = notion_index.get(douban_link)
+            if existing is None and phase["from_state"]:
+                # 本地索引未命中时才按链接查询Notion
+                existing = find_notion_page(
+                    notion_helper, database_id, douban_link, phase["property_ids"], phase["compared_keys"]
+                )
+            
+            if existing is not None:
+                operation["page_id"] = existing.page_id
+                changed = get_changed_properties(existing, properties, fingerprint, field_hashes)
+                if phase["can_flag_orphans"] and is_flagged(existing):
+                    changed[ORPHAN_PROPERTY] = {"checkbox": False}
+                if changed:
+                    print(f"更新{label}: {item['名称']} ({', '.join(changed)})")
+                    operation["action"] = "update"
+                    operation["changed"] = list(changed)
+                    if phase["use_sync_hash"]:
+                        changed[SYNC_HASH_PROPERTY] = get_rich_text(fingerprint)
+                    operation["properties"] = changed
+                    # 页面已在Notion中删除或归档时，用完整属性重新写入
+                    full_properties = dict(properties)
+                    if phase["use_sync_hash"]:
+                        full_properties[SYNC_HASH_PROPERTY] = changed[SYNC_HASH_PROPERTY]
+                    operation["recreate"] = {
+                        "properties": full_properties,
+                        "icon": get_icon(item[mapper.icon_field]) if item.get(mapper.icon_field) else None,
+                    }
+                else:
+                    print(f"跳过{label}: {item['名称']}")
+                    operation["action"] = "noop"
+                    if existing.fingerprint == fingerprint and phase["from_state"]:
+                        # 本地索引已是最新，无需记录
+                        del operation["fingerprint"], operation["field_hashes"]
+            else:
+                # 创建新记录
+                print(f"添加{label}: {item['名称']}")
+                operation["action"] = "create"
+                if phase["use_sync_hash"]:
+                    properties[SYNC_HASH_PROPERTY] = get_rich_text(fingerprint)
+                operation["properties"] = properties
+                operation["icon"] = None
+                if item.get(mapper.icon_field):
+                    operation["icon"] = get_icon(item[mapper.icon_field])
+            
+            diff_time += time.perf_counter() - started
+            yield operation
+    finally:
+        metrics.add_time(f"{phase['type']}.diff", diff_time, phase["count"])
+
+
+def apply_operation(notion_helper, state, operation):
+    """提交一个写入操作到写入队列（noop只更新本地索引）
+
+    已知数据库结构时按属性ID写入，请求体更小。
+    """
+    action = operation["action"]
+    if action == "create":
+        parent = {
+            "database_id": operation["database_id"],
+            "type": "database_id",
+        }
+        notion_helper.submit_create_page(
+            parent=parent,
+            properties=notion_helper.compact_properties(operation["database_id"], operation["properties"]),
+            icon=operation.get("icon"),
+            context=operation
+        )
+    elif action == "update":
+        notion_helper.submit_write(
+            update_or_recreate_page,
+            notion_helper,
+            operation,
+            notion_helper.compact_properties(operation["database_id"], operation["properties"]),
+            context=operation
+        )
+    elif state is not None and operation.get("fingerprint"):
+        state.set_page(
+            operation["database_id"],
+            operation["douban_link"],
+            operation["page_id"],
+            operation["fingerprint"],
+            operation.get("field_hashes"),
+            commit=False,
+        )
+
+
+def sync_media(mapper, notion_helper, subjects, state=None, reconcile=False, refresh_edited=False, enricher=None,
+               orphans=None, orphan_threshold=ORPHAN_THRESHOLD):
+    """按编译好的媒体类型规则，把豆瓣标记记录同步到Notion
+
+    Args:
+        mapper: mapper.get_mapper()返回的MediaMapper
+        notion_helper: NotionHelper
+        subjects: 可迭代的豆瓣标记记录（可以是边获取边产出的流）
+        state: 本地同步状态，为None时不使用本地索引和同步位置
+        reconcile: 忽略本地页面索引，全量查询Notion
+        refresh_edited: 重新核对上次同步后在Notion中编辑过的页面
+        enricher: details.DetailEnricher，数据库中有条目详情属性时用于补充详情
+        orphans: 同步后如何处理豆瓣中已取消标记的页面（archive或flag，为None时不处理），
+            subjects必须是全量获取的数据
+        orphan_threshold: 孤儿页面占索引的百分比超过此值时不处理并报错
+
+    Returns:
+        各操作（create、update、noop，以及处理孤儿页面时的orphan）的数量
+    """
+    print(f"开始同步{mapper.label}数据...")
+    phase = prepare_phase(mapper, notion_helper, state, reconcile, refresh_edited, flag_orphans=orphans == "flag")
+    counts = sync_phase(mapper, notion_helper, phase, subjects, state, enricher)
+    if orphans:
+        counts["orphan"] = archive_orphans(notion_helper, phase, state, orphans, orphan_threshold)
+    return counts
+
+
+def sync_phase(mapper, notion_helper, phase, subjects, state=None, enricher=None):
+    """把豆瓣标记记录与prepare_phase准备好的索引比较并写入Notion，返回各操作的数量
+
+    写入成功后同时更新phase中的索引，因此同一个phase可以在多轮同步之间复用。
+    """
+    label = mapper.label
+    index = phase["index"]
+    counts = Counter()
+    failures = 0
+    for operation in iter_operations(mapper, notion_helper, phase, subjects, enricher):
+        counts[operation["action"]] += 1
+        failures += record_writes(notion_helper.poll_writes(), label, state, index)
+        # 写入队列已满时提交会阻塞，计入write_submit
+        with metrics.timer(f"{mapper.type_}.write_submit"):
+            apply_operation(notion_helper, state, operation)
+        if operation["action"] == "noop" and operation.get("fingerprint"):
+            remember_page(index, operation, operation["page_id"])
+    
+    print(f"豆瓣中共获取 {phase['count']} {mapper.unit}{label}")
+    with metrics.timer(f"{mapper.type_}.write_drain"):
+        wait_writes(notion_helper, label, state, failures, index)
+    update_watermarks(state, mapper.type_, phase["latest"], phase["database_id"], phase["synced_at"])
+    return counts
+
+
+def find_orphans(phase, skip_flagged=False):
+    """Notion索引中有、但本次获取的豆瓣数据中没有的页面 {豆瓣链接: page_id}
+
+    skip_flagged为真时不包括已勾选ORPHAN_PROPERTY的页面。
+    """
+    return {
+        douban_link: entry.page_id
+        for douban_link, entry in phase["index"].items()
+        if douban_link not in phase["seen"] and not (skip_flagged and is_flagged(entry))
+    }
+
+
+def archive_orphans(notion_helper, phase, state=None, mode="archive", threshold=ORPHAN_THRESHOLD, batch_size=ORPHAN_BATCH_SIZE):
+    """分批归档（或勾选ORPHAN_PROPERTY标记）豆瓣中已取消标记的页面，返回处理的页面数
+
+    只能在全量获取豆瓣数据之后调用。孤儿页面超过索引的threshold%时不做任何修改并报错，
+    避免豆瓣数据获取不完整时清空数据库。归档成功的页面从本地索引中删除；
+    标记成功的页面仍保留在索引中并记下已标记，之后不再重复标记，重新出现在豆瓣数据中时取消勾选。
+    """
+    label, unit = phase["label"], phase["unit"]
+    action = "归档" if mode == "archive" else "标记"
+    if mode == "flag" and not phase["can_flag_orphans"]:
+        raise Exception(f"数据库中没有复选框属性 '{ORPHAN_PROPERTY}'，无法标记已取消标记的{label}")
+    
+    orphans = find_orphans(phase, skip_flagged=mode == "flag")
+    total = len(phase["index"])
+    if not orphans:
+        print(f"没有需要{action}的{label}页面")
+        return 0
+    ratio = len(orphans) * 100 / total
+    if ratio > threshold:
+        raise Exception(
+            f"{len(orphans)}/{total} {unit}{label}（{ratio:.1f}%）不在豆瓣数据中，"
+            f"超过安全阈值 {threshold:g}%，未做任何修改"
+        )
+    
+    links = sorted(orphans)
+    done = 0
+    failures = 0
+    with metrics.timer(f"{phase['type']}.orphans"):
+        for start in range(0, len(links), max(1, batch_size)):
+            for douban_link in links[start:start + batch_size]:
+                page_id = orphans[douban_link]
+                context = {"douban_link": douban_link, "page_id": page_id}
+                if mode == "archive":
+                    notion_helper.submit_archive_page(page_id, context=context)
+                else:
+                    properties = notion_helper.compact_properties(
+                        phase["database_id"], {ORPHAN_PROPERTY: {"checkbox": True}}
+                    )
+                    notion_helper.submit_update_page(page_id, properties, context=context)
+            for result in notion_helper.wait_writes():
+                douban_link = result.context["douban_link"]
+                if result.ok:
+                    done += 1
+                    if mode == "archive":
+                        del phase["index"][douban_link]
+                        if state is not None:
+                            state.delete_page(phase["database_id"], douban_link)
+                    else:
+                        entry = phase["index"][douban_link]
+                        entry.field_hashes = {**(entry.field_hashes or {}), ORPHAN_PROPERTY: ORPHAN_FLAG_HASH}
+                        if state is not None:
+                            state.set_page(
+                                phase["database_id"], douban_link, entry.page_id, entry.fingerprint, entry.field_hashes
+                            )
+                else:
+                    failures += 1
+                    print(f"{action}{label}页面失败: {douban_link}: {result.error}")
+            print(f"已{action} {done}/{len(links)} {unit}豆瓣中已取消标记的{label}")
+    if failures:
+        raise Exception(f"{failures} {unit}{label}{action}失败")
+    return done
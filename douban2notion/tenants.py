@@ -0,0 +1,75 @@
+import json
+import os
+import re
+
+from douban2notion.utils import extract_database_id
+
+# 多用户模式下各用户状态文件所在的目录
+DEFAULT_STATE_DIR = os.getenv("DOUBAN2NOTION_STATE_DIR", ".douban2notion_state")
+
+TENANT_TYPES = ("movie", "book", "both")
+
+
+def load_tenants(path):
+    """读取多用户配置文件，返回用户列表
+
+    配置文件为JSON，可以是用户列表，也可以是 {"tenants": [...]}。每个用户：
+        douban_user: 豆瓣用户名（必填）
+        movie_db / book_db: 电影和书籍数据库URL或ID（至少指定一个，缺少的类型不同步）
+        name: 名称，用于日志和状态文件名，默认为douban_user
+        token_env: 保存Notion集成令牌的环境变量名（推荐，避免把令牌写进文件）
+        token: Notion集成令牌，与token_env都未指定时使用NOTION_TOKEN环境变量
+        type: 同步类型 movie、book 或 both，默认使用命令行的 --type
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    entries = config.get("tenants", []) if isinstance(config, dict) else config
+    if not entries:
+        raise ValueError("配置文件中没有用户")
+
+    tenants = []
+    names = set()
+    for index, entry in enumerate(entries, 1):
+        if not entry.get("douban_user"):
+            raise ValueError(f"第{index}个用户缺少: douban_user")
+        if not entry.get("movie_db") and not entry.get("book_db"):
+            raise ValueError(f"第{index}个用户缺少: movie_db 或 book_db")
+        name = entry.get("name") or entry["douban_user"]
+        if name in names:
+            raise ValueError(f"用户名称重复: {name}")
+        names.add(name)
+        if entry.get("type") and entry["type"] not in TENANT_TYPES:
+            raise ValueError(f"用户 {name} 的type应为 {', '.join(TENANT_TYPES)} 之一")
+        if entry.get("type") in ("movie", "book") and not entry.get(f"{entry['type']}_db"):
+            raise ValueError(f"用户 {name} 的type为{entry['type']}，但没有指定 {entry['type']}_db")
+
+        token = entry.get("token")
+        if entry.get("token_env"):
+            token = os.getenv(entry["token_env"])
+            if not token:
+                raise ValueError(f"用户 {name} 的环境变量 {entry['token_env']} 未设置")
+        tenants.append({
+            "name": name,
+            "douban_user": entry["douban_user"],
+            "movie_db": extract_database_id(entry["movie_db"]) if entry.get("movie_db") else None,
+            "book_db": extract_database_id(entry["book_db"]) if entry.get("book_db") else None,
+            "token": token or os.getenv("NOTION_TOKEN"),
+            "type": entry.get("type"),
+        })
+    return tenants
+
+
+def get_tenant_type(tenant, default):
+    """用户实际同步的类型：tenant的type（未指定时为default）中有对应数据库的部分，都没有时返回None"""
+    type_ = tenant["type"] or default
+    types = [t for t in ("movie", "book") if type_ in (t, "both") and tenant[f"{t}_db"]]
+    if not types:
+        return None
+    return "both" if len(types) == 2 else types[0]
+
+
+def get_tenant_state_file(state_dir, name):
+    """用户的状态文件路径（每个用户单独一个文件）"""
+    os.makedirs(state_dir, exist_ok=True)
+    safe_name = re.sub(r"[^\w.-]", "_", name)
+    return os.path.join(state_dir, f"{safe_name}.db")
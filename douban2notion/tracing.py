@@ -0,0 +1,103 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    def __init__(self):
+        """
+        记录span并导出为Chrome trace-event格式（可在chrome://tracing或Perfetto中打开）
+
+        每个span是一个完整事件（ph为"X"），按线程分行显示，
+        因此可以直接看出并发获取和写入是否真正重叠。
+        """
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, args=None):
+        """记录一个span（start和end为time.perf_counter()的值）"""
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": self.pid,
+            "tid": thread.native_id,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.threads.setdefault(thread.native_id, thread.name)
+            self.events.append(event)
+
+    def save(self, path):
+        """写入trace文件"""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "douban2notion"}}]
+        for tid, name in threads.items():
+            metadata.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+_tracer = None
+
+
+def start_tracing():
+    """开始记录span"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(path=None):
+    """停止记录，指定path时写入trace文件"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and path:
+        tracer.save(path)
+    return tracer
+
+
+def is_tracing():
+    return _tracer is not None
+
+
+def add_span(name, start, end, category="phase", args=None):
+    """记录一个已结束的span（未开启跟踪时什么也不做）"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, category, start, end, args)
+
+
+@contextmanager
+def _span(tracer, name, category, args):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.add(name, category, start, time.perf_counter(), args)
+
+
+def traced(name, category, get_args=None):
+    """装饰器：把每次调用记录为一个span，get_args(*args, **kwargs)返回span的参数"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with _span(tracer, name, category, get_args(*args, **kwargs) if get_args else None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,141 @@
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# requests、httpx和notion_client在首次创建会话或客户端时才导入，--help等不发请求的命令不必加载
+
+from douban2notion.metrics import metrics
+from douban2notion.tracing import add_span, is_tracing
+
+# 请求超时（秒）
+DOUBAN_TIMEOUT = float(os.getenv("DOUBAN_TIMEOUT", "30"))
+NOTION_TIMEOUT = float(os.getenv("NOTION_TIMEOUT", "60"))
+NOTION_BASE_URL = os.getenv("NOTION_BASE_URL", "https://api.notion.com")
+# 默认连接池大小（一般由并发数决定，见configure_douban_session / create_notion_client）
+DEFAULT_POOL_SIZE = 4
+
+# 按 (方法, 路径) 归类的接口名，用于统计请求数和耗时
+ENDPOINTS = [
+    ("GET", re.compile(r"/api/v2/user/[^/]+/interests"), "douban.interests"),
+    ("GET", re.compile(r"/api/v2/(?:movie|book)/[^/]+"), "douban.subject"),
+    ("POST", re.compile(r"/v1/databases/[^/]+/query"), "notion.databases.query"),
+    ("GET", re.compile(r"/v1/databases/[^/]+"), "notion.databases.retrieve"),
+    ("PATCH", re.compile(r"/v1/databases/[^/]+"), "notion.databases.update"),
+    ("POST", re.compile(r"/v1/pages"), "notion.pages.create"),
+    ("GET", re.compile(r"/v1/pages/[^/]+"), "notion.pages.retrieve"),
+    ("PATCH", re.compile(r"/v1/pages/[^/]+"), "notion.pages.update"),
+]
+
+_lock = threading.Lock()
+_douban_session = None
+_notion_transport = None
+
+
+def get_endpoint(method, url):
+    """把请求归类为接口名（如notion.pages.create），未知接口返回 "主机 方法" """
+    parts = urlsplit(str(url))
+    path = parts.path.rstrip("/")
+    for endpoint_method, pattern, name in ENDPOINTS:
+        if method == endpoint_method and pattern.fullmatch(path):
+            return name
+    return f"{parts.hostname} {method}"
+
+
+def _record_douban_response(response, *args, **kwargs):
+    endpoint = get_endpoint(response.request.method, response.request.url)
+    elapsed = response.elapsed.total_seconds()
+    metrics.record_request(endpoint, response.status_code, elapsed)
+    if is_tracing():
+        end = time.perf_counter()
+        add_span(endpoint, end - elapsed, end, "http", {"status": response.status_code, "url": response.request.url})
+
+
+def _mark_notion_request(request):
+    request.extensions["douban2notion_start"] = time.perf_counter()
+
+
+def _record_notion_response(response):
+    request = response.request
+    start = request.extensions.get("douban2notion_start")
+    end = time.perf_counter()
+    elapsed = end - start if start else 0.0
+    endpoint = get_endpoint(request.method, request.url)
+    metrics.record_request(endpoint, response.status_code, elapsed)
+    if start and is_tracing():
+        add_span(endpoint, start, end, "http", {"status": response.status_code, "url": str(request.url)})
+
+
+def configure_douban_session(pool_size=DEFAULT_POOL_SIZE):
+    """创建豆瓣请求共用的keep-alive会话，连接池大小应不小于并发抓取的线程数"""
+    global _douban_session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.hooks["response"].append(_record_douban_response)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with _lock:
+        old, _douban_session = _douban_session, session
+    if old is not None:
+        old.close()
+    return session
+
+
+def get_douban_session():
+    """获取豆瓣请求共用的会话（未配置时按默认连接池大小创建）"""
+    with _lock:
+        session = _douban_session
+    if session is None:
+        session = configure_douban_session()
+    return session
+
+
+def get_notion_transport(pool_size=DEFAULT_POOL_SIZE):
+    """获取所有Notion客户端共用的连接池（按首次调用时的pool_size创建）"""
+    global _notion_transport
+    import httpx
+
+    with _lock:
+        if _notion_transport is None:
+            _notion_transport = httpx.HTTPTransport(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        return _notion_transport
+
+
+def create_notion_client(auth, pool_size=DEFAULT_POOL_SIZE):
+    """创建使用共享连接池的Notion客户端
+
+    每个客户端有自己的认证头，底层连接在所有客户端之间复用。
+    """
+    import httpx
+    from notion_client import Client
+
+    http_client = httpx.Client(
+        transport=get_notion_transport(pool_size),
+        event_hooks={"request": [_mark_notion_request], "response": [_record_notion_response]},
+    )
+    return Client(
+        auth=auth,
+        client=http_client,
+        base_url=NOTION_BASE_URL,
+        timeout_ms=int(NOTION_TIMEOUT * 1000),
+        log_level=logging.ERROR,
+    )
+
+
+def close_transports():
+    """关闭共享的会话和连接池"""
+    global _douban_session, _notion_transport
+    with _lock:
+        session, _douban_session = _douban_session, None
+        transport, _notion_transport = _notion_transport, None
+    if session is not None:
+        session.close()
+    if transport is not None:
+        transport.close()
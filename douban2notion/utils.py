@@ -1,9 +1,29 @@
+import functools
+import hashlib
+import json
 import os
+import posixpath
 import re
-import pendulum
+from datetime import datetime, timedelta, timezone
 
 # 时区设置
 tz = "Asia/Shanghai"
+# 上海时区没有夏令时，用固定偏移（UTC+8）代替时区数据库
+SHANGHAI_OFFSET = timedelta(hours=8)
+SHANGHAI = timezone(SHANGHAI_OFFSET, tz)
+# 豆瓣的create_time和Notion的date.start：日期、可选的时间和可选的时区
+DATE_TIME_RE = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?)?"
+    r"\s*(?:(Z)|([+-])(\d{2}):?(\d{2}))?$"
+)
+# 记住的日期字符串数（同一时间在豆瓣和Notion两侧、多轮同步中会反复出现）
+DATE_CACHE_SIZE = 65536
+
+
+def utc_now():
+    """当前UTC时间的ISO 8601字符串（如2024-03-20T12:00:00.000000Z）"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
 
 def get_property_value(property_item):
@@ -157,6 +177,55 @@ def get_icon(url):
     }
 
 
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def to_date_key(value):
+    """把豆瓣的create_time或Notion的date.start转换为上海时区的日期（YYYY-MM-DD）
+
+    不带时区的时间视为上海时间，直接截取日期；带时区（Z或±HH:MM）的换算到上海时区。
+    无法解析时返回None。
+    """
+    match = DATE_TIME_RE.match(value) if value else None
+    if match is None:
+        return None
+    year, month, day, hour, minute, _, utc, sign, offset_hours, offset_minutes = match.groups()
+    if not (utc or sign):
+        return value[:10]
+    local = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0))
+    offset = timedelta(0)
+    if sign:
+        offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+        if sign == "-":
+            offset = -offset
+    return (local - offset + SHANGHAI_OFFSET).strftime("%Y-%m-%d")
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def timestamp_to_date_key(timestamp):
+    """Unix时间戳转上海时区的日期（YYYY-MM-DD）"""
+    return datetime.fromtimestamp(timestamp, SHANGHAI).strftime("%Y-%m-%d")
+
+
+def get_timestamp_date(value):
+    """创建日期属性，整数值视为Unix时间戳"""
+    if isinstance(value, int):
+        value = timestamp_to_date_key(value)
+    return get_date(value)
+
+
+# 属性类型 → 创建属性的函数（返回None时不写入该属性）
+PROPERTY_ENCODERS = {
+    "title": get_title,
+    "rich_text": get_rich_text,
+    "url": get_url,
+    "select": get_select,
+    "multi_select": get_multi_select,
+    "status": get_status,
+    "date": get_timestamp_date,
+    "number": get_number,
+    "files": get_files,
+}
+
+
 def get_properties(item, properties_type_dict):
     """根据属性类型字典创建属性"""
     properties = {}
@@ -165,43 +234,92 @@ def get_properties(item, properties_type_dict):
         value = item.get(key)
         if value is None:
             continue
-            
-        if property_type == "title":
-            properties[key] = get_title(value)
-        elif property_type == "rich_text":
-            properties[key] = get_rich_text(value)
-        elif property_type == "url":
-            properties[key] = get_url(value)
-        elif property_type == "select":
-            prop = get_select(value)
-            if prop:
-                properties[key] = prop
-        elif property_type == "multi_select":
-            properties[key] = get_multi_select(value)
-        elif property_type == "status":
-            prop = get_status(value)
-            if prop:
-                properties[key] = prop
-        elif property_type == "date":
-            if isinstance(value, int):
-                # Unix时间戳转换为ISO格式
-                date_obj = pendulum.from_timestamp(value, tz=tz)
-                iso_date = date_obj.format("YYYY-MM-DD")
-                prop = get_date(iso_date)
-            else:
-                prop = get_date(value)
-            if prop:
-                properties[key] = prop
-        elif property_type == "number":
-            prop = get_number(value)
-            if prop:
-                properties[key] = prop
-        elif property_type == "files":
-            properties[key] = get_files(value)
+        encoder = PROPERTY_ENCODERS.get(property_type)
+        if encoder is None:
+            continue
+        prop = encoder(value)
+        if prop:
+            properties[key] = prop
     
     return properties
 
 
+def truncate_text(text, limit=2000):
+    """截断超过Notion富文本长度限制的文本"""
+    if text and len(text) > limit:
+        return text[:limit - 3] + "..."
+    return text
+
+
+def normalize_property(prop):
+    """将属性（写入用的payload或从Notion读到的属性值）转换为可比较的规范值
+
+    等价的值规范化后相同：多段富文本合并并按长度限制截断，封面URL去掉扩展名
+    （兼容改写为webp的地址），日期只保留上海时区的日期部分，多选标签排序。
+    """
+    if not prop:
+        return None
+    property_type = prop.get("type") or next(iter(prop))
+    value = prop.get(property_type)
+    
+    if property_type in ("title", "rich_text"):
+        text = "".join(
+            (segment.get("plain_text") or segment.get("text", {}).get("content", ""))
+            for segment in value or []
+        )
+        return truncate_text(text)
+    elif property_type in ("select", "status"):
+        return value.get("name") if value else None
+    elif property_type == "multi_select":
+        return sorted(item.get("name", "") for item in value or [])
+    elif property_type == "date":
+        start = value.get("start") if value else None
+        if start and len(start) > 10:
+            start = to_date_key(start)
+        return start
+    elif property_type == "files":
+        urls = []
+        for file in value or []:
+            url = file.get(file.get("type", "external"), {}).get("url", "")
+            urls.append(posixpath.splitext(url)[0])
+        return urls
+    return value
+
+
+def get_field_hashes(properties):
+    """计算每个属性规范值的指纹 {属性名: 指纹}"""
+    hashes = {}
+    for key, prop in properties.items():
+        payload = json.dumps(normalize_property(prop), ensure_ascii=False, separators=(",", ":"))
+        hashes[key] = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+    return hashes
+
+
+def get_fingerprint(properties, field_hashes=None):
+    """计算属性内容的稳定指纹（与键顺序无关，等价的值指纹相同）"""
+    if field_hashes is None:
+        field_hashes = get_field_hashes(properties)
+    payload = json.dumps(field_hashes, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def get_property_ids(database_properties, names):
+    """从数据库结构中取出指定属性的ID（用于filter_properties）
+
+    数据库中没有的属性直接跳过（查询结果中本来就不会有）；
+    某个存在的属性没有ID时无法只请求部分属性，返回None（查询全部属性）。
+    """
+    ids = []
+    for name in names:
+        prop = database_properties.get(name)
+        if prop is None:
+            continue
+        if not prop.get("id"):
+            return None
+        ids.append(prop["id"])
+    return ids or None
+
+
 def extract_database_id(notion_url):
     """从Notion URL中提取数据库ID"""
     match = re.search(
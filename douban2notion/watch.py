@@ -0,0 +1,200 @@
+import copy
+import os
+import signal
+import threading
+
+from douban2notion.mapper import get_mapper
+from douban2notion.metrics import metrics
+from douban2notion.sync import prepare_phase, sync_phase
+from douban2notion.utils import utc_now
+
+# 轮询间隔（秒）：有新变化后回到最小值，空闲时每轮乘以WATCH_BACKOFF直到最大值
+WATCH_MIN_INTERVAL = float(os.getenv("WATCH_MIN_INTERVAL", "60"))
+WATCH_MAX_INTERVAL = float(os.getenv("WATCH_MAX_INTERVAL", "1800"))
+WATCH_BACKOFF = float(os.getenv("WATCH_BACKOFF", "2"))
+# 健康检查接口（见health.py）的地址和端口（端口为空时不启动）
+WATCH_HEALTH_HOST = os.getenv("WATCH_HEALTH_HOST", "127.0.0.1")
+WATCH_HEALTH_PORT = os.getenv("WATCH_HEALTH_PORT")
+# 连续失败多少轮后健康检查返回503
+WATCH_UNHEALTHY_FAILURES = int(os.getenv("WATCH_UNHEALTHY_FAILURES", "3"))
+
+
+class AdaptiveInterval:
+    def __init__(self, min_interval=WATCH_MIN_INTERVAL, max_interval=WATCH_MAX_INTERVAL, factor=WATCH_BACKOFF):
+        """
+        自适应轮询间隔
+
+        刚有新标记时用户往往还在继续标记，因此回到最小间隔；
+        没有变化时逐轮拉长间隔，直到最大间隔。
+
+        Args:
+            min_interval: 最小间隔（秒）
+            max_interval: 最大间隔（秒）
+            factor: 每个空闲轮次间隔的放大倍数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.factor = max(1.0, factor)
+        self.current = min_interval
+
+    def next(self, active):
+        """根据本轮是否有变化返回到下一轮的间隔"""
+        if active:
+            self.current = self.min_interval
+        else:
+            self.current = min(self.max_interval, self.current * self.factor)
+        return self.current
+
+
+class Watcher:
+    def __init__(self, notion_helper, fetch, types, state=None, watermarks=None, reconcile=False, refresh_edited=False, enricher=None):
+        """
+        常驻进程中的增量同步
+
+        各类型的数据库结构只验证一次，Notion索引只加载一次并常驻内存，
+        之后每轮只获取豆瓣上比同步位置更新的标记，只写入变化的页面。
+
+        Args:
+            notion_helper: NotionHelper
+            fetch: fetch(type_, watermarks) 返回比 {状态: create_time} 更新的标记记录
+            types: 要同步的类型列表
+            state: 本地同步状态，每轮成功后保存索引和同步位置，为None时只保存在内存中
+            watermarks: 初始同步位置 {type_: {状态: create_time}}，为空时第一轮全量获取
+            reconcile: 第一轮忽略本地页面索引，全量查询Notion
+            refresh_edited: 第一轮重新核对上次同步后在Notion中编辑过的页面
+            enricher: details.DetailEnricher，为新条目补充条目详情
+        """
+        self.notion_helper = notion_helper
+        self.fetch = fetch
+        self.types = list(types)
+        self.state = state
+        self.reconcile = reconcile
+        self.refresh_edited = refresh_edited
+        self.enricher = enricher
+        self.watermarks = {type_: dict((watermarks or {}).get(type_) or {}) for type_ in self.types}
+        self.phases = {}
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.status = {
+            "started_at": utc_now(),
+            "cycles": 0,
+            "consecutive_failures": 0,
+            "last_cycle_at": None,
+            "last_success_at": None,
+            "last_changes": 0,
+            "last_error": None,
+            "next_poll_in": None,
+            "types": {},
+        }
+
+    def poll(self):
+        """同步一轮，返回写入的页面数；任一类型失败时在其余类型完成后抛出异常"""
+        changes = 0
+        errors = []
+        for type_ in self.types:
+            if self.stop_event.is_set():
+                break
+            mapper = get_mapper(type_)
+            try:
+                with metrics.timer(f"{type_}.total"):
+                    counts = self._poll_type(mapper)
+                changes += counts["create"] + counts["update"]
+            except Exception as e:
+                print(f"{mapper.label}数据同步失败: {e}")
+                errors.append(f"{mapper.label}: {e}")
+        if errors:
+            raise Exception("；".join(errors))
+        return changes
+
+    def _poll_type(self, mapper):
+        phase = self.phases.get(mapper.type_)
+        if phase is None:
+            # 第一轮（或上次准备失败后）验证数据库结构并加载索引
+            print(f"开始同步{mapper.label}数据...")
+            phase = prepare_phase(mapper, self.notion_helper, self.state, self.reconcile, self.refresh_edited)
+            self.phases[mapper.type_] = phase
+        phase.update(latest={}, count=0, synced_at=utc_now())
+
+        subjects = self.fetch(mapper.type_, dict(self.watermarks[mapper.type_]))
+        try:
+            counts = sync_phase(mapper, self.notion_helper, phase, subjects, self.state, self.enricher)
+        finally:
+            close = getattr(subjects, "close", None)
+            if close is not None:
+                close()
+
+        watermarks = self.watermarks[mapper.type_]
+        for status, create_time in phase["latest"].items():
+            if create_time > watermarks.get(status, ""):
+                watermarks[status] = create_time
+        if self.state is not None:
+            self.state.save()
+        with self._lock:
+            self.status["types"][mapper.type_] = {
+                "indexed": len(phase["index"]),
+                "watermarks": dict(watermarks),
+                "last_counts": dict(counts),
+            }
+        return counts
+
+    def run(self, interval=None, max_cycles=0, on_cycle=None):
+        """循环同步直到stop()（或完成max_cycles轮），每轮结束后调用on_cycle()"""
+        interval = interval or AdaptiveInterval()
+        while not self.stop_event.is_set():
+            started = utc_now()
+            try:
+                changes = self.poll()
+                error = None
+            except Exception as e:
+                changes = 0
+                error = str(e)
+
+            delay = interval.next(changes > 0)
+            with self._lock:
+                status = self.status
+                status["cycles"] += 1
+                status["last_cycle_at"] = started
+                status["last_changes"] = changes
+                status["last_error"] = error
+                status["next_poll_in"] = delay
+                if error is None:
+                    status["last_success_at"] = started
+                    status["consecutive_failures"] = 0
+                else:
+                    status["consecutive_failures"] += 1
+                cycles = status["cycles"]
+            if on_cycle is not None:
+                on_cycle()
+            if max_cycles and cycles >= max_cycles:
+                break
+            print(f"本轮写入 {changes} 个页面，{delay:g}秒后再次检查")
+            self.stop_event.wait(delay)
+
+    def stop(self):
+        """请求停止：当前这一轮（包括已提交的写入）完成后退出"""
+        self.stop_event.set()
+
+    def get_status(self):
+        """当前状态（用于健康检查接口）"""
+        with self._lock:
+            status = copy.deepcopy(self.status)
+        status["healthy"] = status["consecutive_failures"] < WATCH_UNHEALTHY_FAILURES
+        return status
+
+
+def install_signal_handlers(watcher):
+    """收到SIGINT或SIGTERM时在当前一轮完成后退出，再次收到时立即中断
+
+    Returns:
+        原来的信号处理函数 {signum: handler}，用于恢复
+    """
+    def handle(signum, frame):
+        if watcher.stop_event.is_set():
+            raise KeyboardInterrupt
+        print("收到退出信号，当前一轮完成后退出（再次发送则立即中断）")
+        watcher.stop()
+
+    previous = {}
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous[signum] = signal.signal(signum, handle)
+    return previous
@@ -0,0 +1,68 @@
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# 单个写入操作的结果，context为提交时附带的上下文（如条目数据）
+WriteResult = namedtuple("WriteResult", ["context", "ok", "result", "error"])
+
+
+class WriteEngine:
+    def __init__(self, workers=3, max_pending=None):
+        """
+        初始化写入引擎
+
+        Args:
+            workers: 并发执行写入操作的线程数
+            max_pending: 最多同时排队的操作数，超过时submit阻塞，默认为workers的4倍
+        """
+        self.workers = max(1, workers)
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._results = queue.SimpleQueue()
+        self._inflight = 0
+
+    def submit(self, context, fn, *args, **kwargs):
+        """提交一个写入操作，返回Future；队列已满时阻塞到有操作完成"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notion-write")
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._inflight += 1
+        future.add_done_callback(lambda f: self._finish(context, f))
+        return future
+
+    def _finish(self, context, future):
+        error = future.exception()
+        if error is None:
+            self._results.put(WriteResult(context, True, future.result(), None))
+        else:
+            self._results.put(WriteResult(context, False, None, error))
+        self._slots.release()
+
+    def poll(self):
+        """不阻塞地返回已完成操作的WriteResult"""
+        while self._inflight:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._inflight -= 1
+            yield result
+
+    def drain(self):
+        """等待已提交的操作全部完成，按完成顺序逐个返回WriteResult"""
+        while self._inflight:
+            result = self._results.get()
+            self._inflight -= 1
+            yield result
+
+    def close(self):
+        """关闭线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -32,7 +32,7 @@ setup(
     install_requires=requirements,
     entry_points={
         "console_scripts": [
-            "douban2notion=douban2notion.douban:main",
+            "douban2notion=douban2notion.cli:main",
         ],
     },
 )
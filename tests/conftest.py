@@ -0,0 +1,100 @@
+import copy
+import json
+import os
+
+# 配置在导入时读取，需在导入douban2notion之前设置
+os.environ.setdefault("NOTION_TOKEN", "test")
+os.environ.setdefault("AUTH_TOKEN", "test")
+os.environ["DOUBAN_DELAY"] = "0"
+os.environ["DOUBAN_HOST_RATE"] = "0"
+os.environ["NOTION_RATE"] = "0"
+os.environ["RETRY_BASE_DELAY"] = "0.01"
+
+import pytest  # noqa: E402
+
+from benchmarks.fake_servers import FakeDoubanServer, FakeNotionServer  # noqa: E402
+from douban2notion import douban, transport  # noqa: E402
+from douban2notion.mapper import get_mapper  # noqa: E402
+from douban2notion.notion_helper import NotionHelper  # noqa: E402
+from douban2notion.state import SyncState  # noqa: E402
+from douban2notion.sync import sync_media  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+DOUBAN_USER = "tester"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def douban_server(monkeypatch):
+    server = FakeDoubanServer(load_fixture("douban_interests.json"))
+    with server:
+        monkeypatch.setattr(douban, "DOUBAN_API_URL", server.url)
+        yield server
+
+
+@pytest.fixture
+def notion_server(monkeypatch):
+    server = FakeNotionServer()
+    for database in load_fixture("notion_databases.json").values():
+        server.databases[database["id"]] = copy.deepcopy(database)
+    with server:
+        monkeypatch.setattr(transport, "NOTION_BASE_URL", server.url)
+        yield server
+    transport.close_transports()
+
+
+class Syncer:
+    def __init__(self, douban_server, notion_server, state_file):
+        """
+        用模拟服务器运行同步，并统计请求数
+
+        Args:
+            douban_server: FakeDoubanServer
+            notion_server: FakeNotionServer
+            state_file: 本地同步状态文件路径
+        """
+        self.douban_server = douban_server
+        self.notion_server = notion_server
+        self.state_file = state_file
+        databases = load_fixture("notion_databases.json")
+        self.database_ids = {type_: database["id"] for type_, database in databases.items()}
+
+    def run(self, full=False, reconcile=False, refresh_edited=False, use_state=True, **options):
+        """同步电影和书籍，返回本次的请求数 {"douban": {...}, "notion": {...}}
+
+        options为sync_media的其他参数（如orphans）。
+        """
+        self.douban_server.reset_counts()
+        self.notion_server.reset_counts()
+        notion_helper = NotionHelper(self.database_ids["movie"], self.database_ids["book"], workers=2, rate=0)
+        state = SyncState(self.state_file) if use_state else None
+        try:
+            for type_ in ("movie", "book"):
+                subjects = douban.iter_type_subjects(DOUBAN_USER, type_, state, full, delay=0)
+                sync_media(get_mapper(type_), notion_helper, subjects, state, reconcile, refresh_edited, **options)
+                if state is not None:
+                    state.save()
+        finally:
+            notion_helper.close()
+            if state is not None:
+                state.close()
+        return {
+            "douban": self.douban_server.get_counts(),
+            "notion": self.notion_server.get_counts(status=200),
+        }
+
+    def find_page(self, type_, douban_link):
+        """按豆瓣链接找到模拟Notion中的页面"""
+        for page in self.notion_server.get_database_pages(self.database_ids[type_]):
+            if page["properties"].get("豆瓣链接") == douban_link:
+                return page
+        return None
+
+
+@pytest.fixture
+def syncer(douban_server, notion_server, tmp_path):
+    return Syncer(douban_server, notion_server, str(tmp_path / "state.db"))
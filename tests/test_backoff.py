@@ -0,0 +1,81 @@
+"""失败重试：Retry-After有上限，熔断期满后只放行一个试探请求"""
+import threading
+import time
+
+import pytest
+
+from douban2notion import backoff
+from douban2notion.backoff import CircuitBreaker, CircuitOpenError, HTTPStatusError, call_with_retry
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(backoff, "RETRY_MAX_DELAY", 0.05)
+    calls = []
+
+    def rate_limited():
+        calls.append(time.perf_counter())
+        if len(calls) == 1:
+            raise HTTPStatusError(429, headers={"Retry-After": "3600"})
+        return "ok"
+
+    assert call_with_retry(rate_limited) == "ok"
+    assert calls[1] - calls[0] < 1
+
+
+def test_half_open_allows_one_probe():
+    breaker = CircuitBreaker("example.com", threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    time.sleep(0.06)
+
+    # 熔断期满后并发的请求中只有一个被放行
+    allowed = []
+
+    def request():
+        try:
+            breaker.before_request()
+            allowed.append(True)
+        except CircuitOpenError:
+            pass
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(allowed) == 1
+
+    # 试探失败时重新熔断，成功时恢复
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_success()
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_rate_limit_does_not_open_breaker(monkeypatch):
+    monkeypatch.setattr(backoff, "RETRY_MAX_DELAY", 0)
+
+    def rate_limited():
+        raise HTTPStatusError(429, headers={"Retry-After": "1"})
+
+    def server_error():
+        raise HTTPStatusError(503)
+
+    # 主机正常返回429（如某个令牌被限流），不会让同一主机的其他调用方熔断
+    host = "limited.example.com"
+    with pytest.raises(HTTPStatusError):
+        call_with_retry(rate_limited, host=host, attempts=backoff.BREAKER_THRESHOLD * 2)
+    backoff.get_breaker(host).before_request()
+
+    # 5xx仍计入熔断
+    host = "failing.example.com"
+    with pytest.raises(HTTPStatusError):
+        call_with_retry(server_error, host=host, attempts=backoff.BREAKER_THRESHOLD)
+    with pytest.raises(CircuitOpenError):
+        backoff.get_breaker(host).before_request()
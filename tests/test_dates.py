@@ -0,0 +1,27 @@
+"""日期转换：标准库实现与pendulum换算到上海时区的结果一致"""
+import pendulum
+import pytest
+
+from douban2notion.utils import normalize_property, timestamp_to_date_key, to_date_key, tz
+
+
+@pytest.mark.parametrize("value", [
+    "2024-03-20 23:59:59",
+    "2024-03-20T00:00",
+    "2024-03-20T16:30:00.000Z",
+    "2024-03-20T15:59:59Z",
+    "2024-12-31T20:00:00.000-05:00",
+    "2024-02-28T23:30:00+0930",
+    "2023-12-31T16:00:00.000+00:00",
+])
+def test_to_date_key_matches_pendulum(value):
+    assert to_date_key(value) == pendulum.parse(value, tz=tz).in_timezone(tz).format("YYYY-MM-DD")
+
+
+def test_date_keys():
+    assert to_date_key("2024-03-20") == "2024-03-20"
+    assert to_date_key("") is None and to_date_key(None) is None
+    assert to_date_key("2024年3月20日") is None
+    assert timestamp_to_date_key(1710950400) == pendulum.from_timestamp(1710950400, tz=tz).format("YYYY-MM-DD")
+    # Notion返回的带时间的日期按上海时区比较
+    assert normalize_property({"type": "date", "date": {"start": "2024-03-20T17:00:00.000Z"}}) == "2024-03-21"
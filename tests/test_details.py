@@ -0,0 +1,85 @@
+"""条目详情：按条目ID缓存，只为新条目和缓存过期的条目请求详情"""
+import functools
+
+from douban2notion import douban
+from douban2notion.details import DetailCache, DetailEnricher
+from douban2notion.mapper import get_mapper
+from douban2notion.notion_helper import NotionHelper
+from douban2notion.state import SyncState
+from douban2notion.sync import sync_media
+
+from conftest import DOUBAN_USER, load_fixture
+
+DETAILS = {
+    "35267208": {"durations": ["173分钟"], "countries": ["中国大陆"], "intro": "太阳即将毁灭。", "rating": {"value": 8.3}},
+    "26794435": {"durations": ["30分钟"], "countries": ["中国大陆"]},
+    "1292052": {"durations": ["142分钟"], "countries": ["美国"], "imdb": "tt0111161"},
+    "1291546": {"durations": ["171分钟"], "countries": ["中国大陆", "中国香港"]},
+}
+
+
+def test_cache_ttl_and_lru(tmp_path):
+    cache = DetailCache(str(tmp_path / "details.db"), max_entries=2)
+    cache.put("movie:1", {"intro": "a"})
+    cache.put("movie:2", {"intro": "b"})
+    assert cache.get("movie:1") == ({"intro": "a"}, True)
+    cache.put("movie:3", {"intro": "c"})
+    # movie:2最久未使用，被淘汰
+    assert cache.get("movie:2") == (None, False)
+    cache.close()
+
+    expired = DetailCache(str(tmp_path / "details.db"), ttl_days=0)
+    assert expired.get("movie:3") == ({"intro": "c"}, False)
+    expired.close()
+
+
+def test_details_fetched_once_per_subject(douban_server, notion_server, tmp_path):
+    douban_server.details.update(DETAILS)
+    databases = load_fixture("notion_databases.json")
+    movie_db = notion_server.databases[databases["movie"]["id"]]["properties"]
+    movie_db["片长"] = {"id": "len", "name": "片长", "type": "number", "number": {}}
+    movie_db["国家/地区"] = {"id": "ctry", "name": "国家/地区", "type": "multi_select", "multi_select": {}}
+    movie_db["IMDb"] = {"id": "imdb", "name": "IMDb", "type": "rich_text", "rich_text": {}}
+
+    cache = DetailCache(str(tmp_path / "details.db"))
+    enricher = DetailEnricher(functools.partial(douban.fetch_subject_detail, delay=0), cache)
+
+    def run(full=False):
+        douban_server.reset_counts()
+        notion_server.reset_counts()
+        notion_helper = NotionHelper(databases["movie"]["id"], databases["book"]["id"], workers=2, rate=0)
+        state = SyncState(str(tmp_path / "state.db"))
+        try:
+            for type_ in ("movie", "book"):
+                subjects = douban.iter_type_subjects(DOUBAN_USER, type_, state, full, delay=0)
+                sync_media(get_mapper(type_), notion_helper, subjects, state, enricher=enricher)
+                state.save()
+        finally:
+            notion_helper.close()
+            state.close()
+        return douban_server.get_counts(), notion_server.get_counts(status=200)
+
+    douban_counts, notion_counts = run()
+    # 书籍数据库没有详情属性，不请求书籍详情
+    assert douban_counts["subject"] == 4
+    assert notion_counts["pages.create"] == 7
+    pages = {
+        page["properties"]["豆瓣链接"]: page["properties"]
+        for page in notion_server.get_database_pages(databases["movie"]["id"])
+    }
+    shawshank = pages["https://movie.douban.com/subject/1292052/"]
+    assert shawshank["片长"] == 142
+    assert shawshank["国家/地区"] == [{"name": "美国"}]
+    assert shawshank["IMDb"][0]["text"]["content"] == "tt0111161"
+
+    # 缓存未过期时全量扫描不再请求详情，也没有写入
+    douban_counts, notion_counts = run(full=True)
+    assert "subject" not in douban_counts
+    assert "pages.update" not in notion_counts and "pages.create" not in notion_counts
+
+    # 缓存过期后重新获取，详情不变时仍不写入
+    cache.ttl = 0
+    douban_counts, notion_counts = run(full=True)
+    assert douban_counts["subject"] == 4
+    assert "pages.update" not in notion_counts
+    enricher.close()
@@ -0,0 +1,65 @@
+"""并发获取：各数据流分别遵守礼貌间隔，总耗时取决于页数最多的流"""
+import time
+
+from benchmarks.fake_servers import FakeDoubanServer, make_collection
+from douban2notion import douban
+from douban2notion.ratelimit import get_host_throttle
+
+from conftest import DOUBAN_USER
+
+DELAY = 0.1
+
+
+def test_streams_fetch_concurrently(monkeypatch):
+    # 每个状态200条，即每个流4页；电影和书籍共6个流、24页
+    collections = {"movie": make_collection("movie", 600), "book": make_collection("book", 600)}
+    streams = [(type_, status) for type_, collection in collections.items() for status in collection]
+    with FakeDoubanServer(collections) as server:
+        monkeypatch.setattr(douban, "DOUBAN_API_URL", server.url)
+        start = time.perf_counter()
+        results = douban.fetch_all_subjects(DOUBAN_USER, streams, concurrency=len(streams), delay=DELAY)
+        elapsed = time.perf_counter() - start
+
+    assert all(len(results[stream]) == 200 for stream in streams)
+    # 单个流的4页至少需要3个间隔；所有流共用一个间隔时需要23个
+    assert 3 * DELAY <= elapsed < 10 * DELAY
+
+
+def test_host_rate_is_shared(monkeypatch):
+    # 各流没有间隔时仍受整个主机的限速：6个流各2页，共12个请求
+    monkeypatch.setattr(douban, "DOUBAN_HOST_RATE", 20)
+    collections = {"movie": make_collection("movie", 300), "book": make_collection("book", 300)}
+    streams = [(type_, status) for type_, collection in collections.items() for status in collection]
+    with FakeDoubanServer(collections) as server:
+        monkeypatch.setattr(douban, "DOUBAN_API_URL", server.url)
+        start = time.perf_counter()
+        douban.fetch_all_subjects(DOUBAN_USER, streams, concurrency=len(streams), delay=0)
+        elapsed = time.perf_counter() - start
+
+    assert server.get_counts()["interests"] == 12
+    assert elapsed >= 11 / 20 * 0.9
+
+
+def test_full_fetch_follows_consumer(monkeypatch):
+    # 每个状态3000条，即每个流60页；消费者只取一条后停下
+    collections = {"movie": make_collection("movie", 9000)}
+    with FakeDoubanServer(collections) as server:
+        monkeypatch.setattr(douban, "DOUBAN_API_URL", server.url)
+        stream = douban.open_subject_stream(DOUBAN_USER, "movie", full=True, concurrency=4, delay=0, maxsize=200)
+        try:
+            next(iter(stream))
+            time.sleep(0.5)
+            fetched = server.get_counts()["interests"]
+        finally:
+            stream.close()
+
+    # 每个流最多同时获取concurrency页，加上后台队列中的200条（4页）和等待放入队列的一页
+    assert fetched <= 3 * (4 + 1) + 4 + 1
+
+
+def test_throttle_per_delay():
+    # 同一数据流以不同的delay调用时不会沿用第一次的限速器
+    first = get_host_throttle("example.com", 0.5, "stream")
+    assert get_host_throttle("example.com", 0.5, "stream") is first
+    assert get_host_throttle("example.com", 0.1, "stream").rate == 10
+    assert get_host_throttle("example.com", 0.5, "other") is not first
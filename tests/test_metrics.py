@@ -0,0 +1,75 @@
+"""运行指标与模拟服务器记录的请求数一致"""
+import requests
+
+from douban2notion.backoff import call_with_retry
+from douban2notion.metrics import LatencyStats, Metrics, get_latency_summary, metrics
+
+
+def test_request_metrics_match_server_counts(syncer):
+    metrics.reset()
+    counts = syncer.run()
+
+    summary = metrics.summary()
+    requests = {
+        endpoint: statuses.get("200", 0)
+        for endpoint, statuses in summary["requests"].items()
+    }
+    assert requests == {
+        "douban.interests": counts["douban"]["interests"],
+        **{f"notion.{endpoint}": count for endpoint, count in counts["notion"].items()},
+    }
+    for type_ in ("movie", "book"):
+        for phase in ("schema", "load_index", "diff", "douban_wait", "write_submit", "write_drain"):
+            assert f"{type_}.{phase}" in summary["phases"]
+    assert summary["latency"]["notion.pages.create"]["count"] == counts["notion"]["pages.create"]
+
+
+def test_prometheus_textfile():
+    registry = Metrics()
+    registry.record_request("notion.pages.create", 200, 0.2)
+    registry.record_request("notion.pages.create", 429, 0.01)
+    registry.record_retry("api.notion.com", 429)
+    registry.add_time("movie.diff", 1.5)
+
+    text = registry.format_prometheus()
+    assert 'douban2notion_requests_total{endpoint="notion.pages.create",status="429"} 1' in text
+    assert 'douban2notion_retries_total{host="api.notion.com",reason="429"} 1' in text
+    assert 'douban2notion_request_duration_seconds_bucket{endpoint="notion.pages.create",le="0.25"} 2' in text
+    assert 'douban2notion_request_duration_seconds_count{endpoint="notion.pages.create"} 2' in text
+    assert 'douban2notion_phase_seconds{phase="movie.diff"} 1.500000' in text
+
+
+def test_latency_percentiles():
+    summary = get_latency_summary([i / 100 for i in range(1, 101)])
+    assert summary == {"count": 100, "p50": 0.5, "p90": 0.9, "p99": 0.99, "max": 1.0}
+
+
+def test_latency_samples_are_bounded():
+    stats = LatencyStats(max_samples=10)
+    for i in range(1, 1001):
+        stats.add(i / 1000)
+    # 次数、总和、最大值和分桶计数是精确的，只保留有限的样本
+    assert len(stats.samples) == 10
+    assert stats.count == 1000 and stats.summary()["max"] == 1.0
+    assert round(stats.sum, 3) == 500.5
+    assert sum(stats.buckets) == 1000 and stats.buckets[0] == 50
+
+
+def test_request_without_response_is_recorded(monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr("douban2notion.backoff.RETRY_BASE_DELAY", 0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            request = requests.Request("POST", "https://api.notion.com/v1/pages").prepare()
+            raise requests.ConnectionError("connection reset", request=request)
+        if len(calls) == 2:
+            raise requests.Timeout("read timed out")
+        return "ok"
+
+    assert call_with_retry(flaky, host="api.notion.com") == "ok"
+    requests_total = metrics.summary()["requests"]
+    assert requests_total["notion.pages.create"] == {"error": 1}
+    assert requests_total["api.notion.com"] == {"error": 1}
@@ -0,0 +1,90 @@
+"""多用户模式：共享连接和限速器，单个用户失败不影响其他用户"""
+import copy
+import json
+
+import pytest
+
+from douban2notion import douban
+from douban2notion.notion_helper import NotionHelper
+from douban2notion.tenants import load_tenants
+from douban2notion.transport import close_transports
+
+from conftest import DOUBAN_USER, load_fixture
+
+
+def add_tenant_databases(notion_server, suffix):
+    """为一个用户复制一对数据库，返回 (电影数据库ID, 书籍数据库ID)"""
+    ids = []
+    for type_, database in load_fixture("notion_databases.json").items():
+        database = copy.deepcopy(database)
+        database["id"] = database["id"][:-2] + suffix
+        notion_server.databases[database["id"]] = database
+        ids.append(database["id"])
+    return ids
+
+
+def test_tenants_share_limiter_per_token():
+    first = NotionHelper(None, None, workers=1, token="token-a")
+    second = NotionHelper(None, None, workers=1, token="token-a")
+    other = NotionHelper(None, None, workers=1, token="token-b")
+    try:
+        assert first.limiter is second.limiter
+        assert first.limiter is not other.limiter
+    finally:
+        # 共享连接池按首次创建时的大小，不能留给后面的测试
+        close_transports()
+
+
+def test_failing_tenant_is_isolated(douban_server, notion_server, tmp_path, monkeypatch):
+    monkeypatch.setenv("TEAM_TOKEN", "test")
+    alice_movie, alice_book = add_tenant_databases(notion_server, "a1")
+    bob_movie, bob_book = add_tenant_databases(notion_server, "b2")
+    tenants = [
+        {"name": "alice", "douban_user": DOUBAN_USER, "movie_db": alice_movie, "book_db": alice_book, "token_env": "TEAM_TOKEN"},
+        # 书籍数据库不存在，只有bob失败
+        {"name": "bob", "douban_user": DOUBAN_USER, "movie_db": bob_movie, "book_db": "0" * 32, "token_env": "TEAM_TOKEN"},
+        {"name": "carol", "douban_user": DOUBAN_USER, "movie_db": bob_movie[:-2] + "c3", "book_db": bob_book, "type": "book"},
+    ]
+    config = tmp_path / "tenants.json"
+    config.write_text(json.dumps({"tenants": tenants}), encoding="utf-8")
+
+    argv = [
+        "multi", "--config", str(config), "--state-dir", str(tmp_path / "state"),
+        "--douban-delay", "0", "--parallel", "2", "--metrics-json", str(tmp_path / "metrics.json"),
+    ]
+    with pytest.raises(SystemExit) as exit_info:
+        douban.main(argv)
+    assert exit_info.value.code == 1
+
+    def count_pages(database_id):
+        return len(notion_server.get_database_pages(database_id))
+
+    assert (count_pages(alice_movie), count_pages(alice_book)) == (4, 3)
+    # bob的电影仍然同步成功
+    assert count_pages(bob_movie) == 4
+    assert count_pages(bob_book) == 3
+    assert sorted(path.name for path in (tmp_path / "state").iterdir()) == ["alice.db", "bob.db", "carol.db"]
+
+
+def test_tenant_with_one_database(douban_server, notion_server, tmp_path):
+    movie_db, book_db = add_tenant_databases(notion_server, "d4")
+    config = tmp_path / "tenants.json"
+    # 只有电影数据库的用户跳过书籍，只有书籍数据库的用户跳过电影
+    config.write_text(json.dumps([
+        {"name": "dave", "douban_user": DOUBAN_USER, "movie_db": movie_db, "token": "test"},
+        {"name": "erin", "douban_user": DOUBAN_USER, "book_db": book_db, "token": "test", "type": "both"},
+    ]), encoding="utf-8")
+
+    douban.main([
+        "multi", "--config", str(config), "--state-dir", str(tmp_path / "state"),
+        "--douban-delay", "0", "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    assert len(notion_server.get_database_pages(movie_db)) == 4
+    assert len(notion_server.get_database_pages(book_db)) == 3
+
+    config.write_text(json.dumps([{"douban_user": DOUBAN_USER, "movie_db": movie_db, "type": "book"}]), encoding="utf-8")
+    with pytest.raises(ValueError, match="book_db"):
+        load_tenants(str(config))
+    config.write_text(json.dumps([{"douban_user": DOUBAN_USER}]), encoding="utf-8")
+    with pytest.raises(ValueError, match="movie_db 或 book_db"):
+        load_tenants(str(config))
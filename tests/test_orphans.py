@@ -0,0 +1,69 @@
+"""清理豆瓣中已取消标记的页面：超过安全阈值时不做任何修改"""
+import copy
+
+import pytest
+
+from douban2notion.state import SyncState
+
+REMOVED = "https://movie.douban.com/subject/1291546/"
+
+
+def remove_interest(douban_server, type_, url):
+    for interests in douban_server.collections[type_].values():
+        interests[:] = [interest for interest in interests if interest["subject"]["url"] != url]
+
+
+def test_archive_orphans(syncer, douban_server, notion_server):
+    syncer.run()
+    remove_interest(douban_server, "movie", REMOVED)
+
+    counts = syncer.run(full=True, orphans="archive", orphan_threshold=30)
+    assert counts["notion"] == {"pages.update": 1}
+    assert syncer.find_page("movie", REMOVED) is None
+    assert len(notion_server.get_database_pages(syncer.database_ids["movie"])) == 3
+    state = SyncState(syncer.state_file)
+    assert REMOVED not in state.get_pages(syncer.database_ids["movie"])
+    state.close()
+
+    # 已归档的页面不再重复处理
+    counts = syncer.run(full=True, orphans="archive", orphan_threshold=30)
+    assert counts["notion"] == {}
+
+
+def test_orphan_threshold_aborts(syncer, douban_server, notion_server):
+    syncer.run()
+    remove_interest(douban_server, "movie", REMOVED)
+    remove_interest(douban_server, "movie", "https://movie.douban.com/subject/1292052/")
+
+    with pytest.raises(Exception, match="超过安全阈值"):
+        syncer.run(full=True, orphans="archive", orphan_threshold=30)
+    assert "pages.update" not in notion_server.get_counts()
+    assert len(notion_server.get_database_pages(syncer.database_ids["movie"])) == 4
+
+
+def test_flag_orphans(syncer, douban_server, notion_server):
+    syncer.run()
+    collections = copy.deepcopy(douban_server.collections)
+    remove_interest(douban_server, "movie", REMOVED)
+    with pytest.raises(Exception, match="豆瓣已移除"):
+        syncer.run(full=True, orphans="flag", orphan_threshold=30)
+
+    for database_id in syncer.database_ids.values():
+        properties = notion_server.databases[database_id]["properties"]
+        properties["豆瓣已移除"] = {"id": "gone", "name": "豆瓣已移除", "type": "checkbox", "checkbox": {}}
+    syncer.run(full=True, orphans="flag", orphan_threshold=30)
+    assert syncer.find_page("movie", REMOVED)["properties"]["豆瓣已移除"] is True
+
+    # 已勾选的页面不再重复标记（包括全量查询Notion重建索引之后）
+    counts = syncer.run(full=True, orphans="flag", orphan_threshold=30)
+    assert counts["notion"] == {}
+    counts = syncer.run(full=True, reconcile=True, orphans="flag", orphan_threshold=30)
+    assert counts["notion"] == {"databases.retrieve": 2, "databases.query": 2}
+
+    # 在豆瓣重新标记后取消勾选
+    douban_server.collections = collections
+    counts = syncer.run(full=True, orphans="flag", orphan_threshold=30)
+    assert counts["notion"] == {"pages.update": 1}
+    assert syncer.find_page("movie", REMOVED)["properties"]["豆瓣已移除"] is False
+    counts = syncer.run(full=True, orphans="flag", orphan_threshold=30)
+    assert counts["notion"] == {}
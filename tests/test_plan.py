@@ -0,0 +1,95 @@
+"""先生成计划再写入：apply可重复执行，全部写入成功后才推进同步位置"""
+from douban2notion import douban
+from douban2notion.state import SyncState
+
+from conftest import DOUBAN_USER, load_fixture
+
+MOVIES = 4
+BOOKS = 3
+
+
+def run_plan(tmp_path):
+    databases = load_fixture("notion_databases.json")
+    douban.main([
+        "plan", "--movie-db", databases["movie"]["id"], "--book-db", databases["book"]["id"],
+        "--douban-user", DOUBAN_USER, "--state-file", str(tmp_path / "state.db"), "--douban-delay", "0",
+        "--no-details", "--out", str(tmp_path / "plan.json"), "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+
+
+def run_apply(tmp_path, notion_server):
+    notion_server.reset_counts()
+    douban.main([
+        "apply", str(tmp_path / "plan.json"), "--state-file", str(tmp_path / "state.db"),
+        "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    return notion_server.get_counts()
+
+
+def read_state(tmp_path, type_):
+    """某类型在本地状态中的页面数和各状态的同步位置"""
+    database_id = load_fixture("notion_databases.json")[type_]["id"]
+    state = SyncState(str(tmp_path / "state.db"))
+    try:
+        pages = len(state.get_pages(database_id))
+        watermarks = {status: state.get_watermark(type_, status) for status in ("mark", "doing", "done")}
+    finally:
+        state.close()
+    return pages, watermarks
+
+
+def latest_create_times(type_):
+    return {
+        status: max(interest["create_time"] for interest in interests)
+        for status, interests in load_fixture("douban_interests.json")[type_].items()
+    }
+
+
+def test_plan_then_apply(douban_server, notion_server, tmp_path):
+    run_plan(tmp_path)
+    # 生成计划不写入Notion，也不修改本地状态
+    assert "pages.create" not in notion_server.get_counts()
+    assert read_state(tmp_path, "movie") == (0, {"mark": None, "doing": None, "done": None})
+
+    assert run_apply(tmp_path, notion_server) == {"pages.create": MOVIES + BOOKS}
+    assert read_state(tmp_path, "movie") == (MOVIES, latest_create_times("movie"))
+    assert read_state(tmp_path, "book") == (BOOKS, latest_create_times("book"))
+
+    # 同一份计划重复执行不会重复创建
+    assert run_apply(tmp_path, notion_server) == {}
+
+    # 之后的同步没有需要写入的页面
+    databases = load_fixture("notion_databases.json")
+    notion_server.reset_counts()
+    douban.main([
+        "--movie-db", databases["movie"]["id"], "--book-db", databases["book"]["id"],
+        "--douban-user", DOUBAN_USER, "--state-file", str(tmp_path / "state.db"), "--douban-delay", "0",
+        "--no-details", "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    counts = notion_server.get_counts()
+    assert "pages.create" not in counts and "pages.update" not in counts
+
+
+def test_failed_write_keeps_watermarks(douban_server, notion_server, tmp_path, monkeypatch):
+    run_plan(tmp_path)
+    book_id = load_fixture("notion_databases.json")["book"]["id"]
+    create_page = notion_server.create_page
+    failed = []
+
+    def fail_first_book(query, body):
+        if body.get("parent", {}).get("database_id") == book_id and not failed:
+            failed.append(body)
+            return 400, {"object": "error", "status": 400, "code": "validation_error", "message": "写入失败"}
+        return create_page(query, body)
+
+    monkeypatch.setattr(notion_server, "create_page", fail_first_book)
+    counts = run_apply(tmp_path, notion_server)
+    assert counts == {"pages.create": MOVIES + BOOKS}
+    assert notion_server.get_counts(status=400) == {"pages.create": 1}
+    # 成功的写入记入本地索引，但有写入失败的类型不推进同步位置
+    assert read_state(tmp_path, "movie") == (MOVIES, latest_create_times("movie"))
+    assert read_state(tmp_path, "book") == (BOOKS - 1, {"mark": None, "doing": None, "done": None})
+
+    # 重新执行只补上失败的一条，之后才推进同步位置
+    assert run_apply(tmp_path, notion_server) == {"pages.create": 1}
+    assert read_state(tmp_path, "book") == (BOOKS, latest_create_times("book"))
@@ -0,0 +1,207 @@
+"""同步的请求预算：豆瓣数据不变时重复同步不能写入Notion，且只发送必要的读请求"""
+import copy
+
+import pytest
+
+from benchmarks.fake_servers import FakeNotionServer
+from douban2notion import douban, transport
+
+from conftest import DOUBAN_USER
+
+# 首次同步（以及reconcile时）获取两个数据库的结构，之后使用本地缓存的结构
+RETRIEVE = {"databases.retrieve": 2}
+# 六个(类型, 状态)的第一页
+DOUBAN = {"interests": 6}
+MOVIES = 4
+BOOKS = 3
+
+
+def update_properties(notion_server):
+    return [properties for endpoint, _, properties in notion_server.writes if endpoint == "pages.update"]
+
+
+def test_first_sync_creates_every_mark(syncer):
+    counts = syncer.run()
+    assert counts["douban"] == DOUBAN
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2, "pages.create": MOVIES + BOOKS}
+
+
+def test_noop_resync(syncer):
+    syncer.run()
+    counts = syncer.run()
+    assert counts["douban"] == DOUBAN
+    assert counts["notion"] == {}
+
+
+def test_noop_full_rescan(syncer):
+    syncer.run()
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {}
+
+
+def test_noop_resync_without_local_state(syncer):
+    syncer.run()
+    counts = syncer.run(use_state=False)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+
+
+def test_noop_reconcile(syncer):
+    syncer.run()
+    counts = syncer.run(reconcile=True)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+
+
+def test_one_new_mark(syncer, douban_server):
+    syncer.run()
+    interest = copy.deepcopy(douban_server.collections["movie"]["done"][0])
+    interest["create_time"] = "2024-03-20 20:00:00"
+    interest["subject"]["url"] = "https://movie.douban.com/subject/1295644/"
+    interest["subject"]["title"] = "这个杀手不太冷"
+    douban_server.add_interest("movie", interest)
+
+    counts = syncer.run()
+    assert counts["douban"] == DOUBAN
+    # 本地索引未命中的链接按链接查询一次，确认Notion中没有再创建
+    assert counts["notion"] == {"databases.query": 1, "pages.create": 1}
+
+
+def test_one_status_change(syncer, douban_server):
+    syncer.run()
+    url = "https://movie.douban.com/subject/35267208/"
+    douban_server.move_interest("movie", url, "done", "2024-03-21 22:10:00")
+
+    counts = syncer.run()
+    assert counts["notion"] == {"pages.update": 1}
+    assert update_properties(syncer.notion_server) == [["sync_hash", "状态", "看完日期"]]
+    page = syncer.find_page("movie", url)
+    assert page["properties"]["状态"] == {"name": "已看完"}
+
+
+def test_one_rating_change(syncer, douban_server):
+    syncer.run()
+    douban_server.find_interest("book", "https://book.douban.com/subject/4913064/")["rating"] = {"value": 2, "max": 5}
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {"pages.update": 1}
+    assert update_properties(syncer.notion_server) == [["sync_hash", "豆瓣评分"]]
+
+
+def test_rating_change_after_reconcile(syncer, douban_server):
+    # 全量查询Notion重建的本地索引只保留各属性的指纹，之后仍只写入变化的属性
+    syncer.run()
+    syncer.run(reconcile=True)
+    douban_server.find_interest("book", "https://book.douban.com/subject/4913064/")["rating"] = {"value": 2, "max": 5}
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {"pages.update": 1}
+    assert update_properties(syncer.notion_server) == [["sync_hash", "豆瓣评分"]]
+
+
+def test_cover_change(syncer, douban_server):
+    syncer.run()
+    interest = douban_server.find_interest("movie", "https://movie.douban.com/subject/1292052/")
+    interest["subject"]["pic"]["normal"] = "https://img3.doubanio.com/view/photo/s_ratio_poster/public/p2910000000.jpg"
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {"pages.update": 1}
+    assert update_properties(syncer.notion_server) == [["sync_hash", "封面"]]
+
+
+def test_webp_cover_rewrite_is_not_a_change(syncer, douban_server):
+    syncer.run()
+    for type_ in ("movie", "book"):
+        for interests in douban_server.collections[type_].values():
+            for interest in interests:
+                pic = interest["subject"]["pic"]
+                for size in pic:
+                    pic[size] = pic[size].rsplit(".", 1)[0] + ".webp"
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {}
+    counts = syncer.run(full=True, reconcile=True)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+
+
+def test_multi_segment_rich_text_round_trip(syncer, notion_server):
+    # Notion返回的文本（包括sync_hash）被拆成多段，超长简介已按长度限制截断
+    notion_server.rich_text_segment = 7
+    syncer.run()
+    counts = syncer.run(full=True, reconcile=True)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+    counts = syncer.run(full=True, use_state=False)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+
+
+def test_round_trip_without_sync_hash_property(syncer, notion_server):
+    # 没有sync_hash属性时，按Notion返回的各属性值逐个比较
+    for database in notion_server.databases.values():
+        del database["properties"]["sync_hash"]
+    notion_server.rich_text_segment = 7
+    syncer.run()
+    counts = syncer.run(full=True, reconcile=True)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2}
+    assert notion_server.writes == []
+
+
+def test_refresh_edited_restores_manual_edit(syncer, notion_server):
+    syncer.run()
+    page = syncer.find_page("book", "https://book.douban.com/subject/4913064/")
+    notion_server.edit_page(page["id"], "豆瓣评分", 1)
+
+    # 增量同步不会重新获取旧标记，需要与全量扫描一起使用
+    counts = syncer.run(full=True, refresh_edited=True)
+    # 每个数据库只查询一次上次同步后编辑过的页面
+    assert counts["notion"] == {"databases.query": 2, "pages.update": 1}
+    assert update_properties(notion_server) == [["sync_hash", "豆瓣评分"]]
+    assert notion_server.pages[page["id"]]["properties"]["豆瓣评分"] == 8
+
+
+def test_refresh_edited_implies_full_scan(syncer, notion_server, tmp_path):
+    syncer.run()
+    page = syncer.find_page("book", "https://book.douban.com/subject/4913064/")
+    notion_server.edit_page(page["id"], "豆瓣评分", 1)
+
+    # 命令行未指定--full时自动启用，编辑过的旧标记也会被重新核对
+    douban.main([
+        "--movie-db", syncer.database_ids["movie"], "--book-db", syncer.database_ids["book"],
+        "--douban-user", DOUBAN_USER, "--state-file", syncer.state_file, "--douban-delay", "0",
+        "--no-details", "--refresh-edited", "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    assert update_properties(notion_server) == [["sync_hash", "豆瓣评分"]]
+    assert notion_server.pages[page["id"]]["properties"]["豆瓣评分"] == 8
+
+
+def test_notion_rate_limit_is_retried(syncer, notion_server, monkeypatch):
+    # 换成每秒只允许4个请求的Notion，超出时返回429
+    limited = FakeNotionServer(rate_limit=4, retry_after=0.5)
+    limited.databases = copy.deepcopy(notion_server.databases)
+    with limited:
+        monkeypatch.setattr(transport, "NOTION_BASE_URL", limited.url)
+        syncer.notion_server = limited
+        counts = syncer.run()
+        transport.close_transports()
+    # 429按Retry-After重试，不会重复写入
+    assert limited.get_counts(status=429)
+    assert counts["notion"] == {**RETRIEVE, "databases.query": 2, "pages.create": MOVIES + BOOKS}
+
+
+@pytest.mark.parametrize("stale", ["deleted", "archived"])
+def test_stale_index_entry_is_recreated(syncer, douban_server, notion_server, stale):
+    syncer.run()
+    url = "https://book.douban.com/subject/4913064/"
+    page = syncer.find_page("book", url)
+    if stale == "deleted":
+        del notion_server.pages[page["id"]]
+    else:
+        page["archived"] = True
+    douban_server.find_interest("book", url)["rating"] = {"value": 2, "max": 5}
+
+    # 本地索引中的页面已不存在：更新失败后按链接查找，找不到时重新创建
+    counts = syncer.run(full=True)
+    failed = {"pages.update": 1} if stale == "deleted" else {}
+    assert notion_server.get_counts(status=404) == failed
+    assert counts["notion"] == {"databases.query": 1, "pages.create": 1}
+    assert syncer.find_page("book", url)["properties"]["豆瓣评分"] == 4
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {}
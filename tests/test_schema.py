@@ -0,0 +1,120 @@
+"""数据库结构：缓存到本地状态并在有效期内复用，可自动创建缺少的属性"""
+import json
+
+import pytest
+
+from douban2notion import douban, sync
+from douban2notion.mapper import get_mapper
+from douban2notion.notion_helper import NotionHelper
+from douban2notion.state import SyncState
+from douban2notion.sync import load_cached_schema, sync_media
+from douban2notion.utils import get_property_ids
+
+from conftest import DOUBAN_USER, load_fixture
+
+
+def sync_movies(notion_helper, state):
+    subjects = douban.iter_type_subjects(DOUBAN_USER, "movie", state, False, delay=0)
+    try:
+        return sync_media(get_mapper("movie"), notion_helper, subjects, state)
+    finally:
+        notion_helper.close()
+
+
+def test_create_missing_properties(douban_server, notion_server, tmp_path):
+    databases = load_fixture("notion_databases.json")
+    movie_id = databases["movie"]["id"]
+    for name in ("豆瓣链接", "标签", "sync_hash"):
+        del notion_server.databases[movie_id]["properties"][name]
+    state = SyncState(str(tmp_path / "state.db"))
+
+    notion_helper = NotionHelper(movie_id, databases["book"]["id"], workers=2, rate=0)
+    with pytest.raises(Exception, match="数据库缺少必需的属性"):
+        sync_movies(notion_helper, state)
+    assert "databases.update" not in notion_server.get_counts()
+
+    notion_server.reset_counts()
+    notion_helper = NotionHelper(movie_id, databases["book"]["id"], workers=2, rate=0, create_properties=True)
+    counts = sync_movies(notion_helper, state)
+    assert counts["create"] == 4
+    # 缺少的属性用一次请求创建，创建后不再重新获取数据库结构
+    assert notion_server.get_counts(status=200) == {
+        "databases.retrieve": 1, "databases.update": 1, "databases.query": 1, "pages.create": 4,
+    }
+    assert {"豆瓣链接", "标签", "sync_hash"} <= set(notion_server.databases[movie_id]["properties"])
+    assert notion_server.databases[movie_id]["properties"]["sync_hash"]["type"] == "rich_text"
+
+    cached = json.loads(state.get_meta(f"schema:{movie_id}"))
+    assert cached["last_edited_time"] == notion_server.databases[movie_id]["last_edited_time"]
+    assert cached["properties"]["豆瓣链接"]["type"] == "url"
+    state.close()
+
+
+def test_status_property_is_not_created(douban_server, notion_server, tmp_path):
+    databases = load_fixture("notion_databases.json")
+    movie_id = databases["movie"]["id"]
+    del notion_server.databases[movie_id]["properties"]["状态"]
+    notion_helper = NotionHelper(movie_id, databases["book"]["id"], workers=2, rate=0, create_properties=True)
+    with pytest.raises(Exception, match="请在Notion中手动添加: 状态"):
+        sync_movies(notion_helper, SyncState(None))
+    assert "databases.update" not in notion_server.get_counts()
+
+
+def test_cached_schema_writes_by_property_id(douban_server, notion_server, tmp_path):
+    databases = load_fixture("notion_databases.json")
+    movie_id = databases["movie"]["id"]
+    state = SyncState(str(tmp_path / "state.db"))
+    sync_movies(NotionHelper(movie_id, databases["book"]["id"], workers=2, rate=0), state)
+
+    # apply等不获取数据库结构的命令使用缓存的属性ID
+    notion_helper = NotionHelper(None, None, workers=1, rate=0)
+    assert load_cached_schema(notion_helper, movie_id, state)
+    compact = notion_helper.compact_properties(movie_id, {"导演/演讲人": 1, "未知属性": 2})
+    assert compact == {"%3BQ%5Cd": 1, "未知属性": 2}
+    assert notion_helper.compact_properties(databases["book"]["id"], {"作者": 1}) == {"作者": 1}
+    notion_helper.close()
+    state.close()
+
+
+def test_schema_cache_is_reused(syncer, monkeypatch):
+    syncer.run()
+    # 有效期内不再获取数据库结构
+    assert syncer.run()["notion"] == {}
+
+    # 按缓存验证失败时重新获取
+    movie_id = syncer.database_ids["movie"]
+    state = SyncState(syncer.state_file)
+    cached = json.loads(state.get_meta(f"schema:{movie_id}"))
+    del cached["properties"]["豆瓣链接"]
+    state.set_meta(f"schema:{movie_id}", json.dumps(cached))
+    state.close()
+    assert syncer.run()["notion"] == {"databases.retrieve": 1}
+
+    monkeypatch.setattr(sync, "NOTION_SCHEMA_TTL", 0)
+    assert syncer.run()["notion"] == {"databases.retrieve": 2}
+
+
+def test_stale_schema_cache_is_dropped(syncer, douban_server, notion_server):
+    syncer.run()
+    # 在Notion中删除并重新添加属性后属性ID改变，按缓存的ID写入失败
+    properties = notion_server.databases[syncer.database_ids["book"]]["properties"]
+    properties["豆瓣评分"] = {**properties["豆瓣评分"], "id": "rating2"}
+    url = "https://book.douban.com/subject/4913064/"
+    douban_server.find_interest("book", url)["rating"] = {"value": 2, "max": 5}
+    with pytest.raises(Exception, match="写入失败"):
+        syncer.run(full=True)
+    assert notion_server.get_counts(status=400) == {"pages.update": 1}
+
+    counts = syncer.run(full=True)
+    assert counts["notion"] == {"databases.retrieve": 1, "pages.update": 1}
+    assert syncer.find_page("book", url)["properties"]["豆瓣评分"] == 4
+
+
+def test_property_ids_skip_missing_properties():
+    database_properties = {"名称": {"id": "title", "type": "title"}, "豆瓣链接": {"id": "p1", "type": "url"}}
+    # 数据库中没有的属性不在查询结果中，跳过即可
+    assert get_property_ids(database_properties, ["名称", "标签", "豆瓣链接"]) == ["title", "p1"]
+    assert get_property_ids(database_properties, ["标签"]) is None
+    # 存在但没有ID的属性无法按ID请求，改为查询全部属性
+    database_properties["豆瓣链接"]["id"] = None
+    assert get_property_ids(database_properties, ["名称", "豆瓣链接"]) is None
@@ -0,0 +1,80 @@
+"""快照：全量保存豆瓣标记记录，之后从快照同步不再请求豆瓣"""
+import gzip
+import json
+
+from benchmarks.fake_servers import load_snapshot_collections
+from douban2notion import douban
+from douban2notion.snapshot import iter_snapshot, read_snapshot_header
+
+from conftest import DOUBAN_USER, load_fixture
+
+
+def save_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    douban.main([
+        "snapshot", "--douban-user", DOUBAN_USER, "--out", path, "--douban-delay", "0",
+        "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    return path
+
+
+def test_snapshot_round_trip(douban_server, tmp_path):
+    path = save_snapshot(tmp_path)
+    header = read_snapshot_header(path)
+    assert header["douban_user"] == DOUBAN_USER
+    assert header["counts"] == {
+        "movie": {"mark": 1, "doing": 1, "done": 2},
+        "book": {"mark": 1, "doing": 1, "done": 1},
+    }
+    # 文件头之后每行一条记录
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 1 + 7
+    assert len(list(iter_snapshot(path))) == 7
+    # 与增量获取一致，只产出比上次同步的create_time更新的记录
+    done = load_fixture("douban_interests.json")["book"]["done"][0]
+    books = list(iter_snapshot(path, "book", {("book", "done"): done["create_time"]}))
+    assert len(books) == 2 and done not in books
+    assert load_snapshot_collections(path) == load_fixture("douban_interests.json")
+
+
+def test_sync_from_snapshot(douban_server, notion_server, tmp_path):
+    path = save_snapshot(tmp_path)
+    databases = load_fixture("notion_databases.json")
+    args = [
+        "--movie-db", databases["movie"]["id"], "--book-db", databases["book"]["id"],
+        "--state-file", str(tmp_path / "state.db"), "--from-snapshot", path, "--no-details",
+        "--metrics-json", str(tmp_path / "metrics.json"),
+    ]
+
+    douban_server.reset_counts()
+    douban.main(args)
+    assert douban_server.get_counts() == {}
+    assert notion_server.get_counts(status=200)["pages.create"] == 7
+
+    # 增量模式下快照中的记录都不比上次同步更新，不再写入
+    notion_server.reset_counts()
+    douban.main(["plan", *args, "--out", str(tmp_path / "plan.json")])
+    with open(tmp_path / "plan.json", "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    assert plan["douban_user"] == DOUBAN_USER
+    assert [phase["summary"]["create"] + phase["summary"]["update"] for phase in plan["phases"]] == [0, 0]
+    assert douban_server.get_counts() == {}
+    assert "pages.create" not in notion_server.get_counts()
+
+
+def test_snapshot_user_mismatch(douban_server, notion_server, tmp_path, capsys):
+    path = save_snapshot(tmp_path)
+    databases = load_fixture("notion_databases.json")
+    args = [
+        "--movie-db", databases["movie"]["id"], "--book-db", databases["book"]["id"],
+        "--state-file", str(tmp_path / "state.db"), "--from-snapshot", path, "--no-details",
+        "--douban-user", "someone-else", "--metrics-json", str(tmp_path / "metrics.json"),
+    ]
+
+    # 快照属于另一个用户时不写入
+    douban.main(args)
+    assert f"快照属于豆瓣用户 {DOUBAN_USER}" in capsys.readouterr().out
+    assert "pages.create" not in notion_server.get_counts()
+
+    douban.main([*args, "--force"])
+    assert notion_server.get_counts(status=200)["pages.create"] == 7
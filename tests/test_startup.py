@@ -0,0 +1,30 @@
+"""启动开销：--help和参数错误不导入请求库、Notion客户端和pendulum"""
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.bench_startup import ROOT, SCENARIOS, get_heavy_imports, run_importtime
+
+# 只有对应的子命令或条目详情才用到的模块
+SUBCOMMAND_MODULES = (
+    "douban2notion.watch", "douban2notion.plan", "douban2notion.snapshot",
+    "douban2notion.tenants", "douban2notion.details", "douban2notion.health",
+)
+
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIOS))
+def test_cli_startup_skips_heavy_imports(scenario):
+    modules = {name for name, *_ in run_importtime(["-m", "douban2notion", *SCENARIOS[scenario]])}
+    assert "douban2notion.douban" in modules
+    assert get_heavy_imports(modules) == []
+    assert [name for name in SUBCOMMAND_MODULES if name in modules] == []
+
+
+def test_argument_error_exit_code():
+    completed = subprocess.run(
+        [sys.executable, "-m", "douban2notion", "sync", "--book-db", "x"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    assert completed.returncode == 2
+    assert "--movie-db" in completed.stderr
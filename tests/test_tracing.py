@@ -0,0 +1,33 @@
+"""跟踪：每个请求和同步阶段都记录为span，未开启时不记录"""
+import json
+
+from douban2notion import tracing
+
+
+def test_trace_spans_cover_requests_and_phases(syncer, tmp_path):
+    tracing.start_tracing()
+    try:
+        counts = syncer.run()
+    finally:
+        path = tmp_path / "trace.json"
+        tracing.stop_tracing(str(path))
+
+    events = json.loads(path.read_text(encoding="utf-8"))["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    names = [event["name"] for event in spans]
+    assert names.count("douban.fetch_page") == counts["douban"]["interests"]
+    assert names.count("notion.pages.create") == counts["notion"]["pages.create"]
+    assert names.count("notion.create_page") == counts["notion"]["pages.create"]
+    assert names.count("notion.query_page") == counts["notion"]["databases.query"]
+    for phase in ("movie.schema", "movie.load_index", "movie.douban_fetch", "book.write_drain"):
+        assert phase in names
+    assert all(event["dur"] >= 0 for event in spans)
+    thread_names = {event["args"]["name"] for event in events if event["name"] == "thread_name"}
+    assert any(name.startswith("notion-write") for name in thread_names)
+
+
+def test_tracing_disabled_records_nothing(syncer):
+    assert not tracing.is_tracing()
+    tracing.add_span("noop", 0, 1)
+    syncer.run()
+    assert tracing.stop_tracing() is None
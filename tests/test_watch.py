@@ -0,0 +1,96 @@
+"""常驻同步：索引常驻内存，空闲轮次不请求Notion，只写入新的变化"""
+import copy
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from douban2notion import douban
+from douban2notion.notion_helper import NotionHelper
+from douban2notion.state import SyncState
+from douban2notion.health import start_health_server
+from douban2notion.watch import AdaptiveInterval, Watcher
+
+from conftest import DOUBAN_USER, load_fixture
+
+
+def make_watcher(tmp_path):
+    databases = load_fixture("notion_databases.json")
+    notion_helper = NotionHelper(databases["movie"]["id"], databases["book"]["id"], workers=2, rate=0)
+
+    def fetch(type_, watermarks):
+        streams, _ = douban.get_type_streams(type_)
+        since_map = {(type_, status): create_time for status, create_time in watermarks.items()}
+        return douban._flatten_pages(douban.iter_subject_pages(DOUBAN_USER, streams, since_map, delay=0))
+
+    state = SyncState(str(tmp_path / "state.db"))
+    return Watcher(notion_helper, fetch, ["movie", "book"], state)
+
+
+def test_adaptive_interval():
+    interval = AdaptiveInterval(60, 600, 2)
+    assert [interval.next(False) for _ in range(5)] == [120, 240, 480, 600, 600]
+    assert interval.next(True) == 60
+    assert interval.next(False) == 120
+
+
+def test_idle_polls_skip_notion(douban_server, notion_server, tmp_path):
+    watcher = make_watcher(tmp_path)
+    try:
+        assert watcher.poll() == 7
+
+        notion_server.reset_counts()
+        douban_server.reset_counts()
+        assert watcher.poll() == 0
+        # 数据库结构和索引都不再请求，豆瓣每个状态只取第一页
+        assert notion_server.get_counts() == {}
+        assert douban_server.get_counts() == {"interests": 6}
+
+        interest = copy.deepcopy(douban_server.collections["movie"]["done"][0])
+        interest["create_time"] = "2024-03-20 20:00:00"
+        interest["subject"]["url"] = "https://movie.douban.com/subject/1295644/"
+        douban_server.add_interest("movie", interest)
+        notion_server.reset_counts()
+        assert watcher.poll() == 1
+        assert notion_server.get_counts() == {"pages.create": 1}
+        assert watcher.get_status()["types"]["movie"]["indexed"] == 5
+    finally:
+        watcher.notion_helper.close()
+        watcher.state.close()
+
+
+def test_health_endpoint(douban_server, notion_server, tmp_path):
+    watcher = make_watcher(tmp_path)
+    server = start_health_server(watcher, "127.0.0.1", 0)
+    host, port = server.server_address[:2]
+    url = f"http://{host}:{port}"
+    try:
+        watcher.run(AdaptiveInterval(0, 0), max_cycles=2)
+        with urllib.request.urlopen(url + "/healthz") as response:
+            status = json.loads(response.read())
+        assert status["healthy"] and status["cycles"] == 2 and status["last_changes"] == 0
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert b"douban2notion_requests_total" in response.read()
+
+        watcher.status["consecutive_failures"] = 3
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/healthz")
+        assert error.value.code == 503
+    finally:
+        server.shutdown()
+        server.server_close()
+        watcher.notion_helper.close()
+        watcher.state.close()
+
+
+def test_watch_command(douban_server, notion_server, tmp_path):
+    databases = load_fixture("notion_databases.json")
+    douban.main([
+        "watch", "--movie-db", databases["movie"]["id"], "--book-db", databases["book"]["id"],
+        "--douban-user", DOUBAN_USER, "--state-file", str(tmp_path / "state.db"), "--douban-delay", "0",
+        "--min-interval", "0", "--max-interval", "0", "--max-cycles", "2",
+        "--metrics-json", str(tmp_path / "metrics.json"),
+    ])
+    assert notion_server.get_counts(status=200)["pages.create"] == 7
+    assert SyncState(str(tmp_path / "state.db")).get_watermark("movie", "mark") == "2024-03-02 21:15:07"